@@ -0,0 +1,111 @@
+# II_Backfill.py
+import argparse
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from II_Constants import DEFAULT_EXCEL_PATH, DEFAULT_ACCOUNT, CATEGORY_MODE_FORMULA
+from II_Config import load_config
+from II_Ledger import open_ledger
+from II_Normalize import read_transactions_csv, normalize_transactions
+from II_Streaming import merge_downloads
+from II_TransactionsImport import append_transactions
+from II_Rebuild import rebuild_workbook
+from II_Watch import download_kind
+from II_WorkbookSession import WorkbookSession
+from II_Metrics import run_metrics, stage
+
+
+def backfill_paths(source):
+    """
+    The Transactions downloads to backfill, newest first: every Transactions*.csv in a
+    folder (Transactions (1).csv, Transactions_2024.csv, ...), or the files matching a glob.
+    """
+    if os.path.isdir(source):
+        paths = [entry.path for entry in os.scandir(source)
+                 if entry.is_file() and download_kind(entry.name) == 'transactions']
+    else:
+        paths = [path for path in glob.glob(source) if os.path.isfile(path)]
+    if not paths:
+        raise FileNotFoundError(f"No Transactions downloads found at: {source}")
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+
+def load_download(csv_path):
+    """Read and normalize one download (sorted by Date); runs in a worker."""
+    return normalize_transactions(read_transactions_csv(csv_path))
+
+
+def load_downloads(paths, workers=None, processes=False):
+    """
+    Read and normalize the downloads in parallel, in worker threads (the CSV parser
+    releases the GIL) or, with processes, worker processes. Returns their frames in
+    the order of paths.
+    """
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=workers) as pool:
+        return list(pool.map(load_download, paths))
+
+
+def backfill(source, excel_path, workers=None, processes=False, rebuild=False, ledger=None,
+             account=DEFAULT_ACCOUNT, category_mode=CATEGORY_MODE_FORMULA):
+    """
+    Import a folder or glob of Transactions downloads with overlapping date ranges, as
+    collected over a holiday or to rebuild a workbook: the files are parsed in
+    parallel, merged into one Date-ordered stream without the rows they share
+    (II_Streaming.merge_downloads), and the new rows appended with one workbook load
+    and one save (or one streaming pass with rebuild, see II_Rebuild), whatever the
+    number of files. Returns the number of rows appended.
+    """
+    paths = backfill_paths(source)
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+    print(f"Reading {len(paths)} Transactions downloads with {workers} worker {'processes' if processes else 'threads'}...")
+    with stage('backfill_read') as current:
+        frames = load_downloads(paths, workers, processes)
+        current.rows = sum(len(df) for df in frames)
+    for path, df in zip(paths, frames):
+        dates = df['Date'].dropna()
+        span = f"{dates.min():%d/%m/%Y} to {dates.max():%d/%m/%Y}" if len(dates) else "no dates"
+        print(f"  {os.path.basename(path)}: {len(df)} rows, {span}")
+
+    with stage('backfill_merge') as current:
+        df = merge_downloads(frames)
+        current.rows = len(df)
+    print(f"Merged {sum(len(frame) for frame in frames)} download rows into {len(df)} distinct transactions")
+
+    if rebuild:
+        return rebuild_workbook(excel_path, df, ledger=ledger, account=account, category_mode=category_mode)
+    with WorkbookSession(excel_path, ledger, account, category_mode) as session:
+        return append_transactions(session, df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a folder or glob of overlapping Transactions downloads at once")
+    parser.add_argument('source', help="Folder of Transactions*.csv downloads, or a glob such as 'Downloads/Transactions_*.csv'")
+    parser.add_argument('--excel', help="Workbook (default: excel_path in config.json)")
+    parser.add_argument('--workers', type=int, help="Parallel readers (default: one per file, up to the CPU count)")
+    parser.add_argument('--processes', action='store_true', help="Read in worker processes instead of threads")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Stream the workbook through instead of loading it (large workbooks)")
+    args = parser.parse_args()
+
+    config = load_config()
+    excel_path = args.excel or config.get("excel_path", DEFAULT_EXCEL_PATH)
+    ledger = open_ledger(config)
+    try:
+        with run_metrics('backfill', excel_path, profile=config.get("profile", False)):
+            appended = backfill(args.source, excel_path, args.workers, args.processes, args.rebuild, ledger,
+                                config.get("account", DEFAULT_ACCOUNT),
+                                config.get("category_mode", CATEGORY_MODE_FORMULA))
+        print(f"Backfill complete: {appended} new transactions")
+    except FileNotFoundError as e:
+        print(f"Error: {str(e)}")
+    except PermissionError:
+        print(f"Error: Permission denied when accessing {excel_path}. Ensure the file is not open in another application.")
+    except ValueError as ve:
+        print(f"Error: {ve}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
+    finally:
+        if ledger is not None:
+            ledger.close()
@@ -0,0 +1,377 @@
+# II_Benchmark.py
+import argparse
+import copy
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+import openpyxl
+import pandas as pd
+from openpyxl.styles import PatternFill
+from II_Constants import TRANSACTIONS_SHEET, TRANSACTIONS_MAX_COLUMN, TRANSACTIONS_FORMULA
+from II_Format import write_formulas, template_row_styles, apply_row_styles
+from II_Normalize import read_transactions_csv, normalize_transactions
+from II_InvestmentsImport import load_investments_csv, refresh_investments, clean_investments, sheet_columns
+from II_RollReport import roll_to_next_business_day
+from II_SyntheticData import make_benchmark_set, make_investments_csv
+from II_TransactionIndex import TransactionIndex
+from II_TransactionsImport import populate_formulas, copy_row_formatting
+from II_Watermark import last_data_row, last_formula_row, record_rows
+from II_WorkbookSession import WorkbookSession, frame_rows, write_rows
+
+SAMPLE_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_TRANSACTIONS_CSV = os.path.join(SAMPLE_DIR, 'Transactions.csv')
+SAMPLE_WORKBOOK = os.path.join(SAMPLE_DIR, 'II_20250929.xlsx')
+BENCHMARK_RESULTS = 'benchmark_results.jsonl'  # In the working directory, like ii_metrics.jsonl
+REGRESSION_THRESHOLD = 1.2  # Flag stages more than 20% slower than the previous run of the same size
+
+
+def legacy_normalize_transactions(df):
+    """Reference copy of the original row-wise cleaning from II_TransactionsImport.py."""
+    df.columns = df.columns.str.replace('\ufeff', '')
+    df = df.replace('n/a', '')
+    for col in ['Quantity', 'Price', 'Debit', 'Credit', 'Running Balance']:
+        if col in df.columns:
+            df[col] = df[col].replace('[£,]', '', regex=True).replace('', None).astype(float, errors='ignore')
+    df['Date'] = pd.to_datetime(df['Date'], dayfirst=True, errors='coerce')
+    df['Settlement Date'] = pd.to_datetime(df['Settlement Date'], dayfirst=True, errors='coerce')
+    df = df.sort_values(by='Date', ascending=True, na_position='last')
+    df['Quantity'] = df.apply(
+        lambda row: -float(row['Quantity']) if pd.notnull(row['Credit']) and row['Credit'] != ''
+        and not (str(row['Description']).startswith('Div') or str(row['Description']).startswith('GROSS INTEREST'))
+        else float(row['Quantity']) if pd.notnull(row['Quantity']) else None,
+        axis=1
+    )
+    df['Debit'] = df.apply(lambda row: -float(row['Debit']) if pd.notnull(row['Debit']) else None, axis=1)
+    df['Credit'] = df['Credit'].astype(float, errors='ignore')
+    df['Running Balance'] = df['Running Balance'].astype(float, errors='ignore')
+    return df
+
+
+def legacy_clean_price_or_avg_price(value, is_first_row=False):
+    """Reference copy of the original per-cell Price cleaning from II_InvestmentsImport.py."""
+    if pd.isna(value):
+        return value
+    value_str = str(value).strip()
+    if not value_str.replace('$', '').replace('p', '').replace('-', '').replace('.', '').replace(',', '').isdigit():
+        return value_str
+    if is_first_row:
+        value_str = value_str.replace('$', '')
+    else:
+        value_str = value_str.replace('p', '')
+    value_str = value_str.replace(',', '')
+    try:
+        return float(value_str)
+    except ValueError:
+        return value_str
+
+
+def legacy_clean_percentage(value):
+    """Reference copy of the original per-cell % cleaning from II_InvestmentsImport.py."""
+    if pd.isna(value):
+        return value
+    value_str = str(value).strip().replace('%', '').replace(',', '')
+    try:
+        return float(value_str)
+    except ValueError:
+        return value_str
+
+
+def legacy_clean_investments(df):
+    """Reference copy of the original Investments.csv cleaning loop."""
+    df.columns = df.columns.str.replace('\ufeff', '')
+    df = df.replace('n/a', '')
+    numeric_columns = ['Price', 'Day Gain/Loss', 'Day Gain/Loss %', 'Market Value £', 'Book Cost', 'Gain/Loss',
+                       'Gain/Loss %']
+    for col in numeric_columns:
+        if col == 'Price':
+            df[col] = [legacy_clean_price_or_avg_price(value, is_first_row=(i == 0))
+                       for i, value in enumerate(df[col])]
+        elif col in ['Day Gain/Loss %', 'Gain/Loss %']:
+            df[col] = df[col].apply(legacy_clean_percentage)
+        else:
+            df[col] = pd.to_numeric(df[col].replace('[£$,]', '', regex=True).replace('', None), errors='coerce')
+    return df
+
+
+def legacy_format_rows(sheet, source_row, start_row, end_row):
+    """Reference copy of the original per-cell formula and formatting loops."""
+    for row in range(start_row, end_row + 1):
+        sheet[f'A{row}'] = TRANSACTIONS_FORMULA.format(row=row)
+    for row in range(start_row, end_row + 1):
+        for col in range(1, TRANSACTIONS_MAX_COLUMN + 1):
+            source_cell = sheet.cell(row=source_row, column=col)
+            target_cell = sheet.cell(row=row, column=col)
+            target_cell.number_format = source_cell.number_format
+            target_cell.fill = copy.copy(source_cell.fill) if source_cell.fill else PatternFill()
+
+
+def batched_format_rows(sheet, source_row, start_row, end_row):
+    write_formulas(sheet, TRANSACTIONS_FORMULA, start_row, end_row)
+    apply_row_styles(sheet, template_row_styles(sheet, source_row, TRANSACTIONS_MAX_COLUMN), start_row, end_row)
+
+
+def style_table_size(book):
+    return {
+        'cell_styles': len(book._cell_styles), 'fills': len(book._fills),
+        'number_formats': len(book._number_formats), 'fonts': len(book._fonts)
+    }
+
+
+def make_transactions_csv(rows, path, sample_csv=SAMPLE_TRANSACTIONS_CSV):
+    """Write a Transactions.csv of the given size by tiling the sample download."""
+    sample = pd.read_csv(sample_csv, encoding='utf-8-sig', dtype=str, keep_default_na=False)
+    repeats = -(-rows // len(sample))
+    pd.concat([sample] * repeats, ignore_index=True).head(rows).to_csv(path, index=False, encoding='utf-8-sig')
+    return path
+
+
+def bench_normalize(row_counts):
+    """Time the legacy row-wise cleaning against II_Normalize and check the frames match."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in row_counts:
+            csv_path = make_transactions_csv(rows, os.path.join(tmp, f'Transactions_{rows}.csv'))
+
+            start = time.perf_counter()
+            legacy = legacy_normalize_transactions(pd.read_csv(csv_path, encoding='utf-8-sig'))
+            legacy_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            vectorized = normalize_transactions(read_transactions_csv(csv_path))
+            vectorized_time = time.perf_counter() - start
+
+            # The legacy sort is not stable, so same-day rows may come out in a different order;
+            # compare row by row on the original CSV position instead
+            pd.testing.assert_frame_equal(legacy.sort_index(), vectorized.sort_index())
+            assert vectorized['Date'].dropna().is_monotonic_increasing
+            results.append((rows, legacy_time, vectorized_time))
+            print(f"{rows:>9,} rows: legacy {legacy_time:8.2f}s  vectorized {vectorized_time:6.2f}s  "
+                  f"speed-up {legacy_time / vectorized_time:5.1f}x  (same rows and values)")
+    return results
+
+
+def bench_investments(row_counts):
+    """
+    Time the legacy per-cell Investments cleaning against the vectorized parser on the
+    same frame, and count the cells whose value changed: pence prices are now pounds,
+    $ prices after the first row and the Market Value and Average Price columns are now numbers.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in row_counts:
+            csv_path = make_investments_csv(os.path.join(tmp, f'Investments_{rows}.csv'), rows)
+            df = pd.read_csv(csv_path, encoding='utf-8-sig')
+
+            start = time.perf_counter()
+            legacy = legacy_clean_investments(df.copy())
+            legacy_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            vectorized = sheet_columns(clean_investments(df.copy()))
+            vectorized_time = time.perf_counter() - start
+
+            changed = 0
+            for col in vectorized.columns:
+                old, new = legacy[col].astype(object), vectorized[col].astype(object)
+                same = (old == new) | (old.isna() & new.isna()) | ((old == '') & new.isna())
+                changed += int((~same).sum())
+            results.append((rows, legacy_time, vectorized_time, changed))
+            print(f"{rows:>9,} rows: legacy {legacy_time:8.2f}s  vectorized {vectorized_time:6.2f}s  "
+                  f"speed-up {legacy_time / vectorized_time:5.1f}x  ({changed:,} cells now parsed differently)")
+    return results
+
+
+def bench_styles(row_counts, workbook=SAMPLE_WORKBOOK):
+    """
+    Append row_counts rows to the sample workbook's Transactions sheet, format them with
+    the legacy per-cell loops and with the captured style IDs, and report formatting
+    time, style table size and save time for each.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in row_counts:
+            for label, format_rows in (('legacy', legacy_format_rows), ('batched', batched_format_rows)):
+                book = openpyxl.load_workbook(workbook)
+                sheet = book[TRANSACTIONS_SHEET]
+                source_row = sheet.max_row
+                template = [cell.value for cell in sheet[source_row]][1:TRANSACTIONS_MAX_COLUMN]
+                for row in range(source_row + 1, source_row + rows + 1):
+                    for col, value in enumerate(template, start=2):
+                        sheet.cell(row=row, column=col, value=value)
+                before = style_table_size(book)
+
+                start = time.perf_counter()
+                format_rows(sheet, source_row, source_row + 1, source_row + rows)
+                format_time = time.perf_counter() - start
+
+                path = os.path.join(tmp, f'{label}_{rows}.xlsx')
+                start = time.perf_counter()
+                book.save(path)
+                save_time = time.perf_counter() - start
+                after = style_table_size(book)
+                results.append((rows, label, format_time, save_time, before, after))
+                print(f"{rows:>9,} rows {label:>8}: format {format_time:6.2f}s  save {save_time:6.2f}s  "
+                      f"style table {before} -> {after}  file {os.path.getsize(path) / 1e6:.1f} MB")
+    return results
+
+
+class StageTimer:
+    """Collect wall-clock seconds per named stage, in the order the stages ran."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def git_commit():
+    """Short commit hash of the working tree, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SAMPLE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def roll_copy(excel_path, folder):
+    """Run II_RollReport's roll from excel_path to the next day, with its config kept in folder."""
+    cwd = os.getcwd()
+    os.chdir(folder)  # roll_to_next_business_day reads and updates ./config.json
+    try:
+        with open('config.json', 'w', encoding='utf-8') as f:
+            json.dump({"base_path": folder, "excel_path": excel_path}, f)
+        return roll_to_next_business_day(excel_path, '01/02/2025')
+    finally:
+        os.chdir(cwd)
+
+
+def run_suite(rows, folder, history=None, holdings=50):
+    """
+    Generate a synthetic data set in folder and time every import and roll stage on it:
+    CSV read, cleaning, workbook load, last-row search, dedup index, append, formulas
+    and formatting, the Investments refresh, save, and the roll copy.
+    """
+    excel_path, transactions_csv, investments_csv = make_benchmark_set(folder, rows, history, holdings)
+    size_before = os.path.getsize(excel_path)
+    timer = StageTimer()
+
+    with timer.stage('csv_read'):
+        df = read_transactions_csv(transactions_csv)
+    with timer.stage('clean'):
+        df = normalize_transactions(df)
+        investments = load_investments_csv(investments_csv)
+    with timer.stage('load'):
+        session = WorkbookSession(excel_path)
+    try:
+        sheet = session.sheet(TRANSACTIONS_SHEET)
+        with timer.stage('last_row'):
+            last_row = last_data_row(sheet)
+            formula_row = last_formula_row(sheet)
+        with timer.stage('dedup_index'):
+            index = TransactionIndex.load(excel_path)
+            index.ensure_current(sheet, last_row)
+            df, _ = index.filter_new(df)
+        with timer.stage('append'):
+            end_row = write_rows(sheet, frame_rows(df), start_row=last_row + 1, start_col=2)
+        with timer.stage('formulas_format'):
+            populate_formulas(sheet, formula_row + 1, end_row)
+            copy_row_formatting(sheet, formula_row, formula_row + 1, end_row)
+            record_rows(sheet, data_row=end_row, formula_row=end_row)
+        with timer.stage('investments'):
+            refresh_investments(session, investments)
+        with timer.stage('save'):
+            session.save()
+    finally:
+        session.close()
+
+    roll_folder = os.path.join(folder, 'roll')
+    os.makedirs(roll_folder, exist_ok=True)
+    with timer.stage('roll_copy'):
+        roll_copy(os.path.abspath(excel_path), roll_folder)
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+        'python': platform.python_version(), 'pandas': pd.__version__, 'openpyxl': openpyxl.__version__,
+        'rows': rows, 'history_rows': rows if history is None else history, 'appended': len(df),
+        'workbook_bytes_before': size_before, 'workbook_bytes_after': os.path.getsize(excel_path),
+        'stages': timer.stages,
+    }
+
+
+def previous_result(results_path, record):
+    """The latest earlier record for the same data size, or None."""
+    if not os.path.exists(results_path):
+        return None
+    previous = None
+    with open(results_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            if (result.get('rows'), result.get('history_rows')) == (record['rows'], record['history_rows']):
+                previous = result
+    return previous
+
+
+def bench_suite(row_counts, history=None, results_path=BENCHMARK_RESULTS):
+    """
+    Run the stage suite for each size, print per-stage times against the previous run of
+    the same size, and append each run as one JSON line to results_path.
+    """
+    records = []
+    for rows in row_counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            record = run_suite(rows, tmp, history)
+        previous = previous_result(results_path, record)
+        with open(results_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+        records.append(record)
+
+        print(f"\n{rows:>9,} new rows onto {record['history_rows']:,} history rows "
+              f"(commit {record['commit']}, previous {previous['commit'] if previous else '-'}):")
+        for name, seconds in record['stages'].items():
+            line = f"  {name:<16} {seconds:8.3f}s"
+            before = previous['stages'].get(name) if previous else None
+            if before:
+                line += f"  was {before:8.3f}s ({(seconds - before) / before * 100:+6.1f}%)"
+                if seconds > before * REGRESSION_THRESHOLD and seconds - before > 0.05:
+                    line += "  REGRESSION?"
+            print(line)
+        print(f"  {'total':<16} {sum(record['stages'].values()):8.3f}s  "
+              f"workbook {record['workbook_bytes_before'] / 1e6:.1f} MB -> {record['workbook_bytes_after'] / 1e6:.1f} MB")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the Interactive Investor importers")
+    parser.add_argument('stage', choices=['normalize', 'investments', 'styles', 'suite'],
+                        help="Stage to benchmark, or 'suite' for every import and roll stage on synthetic data")
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--history', type=int, help="Suite: rows already in the template workbook (default: --rows)")
+    parser.add_argument('--output', default=BENCHMARK_RESULTS,
+                        help="Suite: JSON-lines file the runs are appended to (default: in the working directory)")
+    args = parser.parse_args()
+
+    if args.stage == 'normalize':
+        bench_normalize(args.rows)
+    elif args.stage == 'investments':
+        bench_investments(args.rows)
+    elif args.stage == 'styles':
+        bench_styles(args.rows)
+    elif args.stage == 'suite':
+        bench_suite(args.rows, args.history, args.output)
+
+
+if __name__ == "__main__":
+    main()
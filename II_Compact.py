@@ -0,0 +1,230 @@
+# II_Compact.py
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from copy import copy
+import openpyxl
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE
+from openpyxl.utils.cell import range_boundaries
+from openpyxl.utils.indexed_list import IndexedList
+from II_Metrics import stage, add_cells
+
+# Style tables rebuilt by compact_styles, with the StyleArray field that indexes each and
+# the number of leading entries Excel expects whether used or not (the empty font/border,
+# and the none and gray125 fills)
+STYLE_TABLES = [
+    ('fontId', '_fonts', 1), ('fillId', '_fills', 2), ('borderId', '_borders', 1),
+    ('alignmentId', '_alignments', 1), ('protectionId', '_protections', 1),
+]
+
+
+def style_table_sizes(book):
+    """Entries in each style table of the workbook."""
+    sizes = {'cell_styles': len(book._cell_styles), 'number_formats': len(book._number_formats)}
+    sizes.update({attr[1:]: len(getattr(book, attr)) for _, attr, _ in STYLE_TABLES})
+    return sizes
+
+
+def used_extent(sheet, min_row=2):
+    """
+    Last row and column of the sheet that hold a value, a merged range, a table or a pivot
+    table, at least min_row (the row new data is formatted from when a sheet is empty).
+    """
+    last_row, last_col = min_row, 1
+    for (row, col), cell in sheet._cells.items():
+        if cell.value is not None:
+            last_row, last_col = max(last_row, row), max(last_col, col)
+    ranges = [str(merged) for merged in sheet.merged_cells.ranges]
+    ranges += [table.ref for table in sheet.tables.values()]
+    ranges += [pivot.location.ref for pivot in sheet._pivots]
+    for ref in ranges:
+        _, _, max_col, max_row = range_boundaries(ref)
+        last_row, last_col = max(last_row, max_row), max(last_col, max_col)
+    return last_row, last_col
+
+
+def trim_sheet(sheet, min_row=2):
+    """
+    Drop the empty cells (formatting only) below and right of the used extent, and the
+    row dimensions below it, so max_row and max_column describe the data again.
+    Returns the number of cells dropped.
+    """
+    last_row, last_col = used_extent(sheet, min_row)
+    trailing = [key for key in sheet._cells if key[0] > last_row or key[1] > last_col]
+    for key in trailing:
+        del sheet._cells[key]
+    for row in [row for row in sheet.row_dimensions if row > last_row]:
+        del sheet.row_dimensions[row]
+    return len(trailing)
+
+
+def _styled(book):
+    """Every StyleArray in use: cells, row and column dimensions."""
+    for sheet in book.worksheets:
+        for cell in sheet._cells.values():
+            if cell._style is not None:
+                yield cell
+        for dimension in list(sheet.row_dimensions.values()) + list(sheet.column_dimensions.values()):
+            if dimension._style is not None:
+                yield dimension
+
+
+def _pivot_fields(book):
+    """Pivot table and pivot cache fields, whose numFmtId may point at a custom number format."""
+    for sheet in book.worksheets:
+        for pivot in sheet._pivots:
+            yield from pivot.dataFields
+            yield from pivot.pivotFields
+            if pivot.cache is not None and pivot.cache.cacheFields is not None:
+                yield from pivot.cache.cacheFields
+
+
+def compact_styles(book):
+    """
+    Rebuild the style tables from the styles in use: fonts, fills, borders, alignments,
+    protections and number formats that nothing refers to are dropped, and identical
+    entries (which openpyxl keeps as loaded) are merged, and with them the cell styles
+    that only differed by which copy they pointed at. Named styles are re-bound to the
+    new tables. Returns the table sizes before and after.
+    """
+    before = style_table_sizes(book)
+    old = {attr: getattr(book, attr) for _, attr, _ in STYLE_TABLES}
+    new = {attr: IndexedList(old[attr][:keep]) for _, attr, keep in STYLE_TABLES}
+    number_formats = IndexedList()
+    cell_styles = IndexedList([StyleArray()])
+
+    def number_format(fmt_id):
+        if fmt_id is None or fmt_id < BUILTIN_FORMATS_MAX_SIZE:
+            return fmt_id
+        return number_formats.add(book._number_formats[fmt_id - BUILTIN_FORMATS_MAX_SIZE]) + BUILTIN_FORMATS_MAX_SIZE
+
+    resolved = {}
+    count = 0
+    for item in _styled(book):
+        key = tuple(item._style)
+        style = resolved.get(key)
+        if style is None:
+            style = copy(item._style)
+            for field, attr, _ in STYLE_TABLES:
+                setattr(style, field, new[attr].add(old[attr][getattr(style, field)]))
+            style.numFmtId = number_format(style.numFmtId)
+            cell_styles.add(style)
+            resolved[key] = style
+        item._style = copy(style)  # Cells must not share a mutable StyleArray
+        count += 1
+    for field in _pivot_fields(book):
+        field.numFmtId = number_format(field.numFmtId)
+    for attr, table in new.items():
+        setattr(book, attr, table)
+    book._number_formats = number_formats
+    book._cell_styles = cell_styles
+    for named in book._named_styles:
+        named.bind(book)  # Looks its font, fill, ... up again in the new tables
+    add_cells(count)
+    return before, style_table_sizes(book)
+
+
+def _orphaned(name, sheetnames):
+    if '#REF!' in (name.attr_text or ''):
+        return True
+    try:
+        return any(title not in sheetnames for title, _ in name.destinations)
+    except Exception:  # Not a plain range (a constant or a formula): kept
+        return False
+
+
+def drop_orphaned_names(book):
+    """Remove the defined names, workbook and sheet scoped, that refer to #REF! or a sheet that no longer exists."""
+    dropped = []
+    scopes = [book.defined_names] + [sheet.defined_names for sheet in book.worksheets]
+    for names in scopes:
+        for key in [key for key, name in names.items() if _orphaned(name, book.sheetnames)]:
+            dropped.append(key)
+            del names[key]
+    return dropped
+
+
+def _timed_load(path):
+    start = time.perf_counter()
+    book = openpyxl.load_workbook(path)
+    return book, time.perf_counter() - start
+
+
+def compact_workbook(source_path, target_path=None):
+    """
+    Write a compacted copy of the workbook to target_path (default: over the source,
+    atomically): trailing formatting-only rows and columns trimmed, style tables
+    rebuilt from the styles in use, orphaned defined names dropped. Cell values,
+    formulas, the PnL pivot table and the watermarks are kept as they are.
+
+    Returns the statistics: file size and openpyxl load time before and after, cells
+    trimmed, style table sizes before and after, and the names dropped.
+    """
+    if not os.path.isfile(source_path):
+        raise FileNotFoundError(f"Source workbook not found: {source_path}")
+    target_path = target_path or source_path
+    stats = {'size_before': os.path.getsize(source_path)}
+    with stage('compact_load'):
+        book, stats['load_seconds_before'] = _timed_load(source_path)
+    try:
+        with stage('compact_trim') as current:
+            stats['max_rows_before'] = {sheet.title: sheet.max_row for sheet in book.worksheets}
+            stats['cells_trimmed'] = sum(trim_sheet(sheet) for sheet in book.worksheets)
+            stats['max_rows_after'] = {sheet.title: sheet.max_row for sheet in book.worksheets}
+            current.cells = stats['cells_trimmed']
+        with stage('compact_styles'):
+            stats['styles_before'], stats['styles_after'] = compact_styles(book)
+        stats['names_dropped'] = drop_orphaned_names(book)
+
+        folder = os.path.dirname(os.path.abspath(target_path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.ii_compact_', suffix='.xlsx', dir=folder)
+        os.close(fd)
+        try:
+            with stage('compact_save'):
+                book.save(tmp_path)
+                shutil.copymode(source_path, tmp_path)  # mkstemp files are private to the user
+                os.replace(tmp_path, target_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    finally:
+        book.close()
+
+    stats['size_after'] = os.path.getsize(target_path)
+    compacted, stats['load_seconds_after'] = _timed_load(target_path)
+    compacted.close()
+    return stats
+
+
+def describe(stats):
+    """One-paragraph summary of compact_workbook statistics."""
+    trimmed = ', '.join(f"{title} {before}->{stats['max_rows_after'][title]}"
+                        for title, before in stats['max_rows_before'].items()
+                        if before != stats['max_rows_after'][title])
+    styles = ', '.join(f"{table} {before}->{stats['styles_after'][table]}"
+                       for table, before in stats['styles_before'].items()
+                       if before != stats['styles_after'][table])
+    return (f"size {stats['size_before']:,} -> {stats['size_after']:,} bytes, "
+            f"load {stats['load_seconds_before']:.2f}s -> {stats['load_seconds_after']:.2f}s; "
+            f"{stats['cells_trimmed']:,} empty cells trimmed ({trimmed or 'no rows'}); "
+            f"styles: {styles or 'unchanged'}; "
+            f"names dropped: {', '.join(stats['names_dropped']) or 'none'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trim formatting-only rows, unused styles and orphaned names from a workbook")
+    parser.add_argument('workbook', help="Workbook to compact")
+    parser.add_argument('--output', help="Write the compacted copy here instead of replacing the workbook")
+    args = parser.parse_args()
+
+    try:
+        print(f"Compacted {args.output or args.workbook}: {describe(compact_workbook(args.workbook, args.output))}")
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except PermissionError:
+        print("Error: Permission denied when writing the workbook. Ensure it is not open in another application.")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
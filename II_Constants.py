@@ -8,9 +8,96 @@ INVESTMENTS_CSV_PATH = r'C:\Users\moore\Downloads\Investments.csv'
 TRANSACTIONS_SHEET = 'Transactions'
 TRANSACTIONS_FORMULA = '=IF(ISERROR(VLOOKUP(D{row},MapName!A:D,4,0)),VLOOKUP(H{row},MapEdgeCases!A:B,2,0),VLOOKUP(D{row},MapName!A:D,4,0))'
 TRANSACTIONS_MAX_COLUMN = 13  # A:M
+# CSV columns as laid out in the sheet from column B onwards
+TRANSACTIONS_COLUMNS = [
+    'Date', 'Settlement Date', 'Symbol', 'Sedol', 'Quantity', 'Price',
+    'Description', 'Reference', 'Debit', 'Credit', 'Running Balance'
+]
+TRANSACTIONS_INDEX_SUFFIX = '.txindex.jsonl'  # Dedup index sidecar next to the workbook
 
 # Investments constants
 INVESTMENTS_SHEET = 'Investments'
 INVESTMENTS_FORMULA = '=IF(ISERROR(VLOOKUP(B{row},MapName!A:D,4,0)),"",VLOOKUP(B{row},MapName!A:D,4,0))'
 INVESTMENTS_MAX_COLUMN = 1  # A only
-INVESTMENTS_START_CELL = 'B2'
\ No newline at end of file
+INVESTMENTS_START_CELL = 'B2'
+# CSV columns as laid out in the sheet from column B onwards
+INVESTMENTS_COLUMNS = [
+    'Symbol', 'Name', 'Qty', 'Price', 'Day Gain/Loss', 'Day Gain/Loss %', 'Market Value £',
+    'Market Value', 'Book Cost', 'Gain/Loss', 'Gain/Loss %', 'Average Price'
+]
+# Amount columns parsed to numbers; each gets a companion '<column> Unit' column (GBP, USD or %)
+INVESTMENTS_AMOUNT_COLUMNS = [
+    'Price', 'Day Gain/Loss', 'Day Gain/Loss %', 'Market Value £', 'Market Value',
+    'Book Cost', 'Gain/Loss', 'Gain/Loss %', 'Average Price'
+]
+UNIT_COLUMN_SUFFIX = ' Unit'
+
+# Category lookup sheets used by the column A formulas
+MAPNAME_SHEET = 'MapName'  # Symbol -> Name in column D
+MAPEDGECASES_SHEET = 'MapEdgeCases'  # Description -> Name in column B
+# config.json "category_mode": write the column A VLOOKUP formulas, or resolve them in Python and write values
+CATEGORY_MODE_FORMULA = 'formula'
+CATEGORY_MODE_VALUE = 'value'
+CATEGORY_NOT_FOUND = '#N/A'  # What the Transactions formula shows when neither lookup matches
+
+# Local ledger store (system of record for normalized rows)
+LEDGER_FILENAME = 'II_Ledger.sqlite'
+DEFAULT_ACCOUNT = 'default'
+LEDGER_LOCK_TIMEOUT = 300  # Seconds a writer waits for the ledger while another account's import holds it
+
+# Holdings snapshot store: fixed-width records appended on every Investments import
+SNAPSHOTS_DIRNAME = 'II_Snapshots'
+SNAPSHOT_COLUMNS = ['Qty', 'Price', 'Market Value £', 'Book Cost']
+
+# Section 104 cost basis state (pools and final gains per account), kept next to the ledger
+COST_BASIS_FILENAME = 'II_CostBasis.json'
+COST_BASIS_MATCH_DAYS = 30  # Bed and breakfast rule: acquisitions within 30 days after a disposal
+
+# Pre-write reconciliation of a Transactions download
+RECONCILE_BALANCE_TOLERANCE = 0.005  # Half a penny
+RECONCILE_QTY_TOLERANCE = 1e-6
+RECONCILE_REPORT_ROWS = 10  # Discrepancies listed per check
+
+# The dealt price in a trade Description is cut to two decimals; the Price column is rounded
+DESCRIPTION_PRICE_TOLERANCE = 0.01
+
+# Watch-folder daemon (config.json "watch_folder", "watch_poll_seconds", ... override these)
+WATCH_PATTERNS = {'transactions': 'transactions*.csv', 'investments': 'investments*.csv'}  # Lower-case file names
+WATCH_POLL_SECONDS = 2.0  # Folder scan interval when there is no file-system event backend
+WATCH_SETTLE_SECONDS = 3.0  # A download is complete once its size and mtime are unchanged this long
+WATCH_IDLE_SECONDS = 10.0  # Import the queued downloads once no new one has arrived for this long...
+WATCH_FLUSH_SECONDS = 60.0  # ...or at the latest this long after the first one was queued
+
+# Streaming rebuild import: sheet XML is read and copied in chunks of this many bytes
+REBUILD_CHUNK_BYTES = 1 << 20
+
+# Year partitions: closed years of Transactions move to year sheets of an archive workbook
+ARCHIVE_FILENAME = 'II_Archive.xlsx'  # Next to the daily workbook; config.json "archive_path" moves it
+ARCHIVE_SHEET = 'Transactions {year}'
+PARTITIONS_SHEET = 'Years'  # Summary index sheet in the daily workbook, one row per archived year
+PARTITION_COLUMNS = ['Year', 'Archive', 'Sheet', 'Rows', 'First Date', 'Last Date', 'Debit', 'Credit', 'Closing Balance']
+PARTITION_NAME_COLUMNS = ['Name', 'Quantity', 'Debit', 'Credit']  # Archived totals per column A Name, beside them
+
+# Typed frame cache of the Transactions/Investments sheets, a sidecar folder next to the workbook
+FRAME_CACHE_SUFFIX = '.frames'
+FRAME_CACHE_MAX_PARTS = 8  # Past this many appended parts a load merges them back into one
+
+# Returns: XIRR per holding and for the portfolio, time-weighted return from the snapshots
+RETURNS_PORTFOLIO = 'Portfolio'  # Row/column of the whole portfolio next to the symbols
+XIRR_GUESS = 0.1  # Excel's default guess
+XIRR_TOLERANCE = 1e-10  # Rates are solved to this; Excel's XIRR agrees to 1e-6 at the least
+XIRR_MAX_ITERATIONS = 100
+
+# Run metrics: one JSON record per run, in the working directory next to roll_report.log
+METRICS_FILENAME = 'ii_metrics.jsonl'
+
+# Transactions CSV normalization
+TRANSACTIONS_DATE_FORMAT = '%d/%m/%Y'
+TRANSACTIONS_DATE_COLUMNS = ['Date', 'Settlement Date']
+TRANSACTIONS_NUMERIC_COLUMNS = ['Quantity', 'Price', 'Debit', 'Credit', 'Running Balance']
+TRANSACTIONS_TEXT_COLUMNS = ['Symbol', 'Sedol', 'Description', 'Reference']
+TRANSACTIONS_NO_SIGN_FLIP_PREFIXES = ('Div', 'GROSS INTEREST')
+
+# Append-position watermarks, stored as workbook custom document properties
+WATERMARK_LAST_DATA_ROW = 'II {sheet} last data row'
+WATERMARK_LAST_FORMULA_ROW = 'II {sheet} last formula row'
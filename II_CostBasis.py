@@ -0,0 +1,406 @@
+# II_CostBasis.py
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from II_Constants import (
+    DEFAULT_BASE_PATH, DEFAULT_ACCOUNT, INVESTMENTS_CSV_PATH, COST_BASIS_FILENAME, COST_BASIS_MATCH_DAYS,
+    TRANSACTIONS_NO_SIGN_FLIP_PREFIXES, UNIT_COLUMN_SUFFIX
+)
+from II_Config import load_config
+from II_Ledger import open_ledger
+
+EPSILON = 1e-9  # Quantities below this are treated as zero
+RULE_SAME_DAY = 'same day'
+RULE_30_DAY = '30 day'
+RULE_POOL = 'S104'
+RULE_UNMATCHED = 'unmatched'  # Disposed of more than the transactions acquired (history before the ledger)
+GAIN_COLUMNS = ['Date', 'Symbol', 'Rule', 'Quantity', 'Proceeds', 'Cost', 'Gain']
+
+
+def cost_basis_path_for(config):
+    """State file location: config "cost_basis_path", else II_CostBasis.json in the base folder."""
+    return config.get("cost_basis_path") or os.path.join(config.get("base_path", DEFAULT_BASE_PATH),
+                                                         COST_BASIS_FILENAME)
+
+
+def _day(value):
+    return int(np.datetime64(pd.Timestamp(value).date(), 'D').astype(np.int64))
+
+
+def _date(day):
+    return str(np.datetime64(int(day), 'D'))
+
+
+def trade_days(df):
+    """
+    Acquisitions and disposals per symbol and day from normalized Transactions rows, where
+    sells have a negative Quantity: Acquired/Cost from the buys (cost is the Debit, dealing
+    costs included) and Disposed/Proceeds from the sells (the Credit). Dividends and
+    interest, and rows without a Symbol or Quantity, are not trades.
+    """
+    quantity = pd.to_numeric(df['Quantity'], errors='coerce')
+    description = df['Description'].fillna('').astype(str)
+    symbol = df['Symbol'].where(df['Symbol'].astype(str).str.strip().ne('') & df['Symbol'].ne('n/a'))
+    trades = (quantity.notna() & (quantity != 0) & symbol.notna() & pd.to_datetime(df['Date']).notna()
+              & ~description.str.startswith(TRANSACTIONS_NO_SIGN_FLIP_PREFIXES))
+    quantity, buy = quantity[trades], quantity[trades] > 0
+    days = pd.DataFrame({
+        'Symbol': symbol[trades].astype(str),
+        'Day': pd.to_datetime(df.loc[trades, 'Date']).to_numpy().astype('datetime64[D]').astype(np.int64),
+        'Acquired': quantity.where(buy, 0.0),
+        'Cost': pd.to_numeric(df.loc[trades, 'Debit'], errors='coerce').abs().where(buy, 0.0).fillna(0.0),
+        'Disposed': (-quantity).where(~buy, 0.0),
+        'Proceeds': pd.to_numeric(df.loc[trades, 'Credit'], errors='coerce').abs().where(~buy, 0.0).fillna(0.0),
+    })
+    return days.groupby(['Symbol', 'Day'], as_index=False, sort=True).sum()
+
+
+def _pool(acquired, cost, disposed, pool_qty, pool_cost):
+    """
+    Run days that are each an acquisition or a disposal through a Section 104 pool.
+    Returns the pool quantity and cost after each day, the allowable cost of each
+    disposal and the quantity disposed of beyond the pool.
+
+    The quantity is a cumulative sum. The cost follows C[t] = C[t-1] * f[t] + cost[t],
+    with f[t] the fraction of the pool kept by a disposal, which is solved with a
+    cumulative product in the stretches between the points where the pool empties.
+    """
+    quantity = pool_qty + np.cumsum(acquired - disposed)
+    unmatched = np.zeros(len(quantity))
+    # Disposals beyond the pool empty it; move the rest of the series up by the excess
+    while True:
+        over = np.flatnonzero(quantity < -EPSILON)
+        if not len(over):
+            break
+        unmatched[over[0]] = -quantity[over[0]]
+        quantity[over[0]:] += unmatched[over[0]]
+    quantity[np.abs(quantity) < EPSILON] = 0.0
+
+    previous = np.concatenate(([pool_qty], quantity[:-1]))
+    matched = disposed - unmatched
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kept = np.where(disposed > 0, np.where(previous > EPSILON, 1 - matched / previous, 0.0), 1.0)
+    kept = np.clip(kept, 0.0, 1.0)
+    kept[kept < EPSILON] = 0.0
+
+    total = np.empty(len(quantity))
+    carried = pool_cost
+    start = 0
+    for end in list(np.flatnonzero(kept == 0)) + [len(quantity)]:
+        if end > start:
+            product = np.cumprod(kept[start:end])
+            total[start:end] = product * (carried + np.cumsum(cost[start:end] / product))
+            carried = total[end - 1]
+        if end < len(quantity):
+            total[end] = cost[end]
+            carried = total[end]
+        start = end + 1
+    costs = np.concatenate(([pool_cost], total[:-1])) * (1 - kept) * (disposed > 0)
+    return quantity, total, costs, unmatched
+
+
+def match_symbol(days, pool_qty, pool_cost, final_day):
+    """
+    Match one symbol's disposals in the order HMRC requires: acquisitions on the same
+    day, then acquisitions in the following 30 days (earliest first), then the
+    Section 104 pool. days has Day, Acquired, Cost, Disposed and Proceeds per day,
+    oldest first, and follows the pool state (pool_qty, pool_cost).
+
+    Days up to final_day can no longer change, since every acquisition that could be
+    matched to them is known. Returns the gains as (day, rule, quantity, proceeds, cost)
+    tuples, the pool after final_day, the later days still to be matched again next
+    time (less what the final days took from them), and the pool after all days.
+    """
+    day = days['Day'].to_numpy()
+    acquired, cost = days['Acquired'].to_numpy(dtype=float).copy(), days['Cost'].to_numpy(dtype=float).copy()
+    disposed, proceeds = days['Disposed'].to_numpy(dtype=float).copy(), days['Proceeds'].to_numpy(dtype=float).copy()
+    pending = days.copy()
+    gains = []
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Same day: the day's acquisitions against the day's disposals
+        same = np.minimum(acquired, disposed)
+        same_cost = np.where(acquired > 0, cost * same / acquired, 0.0)
+        same_proceeds = np.where(disposed > 0, proceeds * same / disposed, 0.0)
+    for i in np.flatnonzero(same > EPSILON):
+        gains.append((day[i], RULE_SAME_DAY, same[i], same_proceeds[i], same_cost[i]))
+    acquired, cost = acquired - same, cost - same_cost
+    disposed, proceeds = disposed - same, proceeds - same_proceeds
+
+    # 30 days: each disposal, oldest first, against the later acquisitions in its window
+    for i in np.flatnonzero(disposed > EPSILON):
+        end = np.searchsorted(day, day[i] + COST_BASIS_MATCH_DAYS, side='right')
+        matched_qty = matched_cost = matched_proceeds = 0.0
+        for j in range(i + 1, end):
+            if disposed[i] <= EPSILON:
+                break
+            if acquired[j] <= EPSILON:
+                continue
+            qty = min(disposed[i], acquired[j])
+            part_cost, part_proceeds = cost[j] * qty / acquired[j], proceeds[i] * qty / disposed[i]
+            acquired[j] -= qty
+            cost[j] -= part_cost
+            disposed[i] -= qty
+            proceeds[i] -= part_proceeds
+            matched_qty, matched_cost, matched_proceeds = (matched_qty + qty, matched_cost + part_cost,
+                                                           matched_proceeds + part_proceeds)
+            if day[i] <= final_day < day[j]:
+                # A final disposal took part of a pending acquisition, for good
+                pending.loc[pending.index[j], ['Acquired', 'Cost']] -= (qty, part_cost)
+        if matched_qty > EPSILON:
+            gains.append((day[i], RULE_30_DAY, matched_qty, matched_proceeds, matched_cost))
+
+    # Section 104 pool: what is left, in date order
+    disposed[disposed < EPSILON] = 0.0
+    quantity, total, costs, unmatched = _pool(acquired, cost, disposed, pool_qty, pool_cost)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pool_proceeds = np.where(disposed > 0, proceeds * (disposed - unmatched) / disposed, 0.0)
+    for i in np.flatnonzero(disposed - unmatched > EPSILON):
+        gains.append((day[i], RULE_POOL, disposed[i] - unmatched[i], pool_proceeds[i], costs[i]))
+    for i in np.flatnonzero(unmatched > EPSILON):
+        gains.append((day[i], RULE_UNMATCHED, unmatched[i], proceeds[i] - pool_proceeds[i], np.nan))
+
+    final = np.flatnonzero(day <= final_day)
+    if len(final):
+        pool_qty, pool_cost = float(quantity[final[-1]]), float(total[final[-1]])
+    current = (float(quantity[-1]), float(total[-1])) if len(day) else (pool_qty, pool_cost)
+    gains.sort(key=lambda gain: gain[0])
+    return gains, (pool_qty, pool_cost), pending[pending['Day'] > final_day], current
+
+
+DAY_COLUMNS = ['Day', 'Acquired', 'Cost', 'Disposed', 'Proceeds']
+
+
+def gains_path_for(path):
+    """The final gains sit next to the state file, in an append-only JSON-lines file."""
+    return os.path.splitext(path)[0] + '.gains.jsonl'
+
+
+def _merge_days(rows):
+    """Sum rows of DAY_COLUMNS values that fall on the same day, oldest day first."""
+    rows = np.asarray(rows, dtype=float).reshape(-1, len(DAY_COLUMNS))
+    days, inverse = np.unique(rows[:, 0], return_inverse=True)
+    totals = np.zeros((len(days), len(DAY_COLUMNS) - 1))
+    np.add.at(totals, inverse, rows[:, 1:])
+    merged = pd.DataFrame(totals, columns=DAY_COLUMNS[1:])
+    merged.insert(0, 'Day', days.astype(np.int64))
+    return merged
+
+
+class CostBasis:
+    """
+    Section 104 cost basis and realized gains for one account, kept up to date
+    incrementally. The state file holds, per symbol, the pool as at the last final day
+    (31 days before the latest trade) and the trade days since then; an update
+    only matches those pending days with the new transactions. Gains on the pending
+    days are provisional until they become final, when they are appended to the gains
+    file, one line per update, like the TransactionIndex sidecar.
+    """
+
+    def __init__(self, path, account=DEFAULT_ACCOUNT):
+        self.path = path
+        self.gains_path = gains_path_for(path)
+        self.account = account
+        self.state = self.empty_state()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f).get('accounts', {}).get(account, self.state)
+        self.new_gains = []  # Final gains not saved yet
+        self.rebuilt = False
+
+    @staticmethod
+    def empty_state():
+        return {'seq': 0, 'batch': 0, 'last_day': None, 'symbols': {}, 'provisional': []}
+
+    @property
+    def final_day(self):
+        last_day = self.state['last_day']
+        # A trade dated on the last day may still arrive, so the disposals whose 30 days
+        # reach it are not final yet
+        return None if last_day is None else _day(last_day) - COST_BASIS_MATCH_DAYS - 1
+
+    def reset(self):
+        """Start again from no transactions; the saved final gains are dropped on the next save()."""
+        self.state = dict(self.empty_state(), batch=self.state['batch'])
+        self.new_gains = []
+        self.rebuilt = True
+
+    def update(self, transactions, seq=None):
+        """
+        Match new Transactions rows (normalized, as stored in the ledger) and advance
+        the final day. Raises ValueError for a trade dated on or before the final day,
+        which needs a reset() and a replay. Returns the number of trade days processed.
+        """
+        days = trade_days(transactions)
+        final_day = self.final_day
+        if final_day is not None and len(days) and days['Day'].min() <= final_day:
+            raise ValueError(f"Transactions dated on or before {_date(final_day)} need a cost basis rebuild")
+
+        if len(days):
+            # Dividends and interest do not advance the final day: they match nothing
+            last_day = max(int(days['Day'].max()), _day(self.state['last_day']) if self.state['last_day'] else 0)
+            self.state['last_day'] = _date(last_day)
+        final_day = self.final_day
+
+        symbols = self.state['symbols']
+        provisional = list(self.state['provisional'])
+        new_by_symbol = {symbol: group[DAY_COLUMNS].to_numpy(dtype=float) for symbol, group in days.groupby('Symbol')}
+        for symbol in sorted(set(new_by_symbol) | {s for s, pool in symbols.items() if pool['pending']}):
+            pool = symbols.get(symbol, {'qty': 0.0, 'cost': 0.0, 'pending': []})
+            pending = [[_day(row[0])] + row[1:] for row in pool['pending']]
+            combined = _merge_days(pending + new_by_symbol.get(symbol, np.empty((0, len(DAY_COLUMNS)))).tolist())
+
+            gains, (qty, cost), still_pending, current = match_symbol(combined, pool['qty'], pool['cost'], final_day)
+            provisional = [gain for gain in provisional if gain[1] != symbol]
+            for day, rule, quantity, proceeds, allowable in gains:
+                row = [_date(day), symbol, rule, round(float(quantity), 8), round(float(proceeds), 2),
+                       None if np.isnan(allowable) else round(float(allowable), 2)]
+                (self.new_gains if day <= final_day else provisional).append(row)
+            symbols[symbol] = {
+                'qty': qty, 'cost': cost, 'current_qty': current[0], 'current_cost': current[1],
+                'pending': [[_date(row[0])] + [float(value) for value in row[1:]]
+                            for row in still_pending.itertuples(index=False)],
+            }
+        self.state['provisional'] = provisional
+        if seq is not None:
+            self.state['seq'] = int(seq)
+        return len(days)
+
+    def save(self):
+        """
+        Append the new final gains to the gains file, then write the state atomically (a
+        temporary file next to it, then replace). Gains lines from a batch the state
+        does not know of, left by an interrupted save, are ignored when reading.
+        """
+        batch = self.state['batch'] + 1
+        if self.new_gains or self.rebuilt:
+            entry = {'account': self.account, 'batch': batch, 'gains': self.new_gains}
+            if self.rebuilt:
+                entry['rebuild'] = True
+            with open(self.gains_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+
+        accounts = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                accounts = json.load(f).get('accounts', {})
+        accounts[self.account] = dict(self.state, batch=batch)
+        folder = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.ii_costbasis_', suffix='.json', dir=folder)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'accounts': accounts}, f)
+            if os.path.exists(self.path):
+                shutil.copymode(self.path, tmp_path)  # mkstemp files are private to the user
+            os.replace(tmp_path, self.path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.state['batch'] = batch
+        self.new_gains = []
+        self.rebuilt = False
+
+    def final_gains(self):
+        """The final gains, saved and not yet saved, as rows of GAIN_COLUMNS without Gain."""
+        entries = {}
+        if os.path.exists(self.gains_path) and not self.rebuilt:
+            with open(self.gains_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        if entry.get('account') == self.account and entry['batch'] <= self.state['batch']:
+                            entries[entry['batch']] = entry  # A batch written twice keeps its last line
+        gains = []
+        for batch in sorted(entries):
+            if entries[batch].get('rebuild'):
+                gains = []
+            gains.extend(entries[batch]['gains'])
+        return gains + self.new_gains
+
+    def realized_gains(self):
+        """Final and provisional gains per disposal day and matching rule, oldest first."""
+        rows = [row + [False] for row in self.final_gains()] + [row + [True] for row in self.state['provisional']]
+        df = pd.DataFrame(rows, columns=GAIN_COLUMNS[:-1] + ['Provisional'])
+        df['Date'] = pd.to_datetime(df['Date'])
+        df.insert(6, 'Gain', df['Proceeds'] - df['Cost'])
+        return df.sort_values(['Date', 'Symbol'], kind='stable').reset_index(drop=True)
+
+    def pools(self):
+        """The Section 104 pool of every symbol after all transactions so far."""
+        rows = [(symbol, pool['current_qty'], pool['current_cost']) for symbol, pool in sorted(self.state['symbols'].items())]
+        df = pd.DataFrame(rows, columns=['Symbol', 'Quantity', 'Pool Cost'])
+        df['Average Cost'] = (df['Pool Cost'] / df['Quantity']).where(df['Quantity'] > EPSILON)
+        return df
+
+
+def update_from_ledger(cost_basis, ledger, rebuild=False):
+    """
+    Bring the cost basis up to date with the transactions added to the ledger since the
+    last update. Transactions dated on or before the final day (a backfill of older
+    history) rebuild the account from all of its ledger rows.
+    """
+    if rebuild:
+        cost_basis.reset()
+    transactions = ledger.transactions_after(cost_basis.state['seq'], cost_basis.account)
+    if transactions.empty:
+        print("Cost basis: no new transactions")
+        return 0
+    try:
+        count = cost_basis.update(transactions, transactions['Seq'].max())
+    except ValueError as e:
+        print(f"{e}; rebuilding from the ledger")
+        cost_basis.reset()
+        transactions = ledger.transactions_after(0, cost_basis.account)
+        count = cost_basis.update(transactions, transactions['Seq'].max())
+    print(f"Cost basis: {len(transactions)} new transactions, {count} trade days matched")
+    return count
+
+
+def compare_book_cost(pools, investments):
+    """
+    Pool quantity and cost against the Qty and Book Cost of an Investments download.
+    The difference is only given for holdings whose Book Cost is in pounds; for USD
+    holdings the pool is in pounds (the cash paid) but Book Cost is in dollars.
+    """
+    holdings = investments[investments['Symbol'].notna()].copy()
+    unit_column = 'Book Cost' + UNIT_COLUMN_SUFFIX
+    holdings['Book Cost Currency'] = holdings[unit_column] if unit_column in holdings.columns else None
+    df = pools.merge(holdings[['Symbol', 'Qty', 'Book Cost', 'Book Cost Currency']], on='Symbol', how='outer')
+    df = df[(df['Quantity'].fillna(0).abs() > EPSILON) | df['Qty'].notna()]
+    gbp = df['Book Cost Currency'] == 'GBP'
+    df['Qty Difference'] = df['Quantity'].fillna(0) - df['Qty'].fillna(0)
+    df['Cost Difference'] = (df['Pool Cost'].fillna(0) - df['Book Cost']).where(gbp).round(2)
+    return df.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Section 104 cost basis and realized gains from the ledger")
+    parser.add_argument('--rebuild', action='store_true', help="Replay every ledger transaction instead of the new ones")
+    parser.add_argument('--investments-csv', default=INVESTMENTS_CSV_PATH, help="Investments.csv to compare Book Cost with")
+    args = parser.parse_args()
+
+    config = load_config()
+    ledger = open_ledger(config)
+    try:
+        if ledger is None:
+            raise FileNotFoundError("Ledger not available")
+        cost_basis = CostBasis(cost_basis_path_for(config), config.get("account", DEFAULT_ACCOUNT))
+        update_from_ledger(cost_basis, ledger, rebuild=args.rebuild)
+        cost_basis.save()
+        print(cost_basis.realized_gains().to_string(index=False))
+        if os.path.exists(args.investments_csv):
+            from II_InvestmentsImport import load_investments_csv
+            print(compare_book_cost(cost_basis.pools(), load_investments_csv(args.investments_csv)).to_string(index=False))
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except ValueError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
+    finally:
+        if ledger is not None:
+            ledger.close()
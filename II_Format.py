@@ -0,0 +1,54 @@
+# II_Format.py
+from copy import copy
+from openpyxl.styles.cell_style import StyleArray
+from II_Metrics import add_cells
+
+
+def formula_block(formula, start_row, end_row):
+    """Generate the column formulas for rows start_row..end_row in one batch."""
+    parts = formula.split('{row}')  # Split once instead of re-parsing the template per row
+    return [str(row).join(parts) for row in range(start_row, end_row + 1)]
+
+
+def write_formulas(sheet, formula, start_row, end_row, column=1):
+    """Write a batch of row formulas into one column."""
+    for row, value in enumerate(formula_block(formula, start_row, end_row), start=start_row):
+        sheet.cell(row=row, column=column, value=value)
+    add_cells(max(0, end_row - start_row + 1))
+
+
+def template_row_styles(sheet, source_row, max_column):
+    """
+    Capture the number format and fill of a template row once, as style-table IDs
+    (numFmtId, fillId) per column. The IDs already exist in the workbook's style
+    table, so applying them adds no new fills or number formats.
+    """
+    template = []
+    for col in range(1, max_column + 1):
+        cell = sheet._cells.get((source_row, col))
+        style = cell._style if cell is not None and cell._style is not None else StyleArray()
+        template.append((style.numFmtId, style.fillId))
+    return template
+
+
+def apply_row_styles(sheet, template, start_row, end_row):
+    """
+    Apply a captured template (see template_row_styles) to rows start_row..end_row.
+    Only numFmtId and fillId are replaced, so font, border and alignment of the
+    target cells are kept, exactly like setting number_format and fill per cell,
+    but each distinct target style is resolved once and then copied by ID.
+    """
+    resolved = {}
+    for row in range(start_row, end_row + 1):
+        for col, (num_fmt_id, fill_id) in enumerate(template, start=1):
+            cell = sheet.cell(row=row, column=col)
+            current = cell._style if cell._style is not None else StyleArray()
+            key = (col, tuple(current))
+            style = resolved.get(key)
+            if style is None:
+                style = copy(current)
+                style.numFmtId = num_fmt_id
+                style.fillId = fill_id
+                resolved[key] = style
+            cell._style = copy(style)  # Cells must not share a mutable StyleArray
+    add_cells(max(0, end_row - start_row + 1) * len(template))
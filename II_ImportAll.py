@@ -0,0 +1,56 @@
+# II_ImportAll.py
+from II_Constants import (
+    DEFAULT_EXCEL_PATH, DEFAULT_ACCOUNT, TRANSACTIONS_CSV_PATH, INVESTMENTS_CSV_PATH, CATEGORY_MODE_FORMULA
+)
+from II_Config import load_config
+from II_Ledger import open_ledger
+from II_Snapshots import open_snapshots
+from II_Normalize import load_transactions_csv
+from II_TransactionsImport import append_transactions
+from II_InvestmentsImport import load_investments_csv, refresh_investments
+from II_WorkbookSession import WorkbookSession
+from II_Metrics import run_metrics
+
+
+def import_all(excel_path, transactions_csv=TRANSACTIONS_CSV_PATH, investments_csv=INVESTMENTS_CSV_PATH,
+               ledger=None, account=DEFAULT_ACCOUNT, category_mode=CATEGORY_MODE_FORMULA, snapshots=None):
+    """
+    Import both downloads into the workbook in one session: the CSVs are read and
+    cleaned first, then the workbook is loaded once, the Transactions append and the
+    Investments refresh run in memory, and the workbook is saved once. The Transactions
+    download is reconciled against the Investments Qty before anything is written.
+    category_mode chooses formulas or resolved values for column A (see II_MapResolver).
+    """
+    transactions = load_transactions_csv(transactions_csv)
+    investments = load_investments_csv(investments_csv)
+
+    with WorkbookSession(excel_path, ledger, account, category_mode, snapshots) as session:
+        appended = append_transactions(session, transactions, investments)
+        refresh_investments(session, investments)
+    print(f"Import complete: {appended} new transactions, {len(investments)} investment rows")
+
+
+if __name__ == "__main__":
+    config = load_config()
+    excel_path = config.get("excel_path", DEFAULT_EXCEL_PATH)  # Use config.json with fallback
+    ledger = open_ledger(config)
+    account = config.get("account", DEFAULT_ACCOUNT)
+    snapshots = open_snapshots(config, account)
+
+    try:
+        with run_metrics('import_all', excel_path, profile=config.get("profile", False)):
+            import_all(excel_path, ledger=ledger, account=account,
+                       category_mode=config.get("category_mode", CATEGORY_MODE_FORMULA), snapshots=snapshots)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except PermissionError as e:
+        print(f"Error: {e}")
+    except ValueError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
+        import sys
+        sys.exit(1)
+    finally:
+        if ledger is not None:
+            ledger.close()
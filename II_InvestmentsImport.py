@@ -1,210 +1,276 @@
 import pandas as pd
-import openpyxl
-from openpyxl import load_workbook
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import PatternFill
 import os
-import copy
-import json
 from II_Constants import (
-    DEFAULT_EXCEL_PATH, INVESTMENTS_CSV_PATH, INVESTMENTS_SHEET,
-    INVESTMENTS_START_CELL, INVESTMENTS_MAX_COLUMN, INVESTMENTS_FORMULA
+    DEFAULT_EXCEL_PATH, DEFAULT_ACCOUNT, INVESTMENTS_CSV_PATH, INVESTMENTS_SHEET,
+    INVESTMENTS_START_CELL, INVESTMENTS_MAX_COLUMN, INVESTMENTS_FORMULA, INVESTMENTS_AMOUNT_COLUMNS,
+    UNIT_COLUMN_SUFFIX, CATEGORY_MODE_FORMULA, CATEGORY_MODE_VALUE
 )
 from II_Config import load_config  # Import load_config from II_Config.py
+from II_Ledger import open_ledger, workbook_date
+from II_Snapshots import open_snapshots
+from II_Normalize import parse_amount_column
+from II_WorkbookSession import WorkbookSession, frame_rows
+from II_Format import write_formulas, template_row_styles, apply_row_styles
+from II_Watermark import last_formula_row, search_last_row, record_rows
+from II_MapResolver import maps_for, write_investment_categories
+from II_Metrics import run_metrics, stage, timed_stage, add_cells
 
-# File paths and constants
-config = load_config()
-excel_path = config.get("excel_path", DEFAULT_EXCEL_PATH)  # Use config.json with fallback
-csv_path = INVESTMENTS_CSV_PATH
-sheet_name = INVESTMENTS_SHEET
-start_cell = INVESTMENTS_START_CELL
-
-# Rest of the script remains unchanged
-...
-def clear_excel_range(file_path, sheet_name, start_cell):
+def clear_sheet_range(ws, start_cell):
     """
-    Clears the content of the Excel sheet starting from the specified cell
-    (B2) to the extent of the current region, preserving headers and formatting.
+    Clears the content of a worksheet starting from the specified cell (B2) to the
+    extent of the current region, preserving headers and formatting. In memory only.
     """
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Excel file not found at: {file_path}")
-    
-    wb = load_workbook(file_path)
-    ws = wb[sheet_name]
-    
     start_col = ws[start_cell].column
     start_row = 2
-    
+
     max_row = ws.max_row
     max_col = ws.max_column
-    
+
     for row in range(start_row, max_row + 1):
         for col in range(start_col, max_col + 1):
             ws.cell(row=row, column=col).value = None  # Clear value only, preserve formatting
-    
-    wb.save(file_path)
-    wb.close()
-    print(f"Successfully cleared the data range starting from {start_cell} in sheet '{sheet_name}' of {file_path}, preserving headers and formatting.")
-
-def clean_price_or_avg_price(value, is_first_row=False):
-    """
-    Custom cleaning for 'Price' column.
-    - First row: Remove $ if present.
-    - Other rows: Remove 'p' suffix if numeric.
-    - Preserve non-numeric strings.
-    """
-    if pd.isna(value):
-        return value
-    value_str = str(value).strip()
-    
-    if not value_str.replace('$', '').replace('p', '').replace('-', '').replace('.', '').replace(',', '').isdigit():
-        return value_str
-    
-    if is_first_row:
-        value_str = value_str.replace('$', '')
-    else:
-        value_str = value_str.replace('p', '')
-    
-    value_str = value_str.replace(',', '')
-    try:
-        return float(value_str)
-    except ValueError:
-        return value_str
 
-def clean_percentage(value):
+def clear_excel_range(file_path, sheet_name, start_cell):
     """
-    Clean percentage columns ('Day Gain/Loss %', 'Gain/Loss %').
-    Remove % suffix and convert to float, handling - prefix.
+    Clears the content of the Excel sheet starting from the specified cell
+    (B2) to the extent of the current region, preserving headers and formatting.
     """
-    if pd.isna(value):
-        return value
-    value_str = str(value).strip()
-    value_str = value_str.replace('%', '').replace(',', '')
-    try:
-        return float(value_str)
-    except ValueError:
-        return value_str
+    with WorkbookSession(file_path) as session:
+        clear_sheet_range(session.sheet(sheet_name), start_cell)
+        session.mark_dirty()
+    print(f"Successfully cleared the data range starting from {start_cell} in sheet '{sheet_name}' of {file_path}, preserving headers and formatting.")
 
 def populate_formulas(sheet, start_row, end_row, source_row=None):
     """
     Populate column A with the formula from start_row to end_row, copying formatting
     from source_row (defaults to start_row - 1 or row 2 if not specified).
     """
-    formula = INVESTMENTS_FORMULA
     # Determine source row for formatting (use row above start_row or row 2)
     source_row = source_row or (start_row - 1 if start_row > 2 else 2)
-    source_cell = sheet[f'A{source_row}']
     
-    for row in range(start_row, end_row + 1):
-        cell = sheet[f'A{row}']
-        cell.value = formula.format(row=row)
-        # Copy formatting from source_cell
-        cell.number_format = source_cell.number_format
-        cell.fill = copy.copy(source_cell.fill) if source_cell.fill else PatternFill()
+    write_formulas(sheet, INVESTMENTS_FORMULA, start_row, end_row)
+    # Copy formatting from the source cell, captured once as style IDs
+    template = template_row_styles(sheet, source_row, INVESTMENTS_MAX_COLUMN)
+    apply_row_styles(sheet, template, start_row, end_row)
             
     print(f"Formula populated in column A from row {start_row} to {end_row}, "
           f"with formatting copied from A{source_row}")
 
-def import_csv_to_excel(csv_path, excel_path, sheet_name, start_cell):
-    """
-    Imports data from a CSV file to an Excel sheet starting at the specified cell (B2),
-    applies formulas with copied formatting in column A, preserves existing formatting elsewhere,
-    and saves the workbook.
-    """
+def load_investments_csv(csv_path):
+    """Read and clean an Investments.csv download."""
     if not os.path.exists(csv_path):
         raise FileNotFoundError(f"CSV file not found at: {csv_path}")
-    
-    # Load workbook
-    try:
-        wb = openpyxl.load_workbook(excel_path)
-    except FileNotFoundError:
-        raise FileNotFoundError(f"Excel file not found at: {excel_path}")
-    
-    if sheet_name not in wb.sheetnames:
-        raise ValueError(f"Sheet '{sheet_name}' not found in the workbook")
-    
-    ws = wb[sheet_name]
-    
-    # Clear existing data range, preserving formatting
-    clear_excel_range(excel_path, sheet_name, start_cell)
-    
-    # Reload workbook after clearing
-    wb = openpyxl.load_workbook(excel_path)
-    ws = wb[sheet_name]
-    
-    # Read and clean CSV data
+
     print("Reading CSV file...")
-    df = pd.read_csv(csv_path, encoding='utf-8-sig')
+    with stage('investments_csv_read') as current:
+        df = pd.read_csv(csv_path, encoding='utf-8-sig')
+        current.rows = len(df)
     print(f"CSV rows read: {len(df)}")
     
+    with stage('investments_clean') as current:
+        current.rows = len(df)
+        df = clean_investments(df)
+    return df
+
+
+def clean_investments(df):
+    """Parse the amount columns of an Investments.csv frame."""
     df.columns = df.columns.str.replace('\ufeff', '')
     print("Column names in CSV:", list(df.columns))
     
     df = df.replace('n/a', '')
     
-    # Define numeric columns for cleaning (but not for formatting)
-    numeric_columns = [
-        'Price', 'Day Gain/Loss', 'Day Gain/Loss %', 'Market Value £',
-        'Book Cost', 'Gain/Loss', 'Gain/Loss %'
-    ]
-    numeric_columns = [col for col in numeric_columns if col in df.columns]
+    # Define amount columns for cleaning (but not for formatting)
+    numeric_columns = [col for col in INVESTMENTS_AMOUNT_COLUMNS if col in df.columns]
     print("Processing numeric columns:", numeric_columns)
     
-    # Clean numeric columns
+    # Parse each amount column in one pass: £/$/p/% and thousands separators stripped,
+    # pence converted to pounds, and the currency or % kept in a '<column> Unit' column.
+    # Cells that are not amounts, such as the Totals/GBP/USD footer labels, are left as they are.
     for col in numeric_columns:
-        if col == 'Price':
-            df[col] = [clean_price_or_avg_price(val, is_first_row=(idx == 0)) for idx, val in enumerate(df[col])]
-        elif col in ['Day Gain/Loss %', 'Gain/Loss %']:
-            df[col] = df[col].apply(clean_percentage)
-        else:
-            df[col] = df[col].replace('[\£\$,]', '', regex=True).replace('', None)
-            df[col] = pd.to_numeric(df[col], errors='coerce').astype(float, errors='ignore')
-    
-    # Write DataFrame to Excel, preserving existing formatting
+        values, units = parse_amount_column(df[col])
+        labels = values.isna() & df[col].notna() & (df[col] != '')
+        df[col] = values.astype(object).where(~labels, df[col]) if labels.any() else values
+        df[col + UNIT_COLUMN_SUFFIX] = units
+    return df
+
+
+def sheet_columns(df):
+    """The columns of an Investments frame that are written to the sheet (not the unit columns)."""
+    return df[[col for col in df.columns if not str(col).endswith(UNIT_COLUMN_SUFFIX)]]
+
+
+def sheet_data_rows(ws, start_row, start_col, width):
+    """
+    The rows of the data range that hold any value, as {row: [values]}. Only the stored
+    cells are visited, not ws.max_row × ws.max_column, which formatting often inflates.
+    """
+    rows = {}
+    for (row, col), cell in ws._cells.items():
+        if row >= start_row and start_col <= col < start_col + width and cell.value is not None:
+            rows.setdefault(row, [None] * width)[col - start_col] = cell.value
+    return rows
+
+
+def investment_row_key(values, label_index):
+    """Key of an Investments row: its Symbol, or ('footer', label) for the Totals/GBP/USD rows."""
+    if values[0] is not None:
+        return values[0]
+    if label_index is not None and values[label_index] is not None:
+        return ('footer', values[label_index])
+    return None
+
+
+def place_investment_rows(existing, keys, footer_count, start_row, label_index):
+    """
+    Target sheet row of each incoming row, given the existing {row: values} and the incoming
+    holding keys. Holdings already in the sheet keep their row; new holdings, then holdings
+    left below the block, fill the rows freed by removed holdings, so the holdings stay
+    contiguous from start_row. The footer rows follow them in CSV order.
+    """
+    holdings = len(keys)
+    old_rows = {}
+    for row in sorted(existing):
+        key = investment_row_key(existing[row], label_index)
+        if key is not None and not isinstance(key, tuple):
+            old_rows.setdefault(key, row)
+    if len(set(keys)) != holdings:  # Duplicate symbols cannot be matched; keep the CSV order
+        old_rows = {}
+
+    block = range(start_row, start_row + holdings)
+    targets = [old_rows.get(key) for key in keys]
+    targets = [row if row in block else None for row in targets]
+    free = iter(sorted(set(block) - set(row for row in targets if row is not None)))
+    new = [i for i, key in enumerate(keys) if key not in old_rows]
+    moved = sorted((i for i, row in enumerate(targets) if row is None and keys[i] in old_rows),
+                   key=lambda i: old_rows[keys[i]], reverse=True)
+    for i in new + moved:
+        targets[i] = next(free)
+    return targets + list(range(start_row + holdings, start_row + holdings + footer_count)), len(new), len(moved)
+
+
+@timed_stage('investments_refresh')
+def refresh_investments(session, df, sheet_name=INVESTMENTS_SHEET, start_cell=INVESTMENTS_START_CELL):
+    """
+    Refresh the holdings in the Investments sheet of an open WorkbookSession from df,
+    starting at start_cell (B2), and apply formulas with copied formatting in column A.
+    The sheet is compared with df by Symbol (the footer rows by their label): only cells
+    whose value changed are written, new holdings take the rows of removed ones or are
+    appended, and only rows no longer present are cleared. Existing formatting is
+    preserved. Nothing is saved here.
+    """
+    ws = session.sheet(sheet_name)
+    frame = sheet_columns(df)
     start_col = ws[start_cell].column
     start_row = ws[start_cell].row
+    width = len(frame.columns)
+    label_index = list(frame.columns).index('Price') if 'Price' in frame.columns else None
+
+    existing = sheet_data_rows(ws, start_row, start_col, width)
+    incoming = list(frame_rows(frame))
+    holding_rows = [values for values in incoming if values[0] is not None]
+    footer_rows = [values for values in incoming if values[0] is None and investment_row_key(values, label_index)]
+    targets, added, moved = place_investment_rows(existing, [values[0] for values in holding_rows],
+                                                  len(footer_rows), start_row, label_index)
+
+    # Write only the cells that differ from the sheet, then clear the rows left over
+    cells = 0
+    for row, values in zip(targets, holding_rows + footer_rows):
+        old = existing.pop(row, [None] * width)
+        for i, value in enumerate(values):
+            if value != old[i]:
+                ws.cell(row=row, column=start_col + i).value = value
+                cells += 1
+    removed = sum(1 for values in existing.values() if values[0] is not None)
+    for row, values in existing.items():
+        for i, value in enumerate(values):
+            if value is not None:
+                ws.cell(row=row, column=start_col + i).value = None
+                cells += 1
+    add_cells(cells)
+    print(f"Investments sheet: {cells} cells changed, {added} holdings added, {removed} removed, {moved} moved")
+
+    last_row = start_row + len(holding_rows) - 1
     
-    for r_idx, row in enumerate(df.itertuples(index=False), start=start_row):
-        for c_idx, value in enumerate(row, start=start_col):
-            cell = ws.cell(row=r_idx, column=c_idx)
-            cell.value = value  # Write value only, preserve existing formatting
-    
-    # Find the last row with data in the imported data
-    last_row = ws.max_row
-    for row in range(last_row, 1, -1):
-        if ws[f'B{row}'].value is not None:
-            last_row = row
-            break
-    
-    # Find the first empty cell in column A
-    first_empty_row = 2
-    for row in range(2, last_row + 1):
-        if ws[f'A{row}'].value is None:
-            first_empty_row = row
-            break
+    # First empty cell in column A follows the last formula row (workbook watermark)
+    formula_row = last_formula_row(ws)
+    first_empty_row = formula_row + 1
     
-    # Populate formulas in column A, copying formatting from the row above or row 2
-    populate_formulas(ws, first_empty_row, last_row)
+    if session.category_mode == CATEGORY_MODE_VALUE:
+        # Resolve column A for every holding (only cells whose category changed are written,
+        # so edits to MapName still reach unchanged holdings), and clear values left by an
+        # earlier, longer list (formulas there already show "")
+        write_investment_categories(ws, maps_for(session), start_row, last_row)
+        for (row, col), cell in list(ws._cells.items()):
+            if col == 1 and row > last_row and cell.value is not None and not str(cell.value).startswith('='):
+                cell.value = None
+        if first_empty_row <= last_row:
+            template = template_row_styles(ws, first_empty_row - 1 if first_empty_row > 2 else 2,
+                                           INVESTMENTS_MAX_COLUMN)
+            apply_row_styles(ws, template, first_empty_row, last_row)
+        print(f"Categories resolved in column A from row {start_row} to {last_row}")
+        record_rows(ws, formula_row=search_last_row(ws, 'A'))
+    else:
+        # Populate formulas in column A, copying formatting from the row above or row 2
+        if first_empty_row <= last_row:
+            populate_formulas(ws, first_empty_row, last_row)
+        record_rows(ws, formula_row=max(formula_row, last_row))
+    session.mark_dirty()
+
+    if session.ledger is not None:
+        session.ledger.stage_investments(df, workbook_date(session.excel_path), session.account)
+        session.on_save(session.ledger.commit)
+    if session.snapshots is not None:
+        as_of = workbook_date(session.excel_path)
+        session.on_save(lambda: session.snapshots.append(df, as_of))
+    return first_empty_row
+
+def import_csv_to_excel(csv_path, excel_path, sheet_name, start_cell, ledger=None, account=DEFAULT_ACCOUNT,
+                        category_mode=CATEGORY_MODE_FORMULA, snapshots=None):
+    """
+    Imports data from a CSV file to an Excel sheet starting at the specified cell (B2),
+    applies formulas with copied formatting in column A, preserves existing formatting elsewhere,
+    and saves the workbook. The workbook is loaded and saved once; if an II_Ledger.Ledger
+    is given the holdings are also recorded there as a snapshot for the workbook's date,
+    as they are in an II_Snapshots.SnapshotStore if one is given.
+    With category_mode=CATEGORY_MODE_VALUE column A gets the resolved values instead.
+    """
+    df = load_investments_csv(csv_path)
     
-    # Save the workbook
+    with WorkbookSession(excel_path, ledger, account, category_mode, snapshots) as session:
+        first_empty_row = refresh_investments(session, df, sheet_name, start_cell)
+    print(f"Successfully imported data from {csv_path} to sheet '{sheet_name}' starting at {start_cell} in {excel_path}, "
+          f"with column A formatting copied from A{first_empty_row - 1 if first_empty_row > 2 else 2}.")
+
+if __name__ == "__main__":
+    # File paths and constants
+    config = load_config()
+    excel_path = config.get("excel_path", DEFAULT_EXCEL_PATH)  # Use config.json with fallback
+    csv_path = INVESTMENTS_CSV_PATH
+    sheet_name = INVESTMENTS_SHEET
+    start_cell = INVESTMENTS_START_CELL
+
+    ledger = open_ledger(config)
+    account = config.get("account", DEFAULT_ACCOUNT)
+    snapshots = open_snapshots(config, account)
+
+    # Execute the import
     try:
-        wb.save(excel_path)
-        wb.close()
-        print(f"Successfully imported data from {csv_path} to sheet '{sheet_name}' starting at {start_cell} in {excel_path}, "
-              f"with column A formatting copied from A{first_empty_row - 1 if first_empty_row > 2 else 2}.")
-    except PermissionError:
-        raise PermissionError(f"Permission denied when saving {excel_path}. Ensure the file is not open in another application.")
-
-# Execute the import
-try:
-    import_csv_to_excel(csv_path, excel_path, sheet_name, start_cell='B2')
-except FileNotFoundError as e:
-    print(f"Error: {e}")
-except PermissionError as e:
-    print(f"Error: {e}")
-except ValueError as e:
-    print(f"Error: {e}")
-except Exception as e:
-    print(f"An unexpected error occurred: {str(e)}")
-    import sys
-    sys.exit(1)
\ No newline at end of file
+        with run_metrics('import_investments', excel_path, profile=config.get("profile", False)):
+            import_csv_to_excel(csv_path, excel_path, sheet_name, start_cell='B2',
+                                ledger=ledger, account=account,
+                                category_mode=config.get("category_mode", CATEGORY_MODE_FORMULA),
+                                snapshots=snapshots)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except PermissionError as e:
+        print(f"Error: {e}")
+    except ValueError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
+        import sys
+        sys.exit(1)
+    finally:
+        if ledger is not None:
+            ledger.close()
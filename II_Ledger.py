@@ -0,0 +1,235 @@
+# II_Ledger.py
+import os
+import re
+import sqlite3
+from datetime import datetime
+import pandas as pd
+from II_Constants import (
+    DEFAULT_BASE_PATH, DEFAULT_ACCOUNT, LEDGER_FILENAME, LEDGER_LOCK_TIMEOUT,
+    TRANSACTIONS_COLUMNS, INVESTMENTS_COLUMNS
+)
+
+# Store column names for the CSV columns, in sheet order
+TRANSACTION_FIELDS = [
+    'date', 'settlement_date', 'symbol', 'sedol', 'quantity', 'price',
+    'description', 'reference', 'debit', 'credit', 'running_balance'
+]
+INVESTMENT_FIELDS = [
+    'symbol', 'name', 'qty', 'price', 'day_gain', 'day_gain_pct', 'market_value_gbp',
+    'market_value', 'book_cost', 'gain', 'gain_pct', 'average_price'
+]
+DATE_FIELDS = {'date', 'settlement_date'}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS transactions (
+    seq INTEGER PRIMARY KEY,
+    account TEXT NOT NULL,
+    key TEXT NOT NULL,
+    period TEXT,
+    {', '.join(TRANSACTION_FIELDS)},
+    UNIQUE (account, key)
+);
+CREATE INDEX IF NOT EXISTS transactions_period ON transactions (account, period, date);
+CREATE INDEX IF NOT EXISTS transactions_symbol ON transactions (symbol, date);
+CREATE TABLE IF NOT EXISTS investments (
+    account TEXT NOT NULL,
+    as_of TEXT NOT NULL,
+    row_order INTEGER NOT NULL,
+    {', '.join(INVESTMENT_FIELDS)},
+    PRIMARY KEY (account, as_of, row_order)
+);
+CREATE INDEX IF NOT EXISTS investments_symbol ON investments (symbol, as_of);
+"""
+
+
+def ledger_path_for(config):
+    """Ledger location: config "ledger_path", else II_Ledger.sqlite in the base folder."""
+    return config.get("ledger_path") or os.path.join(config.get("base_path", DEFAULT_BASE_PATH), LEDGER_FILENAME)
+
+
+def open_ledger(config):
+    """Open the ledger configured in config.json, or return None if its folder does not exist."""
+    path = ledger_path_for(config)
+    if not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+        print(f"Warning: Ledger folder not found for {path}. Rows will not be recorded in the ledger.")
+        return None
+    return Ledger(path)
+
+
+def workbook_date(excel_path):
+    """Business date of an II_YYYYMMDD.xlsx workbook, or today if the name has no date."""
+    match = re.search(r'II_(\d{8})', os.path.basename(excel_path))
+    if match:
+        try:
+            return datetime.strptime(match.group(1), "%Y%m%d").strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+def _store_value(field, value):
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if field in DATE_FIELDS and hasattr(value, 'strftime'):
+        return value.strftime("%Y-%m-%d")
+    if hasattr(value, 'item'):  # numpy scalars
+        return value.item()
+    return value
+
+
+class Ledger:
+    """
+    SQLite store of normalized Transactions and Investments rows, per account.
+    Transactions are keyed by the dedup key (see II_TransactionIndex) and carry a
+    YYYY-MM period column that, with its index, partitions them by date; Investments
+    are stored as one snapshot per account and business date. Writes are staged in
+    memory and written in one short SQLite transaction by commit(), which the importers
+    call once the workbook has been saved, so the database is not locked against the
+    other accounts' imports while a workbook loads or saves.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=LEDGER_LOCK_TIMEOUT)
+        self.conn.executescript(SCHEMA)
+        self._staged = []  # (sql, parameter rows) to write on commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        self.close()
+        return False
+
+    def commit(self):
+        """Write the staged rows in one transaction."""
+        staged, self._staged = self._staged, []
+        with self.conn:
+            for sql, params in staged:
+                self.conn.executemany(sql, params)
+
+    def rollback(self):
+        """Drop the rows staged since the last commit (an import that failed before its save)."""
+        self._staged = []
+
+    def close(self):
+        self.conn.close()
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+    def stage_transactions(self, rows, keys, account=DEFAULT_ACCOUNT):
+        """Stage Transactions rows (tuples in sheet column order) with their dedup keys."""
+        placeholders = ', '.join('?' * (len(TRANSACTION_FIELDS) + 3))
+        sql = (f"INSERT OR IGNORE INTO transactions (account, key, period, {', '.join(TRANSACTION_FIELDS)}) "
+               f"VALUES ({placeholders})")
+
+        def records():
+            for row, key in zip(rows, keys):
+                values = [_store_value(field, value) for field, value in zip(TRANSACTION_FIELDS, row)]
+                period = values[0][:7] if values[0] else None
+                yield [account, key, period] + values
+
+        self._staged.append((sql, list(records())))
+
+    def stage_investments(self, df, as_of, account=DEFAULT_ACCOUNT):
+        """Stage an Investments snapshot, replacing any earlier snapshot for the same date."""
+        self._staged.append(("DELETE FROM investments WHERE account = ? AND as_of = ?", [(account, as_of)]))
+        columns = [col for col in INVESTMENTS_COLUMNS if col in df.columns]
+        fields = [INVESTMENT_FIELDS[INVESTMENTS_COLUMNS.index(col)] for col in columns]
+        holdings = df[df['Symbol'].notna() & (df['Symbol'] != '')] if 'Symbol' in df.columns else df
+        sql = (f"INSERT INTO investments (account, as_of, row_order, {', '.join(fields)}) "
+               f"VALUES ({', '.join('?' * (len(fields) + 3))})")
+        self._staged.append((sql, [
+            [account, as_of, order] + [_store_value(field, value) for field, value in zip(fields, row)]
+            for order, row in enumerate(holdings[columns].itertuples(index=False, name=None))
+        ]))
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def query_transactions(self, symbol=None, start=None, end=None, account=None):
+        """
+        Return Transactions as a DataFrame with the CSV column names, in import order,
+        filtered by symbol, inclusive date range (anything pd.Timestamp accepts) and account.
+        """
+        clauses, params = [], []
+        if account is not None:
+            clauses.append("account = ?")
+            params.append(account)
+        if symbol is not None:
+            clauses.append("symbol = ?")
+            params.append(symbol)
+        if start is not None:
+            clauses.append("date >= ?")
+            params.append(pd.Timestamp(start).strftime("%Y-%m-%d"))
+        if end is not None:
+            clauses.append("date <= ?")
+            params.append(pd.Timestamp(end).strftime("%Y-%m-%d"))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        df = pd.read_sql_query(
+            f"SELECT account, {', '.join(TRANSACTION_FIELDS)} FROM transactions {where} ORDER BY seq",
+            self.conn, params=params)
+        df.columns = ['Account'] + TRANSACTIONS_COLUMNS
+        for col in ('Date', 'Settlement Date'):
+            df[col] = pd.to_datetime(df[col], format="%Y-%m-%d")
+        return df
+
+    def transactions_after(self, seq, account=None):
+        """
+        Transactions stored after ledger sequence number seq (0 for all), in import order,
+        with the CSV column names and their 'Seq', for consumers that keep their own state.
+        """
+        clauses, params = ["seq > ?"], [seq]
+        if account is not None:
+            clauses.append("account = ?")
+            params.append(account)
+        df = pd.read_sql_query(
+            f"SELECT seq, {', '.join(TRANSACTION_FIELDS)} FROM transactions WHERE {' AND '.join(clauses)} ORDER BY seq",
+            self.conn, params=params)
+        df.columns = ['Seq'] + TRANSACTIONS_COLUMNS
+        for col in ('Date', 'Settlement Date'):
+            df[col] = pd.to_datetime(df[col], format="%Y-%m-%d")
+        return df
+
+    def query_investments(self, as_of=None, symbol=None, account=None):
+        """
+        Return holdings snapshots with the CSV column names. as_of selects the latest
+        snapshot on or before that date (default: the latest of all).
+        """
+        clauses, params = [], []
+        if account is not None:
+            clauses.append("account = ?")
+            params.append(account)
+        if symbol is not None:
+            clauses.append("symbol = ?")
+            params.append(symbol)
+        latest = "SELECT MAX(as_of) FROM investments i2 WHERE i2.account = investments.account"
+        if as_of is not None:
+            latest += " AND i2.as_of <= ?"
+            params.append(pd.Timestamp(as_of).strftime("%Y-%m-%d"))
+        clauses.append(f"as_of = ({latest})")
+        df = pd.read_sql_query(
+            f"SELECT account, as_of, {', '.join(INVESTMENT_FIELDS)} FROM investments "
+            f"WHERE {' AND '.join(clauses)} ORDER BY account, row_order",
+            self.conn, params=params)
+        df.columns = ['Account', 'As Of'] + INVESTMENTS_COLUMNS
+        df['As Of'] = pd.to_datetime(df['As Of'], format="%Y-%m-%d")
+        return df
+
+    def symbol_quantities(self, account=None):
+        """Summed Transactions Quantity per Symbol (Sedol where there is no Symbol), as a Series."""
+        clauses, params = ["quantity IS NOT NULL"], []
+        if account is not None:
+            clauses.append("account = ?")
+            params.append(account)
+        df = pd.read_sql_query(
+            f"SELECT COALESCE(symbol, sedol) AS holding, SUM(quantity) AS quantity FROM transactions "
+            f"WHERE {' AND '.join(clauses)} GROUP BY holding",
+            self.conn, params=params)
+        return df.dropna(subset=['holding']).set_index('holding')['quantity']
+
+    def accounts(self):
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT account FROM transactions ORDER BY account")]
@@ -0,0 +1,119 @@
+# II_LedgerView.py
+import argparse
+import openpyxl
+import pandas as pd
+from II_Constants import (
+    DEFAULT_EXCEL_PATH, DEFAULT_ACCOUNT, TRANSACTIONS_SHEET, TRANSACTIONS_MAX_COLUMN,
+    INVESTMENTS_SHEET, INVESTMENTS_COLUMNS, CATEGORY_MODE_FORMULA, CATEGORY_MODE_VALUE
+)
+from II_Config import load_config
+from II_Ledger import open_ledger, workbook_date
+from II_TransactionIndex import transaction_keys
+from II_Partition import load_history_frame, archived_years
+from II_InvestmentsImport import refresh_investments
+from II_TransactionsImport import write_transaction_rows
+from II_MapResolver import maps_for, write_transaction_categories
+from II_Watermark import last_data_row, last_formula_row, record_rows
+from II_WorkbookSession import WorkbookSession, frame_rows
+
+
+def seed_ledger(excel_path, ledger, account=DEFAULT_ACCOUNT):
+    """
+    Load the history already in a workbook into the ledger: every Transactions row
+    (keys that are already stored are ignored) and the current Investments sheet as
+    the snapshot for the workbook's date. The years archived out of a partitioned
+    workbook are included. Run once per account before relying on render_view.
+    """
+    transactions = load_history_frame(excel_path)
+    transactions = transactions[transactions['Date'].notna()]
+    ledger.stage_transactions(frame_rows(transactions), transaction_keys(transactions), account)
+
+    book = openpyxl.load_workbook(excel_path, read_only=True)
+    try:
+        rows = book[INVESTMENTS_SHEET].iter_rows(min_row=2, min_col=2, max_col=1 + len(INVESTMENTS_COLUMNS),
+                                                 values_only=True)
+        investments = pd.DataFrame(list(rows), columns=INVESTMENTS_COLUMNS)
+        ledger.stage_investments(investments, workbook_date(excel_path), account)
+    finally:
+        book.close()
+    ledger.commit()
+    print(f"Ledger seeded from {excel_path}: {len(transactions)} transactions for account '{account}'")
+
+
+def render_transactions(session, ledger, account=DEFAULT_ACCOUNT):
+    """
+    Regenerate the Transactions sheet data block (B:M) from the ledger, in import order.
+    Formulas and formatting are extended to any new rows and removed from rows that
+    are no longer used. Rows typed into the sheet by hand that are not in the ledger
+    are dropped, so this is an explicit command rather than part of every import.
+    The years archived out of a partitioned workbook (see II_Partition) stay archived.
+    With the session's category_mode set to values, column A of the rows kept from
+    before is resolved again too, since it described the rows that were there.
+    """
+    sheet = session.sheet(TRANSACTIONS_SHEET)
+    df = ledger.query_transactions(account=account).drop(columns=['Account'])
+    df = df[~pd.to_datetime(df['Date']).dt.year.isin(archived_years(session.book))]
+    old_last_row = last_data_row(sheet)
+    old_formula_row = last_formula_row(sheet)
+
+    for row in sheet.iter_rows(min_row=2, max_row=old_last_row, min_col=2, max_col=TRANSACTIONS_MAX_COLUMN):
+        for cell in row:
+            cell.value = None
+
+    last_row = write_transaction_rows(session, sheet, frame_rows(df), 1)
+    if session.category_mode == CATEGORY_MODE_VALUE and min(last_row, old_formula_row) >= 2:
+        write_transaction_categories(sheet, maps_for(session), 2, min(last_row, old_formula_row))
+    for row in range(last_row + 1, old_formula_row + 1):
+        sheet.cell(row=row, column=1).value = None
+    record_rows(sheet, data_row=last_row, formula_row=last_row)
+    session.mark_dirty()
+    print(f"Transactions sheet rendered from ledger: {len(df)} rows for account '{account}'")
+    return len(df)
+
+
+def render_investments(session, ledger, account=DEFAULT_ACCOUNT, as_of=None):
+    """Regenerate the Investments sheet from the latest ledger snapshot on or before as_of."""
+    df = ledger.query_investments(as_of=as_of, account=account).drop(columns=['Account', 'As Of'])
+    refresh_investments(session, df)
+    print(f"Investments sheet rendered from ledger: {len(df)} holdings for account '{account}'")
+    return len(df)
+
+
+def render_view(excel_path, ledger, account=DEFAULT_ACCOUNT, category_mode=CATEGORY_MODE_FORMULA):
+    """
+    Render both sheets of a workbook from the ledger with one load and one save, column A
+    filled as category_mode says (see WorkbookSession).
+    """
+    with WorkbookSession(excel_path, category_mode=category_mode) as session:
+        render_transactions(session, ledger, account)
+        render_investments(session, ledger, account)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the ledger from a workbook, or render a workbook from it")
+    parser.add_argument('action', choices=['seed', 'render'])
+    args = parser.parse_args()
+
+    config = load_config()
+    excel_path = config.get("excel_path", DEFAULT_EXCEL_PATH)  # Use config.json with fallback
+    account = config.get("account", DEFAULT_ACCOUNT)
+    ledger = open_ledger(config)
+
+    try:
+        if ledger is None:
+            raise FileNotFoundError("Ledger not available")
+        if args.action == 'seed':
+            seed_ledger(excel_path, ledger, account)
+        else:
+            render_view(excel_path, ledger, account, config.get("category_mode", CATEGORY_MODE_FORMULA))
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except PermissionError as e:
+        print(f"Error: {e}")
+    except ValueError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
+    finally:
+        if ledger is not None:
+            ledger.close()
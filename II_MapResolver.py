@@ -0,0 +1,161 @@
+# II_MapResolver.py
+import argparse
+from openpyxl.utils import column_index_from_string
+from II_Constants import (
+    DEFAULT_EXCEL_PATH, TRANSACTIONS_SHEET, INVESTMENTS_SHEET, MAPNAME_SHEET, MAPEDGECASES_SHEET,
+    CATEGORY_NOT_FOUND
+)
+from II_Config import load_config
+from II_WorkbookSession import WorkbookSession
+from II_Watermark import last_formula_row, search_last_row, record_rows
+
+
+def lookup_key(value):
+    """
+    Key for an exact-match VLOOKUP: text matches case-insensitively and only text,
+    numbers only numbers. Empty cells never match.
+    """
+    if value is None or (isinstance(value, str) and not value):
+        return None
+    if isinstance(value, str):
+        return ('s', value.lower())
+    if isinstance(value, bool):
+        return ('b', value)
+    if isinstance(value, (int, float)):
+        return ('n', float(value))
+    return ('s', str(value).lower())
+
+
+def load_map(sheet, value_column):
+    """
+    Load a lookup sheet into a dict of column A key -> value_column value. The whole
+    column is used, header included, and the first match wins, as with VLOOKUP(...,A:D,n,0).
+    An empty result cell resolves to 0, which is what VLOOKUP returns for it.
+    """
+    mapping = {}
+    for row in sheet.iter_rows(min_col=1, max_col=value_column, values_only=True):
+        key = lookup_key(row[0])
+        if key is not None and key not in mapping:
+            value = row[value_column - 1]
+            mapping[key] = 0 if value is None else value
+    return mapping
+
+
+class CategoryMaps:
+    """
+    MapName and MapEdgeCases loaded once into dicts, resolving the column A category
+    of each row exactly as TRANSACTIONS_FORMULA and INVESTMENTS_FORMULA do.
+    """
+
+    def __init__(self, names, edge_cases):
+        self.names = names
+        self.edge_cases = edge_cases
+
+    @classmethod
+    def from_workbook(cls, book):
+        for name in (MAPNAME_SHEET, MAPEDGECASES_SHEET):
+            if name not in book.sheetnames:
+                raise ValueError(f"Sheet '{name}' not found in the workbook")
+        return cls(load_map(book[MAPNAME_SHEET], 4), load_map(book[MAPEDGECASES_SHEET], 2))
+
+    def transaction_category(self, symbol, description):
+        """MapName by Symbol (column D), else MapEdgeCases by Description (column H), else #N/A."""
+        value = self.names.get(lookup_key(symbol))
+        if value is None:
+            value = self.edge_cases.get(lookup_key(description), CATEGORY_NOT_FOUND)
+        return value
+
+    def investment_category(self, symbol):
+        """MapName by Symbol (column B), else an empty string."""
+        return self.names.get(lookup_key(symbol), "")
+
+
+def maps_for(session):
+    """The CategoryMaps of a WorkbookSession's workbook, loaded on first use and then reused."""
+    if session.category_maps is None:
+        session.category_maps = CategoryMaps.from_workbook(session.book)
+    return session.category_maps
+
+
+def _cell_value(sheet, row, column):
+    cell = sheet._cells.get((row, column))
+    return cell.value if cell is not None else None
+
+
+def write_transaction_categories(sheet, maps, start_row, end_row):
+    """Write the resolved category values into column A for rows start_row..end_row."""
+    symbol_col, description_col = column_index_from_string('D'), column_index_from_string('H')
+    for row in range(start_row, end_row + 1):
+        category = maps.transaction_category(_cell_value(sheet, row, symbol_col),
+                                             _cell_value(sheet, row, description_col))
+        sheet.cell(row=row, column=1, value=category)
+
+
+def write_investment_categories(sheet, maps, start_row, end_row):
+    """
+    Write the resolved category values into column A for rows start_row..end_row.
+    Rows without a Symbol (the footer rows, or rows past the holdings) are left empty.
+    Cells that already hold the category are not rewritten.
+    """
+    symbol_col = column_index_from_string('B')
+    for row in range(start_row, end_row + 1):
+        symbol = _cell_value(sheet, row, symbol_col)
+        category = maps.investment_category(symbol) if lookup_key(symbol) is not None else None
+        if _cell_value(sheet, row, 1) != category:
+            sheet.cell(row=row, column=1).value = category
+
+
+def _is_formula(value):
+    return isinstance(value, str) and value.startswith('=')
+
+
+def convert_formulas_to_values(session):
+    """
+    One-off conversion of an existing workbook: replace every column A lookup formula
+    in the Transactions and Investments sheets with its resolved value. Rows whose
+    column A already holds a value are left alone. Returns the number of cells converted.
+    """
+    maps = maps_for(session)
+    converted = 0
+
+    sheet = session.sheet(TRANSACTIONS_SHEET)
+    for row in range(2, last_formula_row(sheet) + 1):
+        if _is_formula(_cell_value(sheet, row, 1)):
+            write_transaction_categories(sheet, maps, row, row)
+            converted += 1
+    record_rows(sheet, formula_row=search_last_row(sheet, 'A'))
+    print(f"Transactions: {converted} column A formulas converted to values")
+
+    sheet = session.sheet(INVESTMENTS_SHEET)
+    investment_rows = 0
+    for row in range(2, sheet.max_row + 1):
+        if _is_formula(_cell_value(sheet, row, 1)):
+            write_investment_categories(sheet, maps, row, row)
+            investment_rows += 1
+    record_rows(sheet, formula_row=search_last_row(sheet, 'A'))
+    print(f"Investments: {investment_rows} column A formulas converted to values")
+
+    if converted or investment_rows:
+        session.mark_dirty()
+    return converted + investment_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replace the column A category formulas with their values")
+    parser.add_argument('excel_path', nargs='?', help="Workbook to convert (default: excel_path in config.json)")
+    args = parser.parse_args()
+
+    config = load_config()
+    excel_path = args.excel_path or config.get("excel_path", DEFAULT_EXCEL_PATH)  # Use config.json with fallback
+
+    try:
+        with WorkbookSession(excel_path) as session:
+            convert_formulas_to_values(session)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except PermissionError as e:
+        print(f"Error: {e}")
+    except ValueError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
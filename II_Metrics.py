@@ -0,0 +1,183 @@
+# II_Metrics.py
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from II_Constants import METRICS_FILENAME
+
+_current_run = None  # The RunMetrics being recorded, if any
+
+
+def peak_memory_bytes():
+    """Peak resident memory of this process in bytes, or None where it cannot be read."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024  # Linux reports KiB
+    except ImportError:
+        pass
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    except (ImportError, AttributeError, OSError):
+        pass
+    return None
+
+
+def file_size(path):
+    return os.path.getsize(path) if path and os.path.exists(path) else None
+
+
+class Stage:
+    """One timed stage of a run, with the rows and cells it handled."""
+
+    def __init__(self, name, offset):
+        self.name = name
+        self.offset = offset  # Seconds since the start of the run
+        self.seconds = None
+        self.rows = None
+        self.cells = 0
+
+    def as_dict(self):
+        return {'name': self.name, 'start': round(self.offset, 4), 'seconds': round(self.seconds, 4),
+                'rows': self.rows, 'cells': self.cells}
+
+
+class RunMetrics:
+    """
+    Metrics of one run of a script: its stages, peak memory and the workbook size
+    before and after. Written as one JSON line to the metrics file when the run ends.
+    """
+
+    def __init__(self, name, excel_path=None):
+        self.name = name
+        self.excel_path = excel_path
+        self.started = datetime.now()
+        self._start = time.perf_counter()
+        self.stages = []
+        self._open = []
+        self.workbook_bytes_before = file_size(excel_path)
+        self.workbook_bytes_after = None
+        self.error = None
+
+    @contextmanager
+    def stage(self, name):
+        stage = Stage(name, time.perf_counter() - self._start)
+        self.stages.append(stage)
+        self._open.append(stage)
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds = time.perf_counter() - start
+            self._open.remove(stage)
+
+    def add_cells(self, count):
+        """Count cell writes against the innermost open stage."""
+        if self._open:
+            self._open[-1].cells += count
+
+    def as_dict(self):
+        return {
+            'run': self.name, 'started': self.started.isoformat(timespec='seconds'),
+            'seconds': round(time.perf_counter() - self._start, 4), 'excel_path': self.excel_path,
+            'workbook_bytes_before': self.workbook_bytes_before, 'workbook_bytes_after': self.workbook_bytes_after,
+            'peak_memory_bytes': peak_memory_bytes(), 'error': self.error,
+            'stages': [stage.as_dict() for stage in self.stages],
+        }
+
+    def write(self, metrics_path=METRICS_FILENAME):
+        with open(metrics_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.as_dict()) + '\n')
+
+
+@contextmanager
+def run_metrics(name, excel_path=None, metrics_path=METRICS_FILENAME, profile=False):
+    """
+    Record a run: every stage() entered inside it is timed, and on exit one JSON record
+    is appended to metrics_path (next to roll_report.log), also when the run fails.
+    With profile=True the run is profiled with cProfile; the stats are saved next to
+    the metrics file and the top functions by cumulative time are printed.
+    """
+    global _current_run
+    run = RunMetrics(name, excel_path)
+    previous, _current_run = _current_run, run
+    profiler = cProfile.Profile() if profile else None
+    if profiler:
+        profiler.enable()
+    try:
+        yield run
+    except BaseException as e:
+        run.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        if profiler:
+            profiler.disable()
+        _current_run = previous
+        run.workbook_bytes_after = file_size(excel_path)
+        try:
+            run.write(metrics_path)
+            if profiler:
+                save_profile(profiler, name, os.path.dirname(os.path.abspath(metrics_path)))
+        except OSError as e:
+            print(f"Warning: Could not write metrics to {metrics_path}: {e}")
+
+
+def save_profile(profiler, name, folder):
+    path = os.path.join(folder, f"ii_profile_{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof")
+    profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(20)
+    print(out.getvalue())
+    print(f"Profile saved: {path} (open with python -m pstats or snakeviz)")
+
+
+@contextmanager
+def stage(name):
+    """Time a stage of the current run. Outside a run the stage is timed but not recorded."""
+    if _current_run is None:
+        current = Stage(name, 0.0)
+        start = time.perf_counter()
+        try:
+            yield current
+        finally:
+            current.seconds = time.perf_counter() - start
+        return
+    with _current_run.stage(name) as current:
+        yield current
+
+
+def timed_stage(name):
+    """Decorator form of stage()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_cells(count):
+    """Count cell writes against the innermost stage of the current run, if any."""
+    if _current_run is not None:
+        _current_run.add_cells(count)
@@ -0,0 +1,122 @@
+# II_MultiAccount.py
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from II_Constants import (
+    DEFAULT_EXCEL_PATH, DEFAULT_ACCOUNT, TRANSACTIONS_CSV_PATH, INVESTMENTS_CSV_PATH, CATEGORY_MODE_FORMULA
+)
+from II_Config import load_config
+from II_Ledger import open_ledger
+from II_Snapshots import open_snapshots
+from II_ImportAll import import_all
+from II_Metrics import run_metrics
+
+
+def account_configs(config):
+    """
+    Accounts to import, from the config.json "accounts" list:
+
+        "accounts": [
+            {"name": "trading", "excel_path": "...", "transactions_csv": "...", "investments_csv": "..."},
+            {"name": "isa", ...}
+        ]
+
+    Without an "accounts" list the top-level excel_path and the default CSV paths form
+    a single account. Each workbook may appear only once, since every worker saves
+    its own workbook. With more than one account each must name its own downloads,
+    or every account would import the same Transactions.csv into its workbook.
+    """
+    entries = config.get("accounts") or [{"name": config.get("account", DEFAULT_ACCOUNT)}]
+    if len(entries) > 1:
+        for entry in entries:
+            missing = [key for key in ("transactions_csv", "investments_csv") if not entry.get(key)]
+            if missing:
+                raise ValueError(f"Account '{entry.get('name', DEFAULT_ACCOUNT)}' in config.json needs its own "
+                                 f"{' and '.join(missing)}")
+    accounts = []
+    for entry in entries:
+        account = {
+            "name": entry.get("name", DEFAULT_ACCOUNT),
+            "excel_path": entry.get("excel_path", config.get("excel_path", DEFAULT_EXCEL_PATH)),
+            "transactions_csv": entry.get("transactions_csv", TRANSACTIONS_CSV_PATH),
+            "investments_csv": entry.get("investments_csv", INVESTMENTS_CSV_PATH),
+        }
+        accounts.append(account)
+
+    workbooks = [os.path.normcase(os.path.abspath(account["excel_path"])) for account in accounts]
+    if len(set(workbooks)) != len(workbooks):
+        raise ValueError("Each account in config.json must use its own workbook (excel_path)")
+    for key in ("transactions_csv", "investments_csv"):
+        downloads = [os.path.normcase(os.path.abspath(account[key])) for account in accounts]
+        if len(set(downloads)) != len(downloads):
+            raise ValueError(f"Each account in config.json must use its own download ({key})")
+    names = [account["name"] for account in accounts]
+    if len(set(names)) != len(names):
+        raise ValueError("Account names in config.json must be unique")
+    return accounts
+
+
+def import_account(config, account):
+    """
+    Worker: import one account's CSVs into its workbook. Errors are caught and
+    returned so that one bad file does not stop the other accounts.
+    """
+    start = time.perf_counter()
+    ledger = open_ledger(config)
+    error = None
+    try:
+        with run_metrics(f'import_account:{account["name"]}', account["excel_path"]):
+            import_all(account["excel_path"], account["transactions_csv"], account["investments_csv"],
+                       ledger=ledger, account=account["name"],
+                       category_mode=config.get("category_mode", CATEGORY_MODE_FORMULA),
+                       snapshots=open_snapshots(config, account["name"]))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        print(f"Error importing account '{account['name']}': {error}")
+    finally:
+        if ledger is not None:
+            ledger.close()
+    return {"name": account["name"], "seconds": time.perf_counter() - start, "error": error}
+
+
+def import_accounts(config, max_workers=None):
+    """
+    Import every configured account in parallel, one worker process per workbook.
+    Prints and returns a result per account: name, elapsed seconds and error (None on success).
+    """
+    accounts = account_configs(config)
+    max_workers = max_workers or config.get("max_workers") or min(len(accounts), os.cpu_count() or 1)
+    print(f"Importing {len(accounts)} account(s) with {max_workers} worker(s)...")
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(import_account, config, account): account for account in accounts}
+        for future in as_completed(futures):
+            account = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:  # The worker process itself died
+                result = {"name": account["name"], "seconds": None, "error": f"{type(e).__name__}: {e}"}
+            results.append(result)
+
+    print("\nAccount import summary:")
+    for result in sorted(results, key=lambda r: r["name"]):
+        seconds = f"{result['seconds']:7.2f}s" if result["seconds"] is not None else "      -"
+        status = "OK" if result["error"] is None else f"FAILED - {result['error']}"
+        print(f"  {result['name']:<20} {seconds}  {status}")
+    print(f"Total wall time: {time.perf_counter() - start:.2f}s")
+    return results
+
+
+if __name__ == "__main__":
+    config = load_config()
+
+    try:
+        results = import_accounts(config)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if any(result["error"] for result in results):
+        sys.exit(1)
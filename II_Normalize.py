@@ -0,0 +1,206 @@
+# II_Normalize.py
+import numpy as np
+import pandas as pd
+from II_Constants import (
+    TRANSACTIONS_DATE_FORMAT, TRANSACTIONS_DATE_COLUMNS, TRANSACTIONS_NUMERIC_COLUMNS,
+    TRANSACTIONS_TEXT_COLUMNS, TRANSACTIONS_NO_SIGN_FLIP_PREFIXES
+)
+from II_Metrics import stage
+
+# Characters an amount cell may contain, indexed by code point (anything above 255 is not one)
+AMOUNT_CHARACTERS = np.zeros(256, dtype=bool)
+AMOUNT_CHARACTERS[[0] + [ord(c) for c in '0123456789.-£$%p, ']] = True
+POWERS_OF_TEN = 10.0 ** np.arange(18)
+AMOUNT_UNITS = np.array([None, 'USD', 'GBP', '%'], dtype=object)
+
+# Explicit dtypes for read_csv: text columns stay strings, money columns are read as
+# strings so the £/comma cleanup below is a single vectorized pass per column.
+TRANSACTIONS_CSV_DTYPES = {col: str for col in
+                           TRANSACTIONS_TEXT_COLUMNS + TRANSACTIONS_DATE_COLUMNS + TRANSACTIONS_NUMERIC_COLUMNS}
+
+
+def read_transactions_csv(csv_path, **kwargs):
+    """Read a Transactions.csv download with explicit dtypes and BOM-free column names."""
+    df = pd.read_csv(csv_path, encoding='utf-8-sig', dtype=TRANSACTIONS_CSV_DTYPES, **kwargs)
+    if isinstance(df, pd.DataFrame):
+        df.columns = df.columns.str.replace('\ufeff', '')
+    return df
+
+
+def clean_numeric_column(series):
+    """Strip £ and thousands separators from a column and convert it to float."""
+    if series.dtype != object:
+        return series.astype(float)
+    cleaned = series.str.replace(r'[£,]', '', regex=True)
+    cleaned = cleaned.mask(cleaned == '')
+    try:
+        return pd.to_numeric(cleaned, errors='raise').astype(float)
+    except (ValueError, TypeError):
+        return cleaned  # Leave non-numeric columns as cleaned strings
+
+
+def clean_numeric_columns(df, columns):
+    """
+    Strip £ and thousands separators from several columns in a single pass.
+    The text columns are joined into one string so the stripping and float parsing
+    run in C rather than once per cell; any column that does not parse cleanly
+    falls back to clean_numeric_column.
+    """
+    text_columns = [col for col in columns if col in df.columns and df[col].dtype == object]
+    for col in columns:
+        if col in df.columns and col not in text_columns:
+            df[col] = df[col].astype(float)
+    if not text_columns:
+        return df
+
+    values = df[text_columns].to_numpy(dtype=object).ravel(order='F')
+    values[pd.isna(values)] = 'nan'
+    try:
+        text = '\x1f'.join(values).replace('£', '').replace(',', '')
+        parsed = np.array(text.split('\x1f'), dtype=np.float64).reshape(len(text_columns), len(df))
+    except (TypeError, ValueError):
+        for col in text_columns:
+            df[col] = clean_numeric_column(df[col])
+        return df
+
+    for i, col in enumerate(text_columns):
+        df[col] = pd.Series(parsed[i], index=df.index)
+    return df
+
+
+def parse_amount_column(series):
+    """
+    Parse a column of download amounts such as "£1,234.56", "-£79.20", "$69.29",
+    "3,054.00p" and "1.45%". Returns (values, units): values are floats with pence
+    converted to pounds, NaN for cells that are not amounts (empty cells, or labels
+    such as the Totals/GBP/USD footers); units are 'GBP', 'USD', '%', or None for
+    bare numbers and non-amounts.
+
+    The cells are laid out as a fixed-width array of code points and scanned one
+    character position at a time, so the work is a few numpy operations per position
+    rather than a Python call per cell. The digits are accumulated as an integer and
+    divided by a power of ten (two more for pence), which rounds exactly as float()
+    does for up to 15 digits: 0.681394, not 68.1394 / 100. The sign and the currency
+    symbol must come before the first digit and p or % can only end the cell, so a
+    malformed cell such as "5-3" or "1£2" is not an amount.
+    """
+    text = series.to_numpy().astype('U')
+    width = max(text.dtype.itemsize // 4, 1)
+    positions = text.view(np.uint32).reshape(len(text), width).T.copy()
+
+    mantissa = np.zeros(len(text), dtype=np.int64)
+    digits, decimals, dots, minus = (np.zeros(len(text), dtype=np.int64) for _ in range(4))
+    valid = np.ones(len(text), dtype=bool)
+    dollar, pound = np.zeros(len(text), dtype=bool), np.zeros(len(text), dtype=bool)
+    last = np.zeros(len(text), dtype=np.uint32)
+    ended = np.zeros(len(text), dtype=bool)  # After a p or %
+    for code in positions:
+        digit = (code >= ord('0')) & (code <= ord('9'))
+        prefix = (code == ord('-')) | (code == ord('£')) | (code == ord('$'))
+        valid &= ~(prefix & (digits > 0)) & ~(ended & (code != 0))
+        ended |= (code == ord('p')) | (code == ord('%'))
+        mantissa = np.where(digit, mantissa * 10 + (code.astype(np.int64) - ord('0')), mantissa)
+        digits += digit
+        decimals += digit & (dots > 0)
+        dots += code == ord('.')
+        minus += code == ord('-')
+        dollar |= code == ord('$')
+        pound |= code == ord('£')
+        valid &= AMOUNT_CHARACTERS[np.minimum(code, 255)]
+        last = np.where(code != 0, code, last)
+    valid &= (digits > 0) & (digits <= 15) & (dots <= 1) & (minus <= 1)
+
+    pence = last == ord('p')
+    values = np.where(minus > 0, -mantissa, mantissa) / POWERS_OF_TEN[np.minimum(decimals, 15) + 2 * pence]
+    values = pd.Series(np.where(valid, values, np.nan), index=series.index)
+    unit = np.select([dollar, pound | pence, last == ord('%')], [1, 2, 3], default=0)
+    units = pd.Series(AMOUNT_UNITS[np.where(valid, unit, 0)], index=series.index)
+    return values, units
+
+
+def parse_date_column(series, date_format=TRANSACTIONS_DATE_FORMAT):
+    """
+    Parse a dd/mm/yyyy column with an explicit format, falling back to dayfirst
+    inference only for the values the explicit format could not parse.
+    """
+    parsed = pd.to_datetime(series, format=date_format, errors='coerce')
+    retry = parsed.isna() & series.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(series[retry], dayfirst=True, errors='coerce')
+    return parsed
+
+
+def sign_rule_masks(df):
+    """
+    Return the boolean masks used by the sign rules:
+    - flip_quantity: Credit present and Description not starting with "Div"/"GROSS INTEREST"
+    - has_debit: Debit present
+    """
+    credit_present = (df['Credit'].notna() & (df['Credit'] != '')).to_numpy()
+    flip_quantity = credit_present.copy()
+    # Only the Credit rows need the (slower) string prefix test
+    descriptions = df['Description'].to_numpy()[credit_present].astype(str)
+    no_flip = np.zeros(len(descriptions), dtype=bool)
+    for prefix in TRANSACTIONS_NO_SIGN_FLIP_PREFIXES:
+        no_flip |= np.char.startswith(descriptions, prefix)
+    flip_quantity[credit_present] = ~no_flip
+    return pd.Series(flip_quantity, index=df.index), df['Debit'].notna()
+
+
+def normalize_transactions(df, sort=True):
+    """
+    Normalize a raw Transactions frame with vectorized column operations:
+    £/comma stripping, explicit-format date parsing, a stable sort by Date (same-day
+    rows keep their CSV order, which the chunked streaming mode relies on),
+    negative Quantity for sells (Credit rows that are not dividends/interest) and
+    negative Debit.
+    """
+    df = df.copy()
+    df.columns = df.columns.str.replace('\ufeff', '')
+
+    # 'n/a' cells need no per-cell replace: read_csv's default na_values already map them to NaN
+    # Clean numeric columns by removing currency symbols (£) and commas
+    df = clean_numeric_columns(df, TRANSACTIONS_NUMERIC_COLUMNS)
+
+    if 'Date' not in df.columns:
+        raise ValueError("Column 'Date' not found in CSV. Available columns: " + str(list(df.columns)))
+
+    try:
+        for col in TRANSACTIONS_DATE_COLUMNS:
+            if col not in df.columns:
+                print(f"Warning: '{col}' column not found in CSV. Available columns: " + str(list(df.columns)))
+                continue
+            df[col] = parse_date_column(df[col])
+            if df[col].isna().any():
+                print(f"Warning: Some dates in '{col}' could not be parsed. Invalid dates will be left as-is:")
+                print(df[df[col].isna()][[col]])
+
+        if sort:
+            df = df.sort_values(by='Date', ascending=True, na_position='last', kind='stable')
+    except Exception as e:
+        print(f"Warning: Failed to sort by Date or parse dates due to: {str(e)}. Proceeding without sorting.")
+
+    # Sign rules as boolean masks instead of row-wise lambdas
+    flip_quantity, has_debit = sign_rule_masks(df)
+    quantity = df['Quantity'].astype(float)
+    df['Quantity'] = quantity.where(~flip_quantity, -quantity)
+    df['Debit'] = (-df['Debit'].astype(float)).where(has_debit)
+
+    # Ensure Credit and Running Balance are float
+    for col in ['Credit', 'Running Balance']:
+        df[col] = df[col].astype(float, errors='ignore')
+    return df
+
+
+def load_transactions_csv(csv_path):
+    """Read and normalize a Transactions.csv download."""
+    print("Reading CSV file...")
+    with stage('transactions_csv_read') as current:
+        df = read_transactions_csv(csv_path)
+        current.rows = len(df)
+    print(f"CSV rows read: {len(df)}")
+    print("Column names in CSV:", list(df.columns))
+    print("Sorting data by Date...")
+    with stage('transactions_clean') as current:
+        current.rows = len(df)
+        return normalize_transactions(df)
@@ -0,0 +1,390 @@
+# II_Partition.py
+import argparse
+import os
+from copy import copy
+import openpyxl
+import pandas as pd
+from openpyxl.formula.translate import Translator
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+from II_Constants import (
+    DEFAULT_EXCEL_PATH, TRANSACTIONS_SHEET, TRANSACTIONS_COLUMNS, TRANSACTIONS_MAX_COLUMN,
+    ARCHIVE_FILENAME, ARCHIVE_SHEET, PARTITIONS_SHEET, PARTITION_COLUMNS, PARTITION_NAME_COLUMNS
+)
+from II_Config import load_config
+from II_Ledger import workbook_date
+from II_MapResolver import maps_for
+from II_Metrics import stage
+from II_Reader import FrameCache, TRANSACTIONS_DTYPES, workbook_stat, typed_frame, read_sheet_rows, load_transactions_frame
+from II_TransactionIndex import TransactionIndex, index_path_for, transaction_keys
+from II_Watermark import last_data_row, last_formula_row, search_last_row, record_rows
+from II_WorkbookSession import WorkbookSession
+
+PARTITION_DTYPES = {
+    'Year': 'float64', 'Archive': 'object', 'Sheet': 'object', 'Rows': 'float64', 'First Date': 'datetime64[ns]',
+    'Last Date': 'datetime64[ns]', 'Debit': 'float64', 'Credit': 'float64', 'Closing Balance': 'float64',
+}
+SHEET_COLUMNS = ['Name'] + TRANSACTIONS_COLUMNS + ['ISIN']  # A:M
+DATE_FORMAT = 'dd/mm/yy'
+AMOUNT_FORMAT = '#,##0.00_);[Red](#,##0.00)'
+
+
+def archive_path_for(excel_path, config=None):
+    """Archive workbook: config "archive_path", else II_Archive.xlsx next to the daily workbook."""
+    return (config or {}).get("archive_path") or os.path.join(os.path.dirname(os.path.abspath(excel_path)),
+                                                              ARCHIVE_FILENAME)
+
+
+def _resolve(excel_path, archive):
+    # Archives next to the daily workbook are recorded by name, so they follow the workbook when it is rolled
+    return os.path.join(os.path.dirname(os.path.abspath(excel_path)), archive)
+
+
+def _recorded(excel_path, archive_path):
+    folder = os.path.dirname(os.path.abspath(excel_path))
+    archive_path = os.path.abspath(archive_path)
+    return os.path.basename(archive_path) if os.path.dirname(archive_path) == folder else archive_path
+
+
+# ----------------------------------------------------------------------
+# Reading the partitions
+# ----------------------------------------------------------------------
+def partitions_frame(sheet):
+    """The year rows of a Years sheet (PARTITION_COLUMNS), oldest first."""
+    rows = [row for row in sheet.iter_rows(min_row=2, max_col=len(PARTITION_COLUMNS), values_only=True)
+            if row[0] is not None]
+    df = typed_frame(pd.DataFrame(rows, columns=PARTITION_COLUMNS), PARTITION_DTYPES)
+    df = df.astype({'Year': 'int64', 'Rows': 'int64'})
+    return df.sort_values('Year', kind='stable').reset_index(drop=True)
+
+
+def load_partitions(excel_path):
+    """
+    The archived years recorded in a daily workbook's Years sheet, empty when the
+    workbook has none. Cached next to the workbook as the frames of II_Reader are.
+    """
+    stat = workbook_stat(excel_path)
+    cache = FrameCache(excel_path, 'partitions', PARTITION_DTYPES)
+    df = cache.load(stat)
+    if df is None:
+        book = openpyxl.load_workbook(excel_path, read_only=True)
+        try:
+            if PARTITIONS_SHEET in book.sheetnames:
+                df = partitions_frame(book[PARTITIONS_SHEET])
+            else:
+                df = typed_frame(pd.DataFrame(columns=PARTITION_COLUMNS), PARTITION_DTYPES)
+        finally:
+            book.close()
+        cache.write(df, stat)
+    return df
+
+
+def archived_years(book):
+    """The years archived out of an open workbook (a set, empty without a Years sheet)."""
+    if PARTITIONS_SHEET not in book.sheetnames:
+        return set()
+    return set(partitions_frame(book[PARTITIONS_SHEET])['Year'].astype(int))
+
+
+def partitions_closing_balance(partitions):
+    """The Closing Balance of the latest archived year, or None."""
+    if partitions.empty:
+        return None
+    balance = partitions.loc[partitions['Last Date'].idxmax(), 'Closing Balance']
+    return None if pd.isna(balance) else float(balance)
+
+
+def archived_closing_balance(book):
+    """partitions_closing_balance() of an open workbook: the join for new rows when every row has been archived."""
+    return partitions_closing_balance(partitions_frame(book[PARTITIONS_SHEET])) if PARTITIONS_SHEET in book.sheetnames else None
+
+
+def _concat(frames):
+    frames = [df for df in frames if len(df)] or frames[:1]
+    if not frames:
+        return typed_frame(pd.DataFrame(columns=TRANSACTIONS_COLUMNS), TRANSACTIONS_DTYPES)
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    for col, dtype in TRANSACTIONS_DTYPES.items():
+        if dtype == 'category' and df[col].dtype != 'category':
+            df[col] = df[col].astype('category')
+    return df
+
+
+def load_archived_frame(excel_path, years=None, partitions=None):
+    """
+    The archived Transactions rows of a daily workbook (columns B:L, typed as
+    II_Reader.load_transactions_frame), oldest year first, optionally only the given
+    years. Each year sheet is cached next to its archive workbook.
+    """
+    partitions = load_partitions(excel_path) if partitions is None else partitions
+    frames = []
+    for year, archive, sheet_name in partitions[['Year', 'Archive', 'Sheet']].itertuples(index=False):
+        year = int(year)
+        if years is not None and year not in years:
+            continue
+        archive_path = _resolve(excel_path, archive)
+        if not os.path.exists(archive_path):
+            raise FileNotFoundError(f"Archive workbook for {year} not found at: {archive_path}")
+        stat = workbook_stat(archive_path)
+        cache = FrameCache(archive_path, f'transactions-{year}', TRANSACTIONS_DTYPES)
+        with stage(f'archive_{year}_frame') as current:
+            df = cache.load(stat)
+            if df is None:
+                df = typed_frame(read_sheet_rows(archive_path, sheet_name, TRANSACTIONS_COLUMNS), TRANSACTIONS_DTYPES)
+                cache.write(df, stat)
+            current.rows = len(df)
+        frames.append(df)
+    return _concat(frames)
+
+
+def load_history_frame(excel_path, start=None, end=None):
+    """
+    The whole Transactions history of a partitioned workbook: the archived years and
+    then the live sheet, as one typed frame. With start and/or end only the archived
+    years that overlap the (inclusive) date range are read, and rows outside it are
+    left out.
+    """
+    partitions = load_partitions(excel_path)
+    years = None
+    if start is not None or end is not None:
+        first = pd.Timestamp(start).year if start is not None else None
+        last = pd.Timestamp(end).year if end is not None else None
+        years = {int(year) for year in partitions['Year']
+                 if (first is None or year >= first) and (last is None or year <= last)}
+    df = _concat([load_archived_frame(excel_path, years, partitions), load_transactions_frame(excel_path)])
+    if start is not None:
+        df = df[df['Date'] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df['Date'] <= pd.Timestamp(end)]
+    return df.reset_index(drop=True) if years is not None else df
+
+
+# ----------------------------------------------------------------------
+# Archiving
+# ----------------------------------------------------------------------
+def _year_frame(sheet):
+    rows = list(sheet.iter_rows(min_row=2, max_col=TRANSACTIONS_MAX_COLUMN, values_only=True))
+    return pd.DataFrame(rows, columns=SHEET_COLUMNS)
+
+
+def _closing(df):
+    # The top row of the last date, as II_Reconcile.sheet_closing_balance
+    dates = pd.to_datetime(df['Date'], errors='coerce')
+    balance = pd.to_numeric(df['Running Balance'], errors='coerce')
+    last = balance[(dates == dates.max()) & balance.notna()]
+    return float(last.iloc[0]) if len(last) else None
+
+
+def append_year_rows(archive, year, header, rows):
+    """
+    Append Transactions rows, as (sheet row, [(value, number format) of columns A:M])
+    pairs, to the year's sheet of the archive workbook, which gets the Transactions
+    header if it has none yet. Rows whose dedup key the sheet already has (left by an
+    interrupted archive run) are skipped. Returns the year sheet and the number of
+    rows appended.
+    """
+    name = ARCHIVE_SHEET.format(year=year)
+    sheet = archive[name] if name in archive.sheetnames else archive.create_sheet(name)
+    if sheet.max_row == 1 and sheet['A1'].value is None:
+        for col, value in enumerate(header, start=1):
+            sheet.cell(row=1, column=col, value=value).font = Font(bold=True)
+        sheet.freeze_panes = 'A2'
+    existing = set(transaction_keys(_year_frame(sheet)[TRANSACTIONS_COLUMNS])) if sheet.max_row > 1 else set()
+    frame = pd.DataFrame([[value for value, _ in row] for _, row in rows], columns=SHEET_COLUMNS)
+    keys = transaction_keys(frame[TRANSACTIONS_COLUMNS])
+    row_idx = sheet.max_row
+    appended = 0
+    for (source, row), key in zip(rows, keys):
+        if key in existing:
+            continue
+        row_idx += 1
+        appended += 1
+        for col, (value, number_format) in enumerate(row, start=1):
+            cell = sheet.cell(row=row_idx, column=col, value=_moved(value, source, row_idx, col))
+            cell.number_format = number_format
+    return sheet, appended
+
+
+def write_partitions(book, partitions, names):
+    """Rewrite the Years sheet of the daily workbook: the year rows, and the archived totals per Name beside them."""
+    index = book.sheetnames.index(PARTITIONS_SHEET) if PARTITIONS_SHEET in book.sheetnames else len(book.sheetnames)
+    if PARTITIONS_SHEET in book.sheetnames:
+        book.remove(book[PARTITIONS_SHEET])
+    sheet = book.create_sheet(PARTITIONS_SHEET, index)
+    name_col = len(PARTITION_COLUMNS) + 2
+    for col, value in enumerate(PARTITION_COLUMNS, start=1):
+        sheet.cell(row=1, column=col, value=value).font = Font(bold=True)
+    for col, value in enumerate(PARTITION_NAME_COLUMNS, start=name_col):
+        sheet.cell(row=1, column=col, value=value).font = Font(bold=True)
+    for row_idx, row in enumerate(partitions.itertuples(index=False), start=2):
+        for col, (column, value) in enumerate(zip(PARTITION_COLUMNS, row), start=1):
+            cell = sheet.cell(row=row_idx, column=col, value=None if pd.isna(value) else value)
+            if column in ('First Date', 'Last Date'):
+                cell.number_format = DATE_FORMAT
+            elif column in ('Debit', 'Credit', 'Closing Balance'):
+                cell.number_format = AMOUNT_FORMAT
+    for row_idx, row in enumerate(names.itertuples(index=False), start=2):
+        for col, value in enumerate(row, start=name_col):
+            cell = sheet.cell(row=row_idx, column=col, value=None if pd.isna(value) else value)
+            if col > name_col + 1:
+                cell.number_format = AMOUNT_FORMAT
+    sheet.freeze_panes = 'A2'
+
+
+def _total(values):
+    # Money totals to the penny, as a SUM over the cells shows them
+    return round(float(pd.to_numeric(values, errors='coerce').sum()), 2)
+
+
+def summarize_archive(excel_path, archive_path, archive):
+    """The PARTITION_COLUMNS row of every year sheet in the archive, and the totals per Name over all of them."""
+    years, frames = [], []
+    for name in archive.sheetnames:
+        year = name[len(ARCHIVE_SHEET.format(year='')):]
+        if ARCHIVE_SHEET.format(year=year) != name or not year.isdigit():
+            continue
+        df = _year_frame(archive[name])
+        dates = pd.to_datetime(df['Date'], errors='coerce')
+        years.append([int(year), _recorded(excel_path, archive_path), name, len(df), dates.min(), dates.max(),
+                      _total(df['Debit']), _total(df['Credit']), _closing(df)])
+        frames.append(df)
+    partitions = pd.DataFrame(years, columns=PARTITION_COLUMNS).sort_values('Year', kind='stable')
+    names = pd.DataFrame(columns=PARTITION_NAME_COLUMNS)
+    if frames:
+        df = pd.concat(frames, ignore_index=True)
+        amounts = df[PARTITION_NAME_COLUMNS[1:]].apply(pd.to_numeric, errors='coerce')
+        names = amounts.groupby(df['Name'].fillna('').astype(str)).sum().rename_axis('Name').reset_index()
+        names[['Debit', 'Credit']] = names[['Debit', 'Credit']].round(2)
+    return partitions, names
+
+
+def _moved(value, source, target, col):
+    # Formulas (column A's lookup, a Price worked out from Debit/Quantity) follow their row
+    if isinstance(value, str) and value.startswith('=') and source != target:
+        return Translator(value, origin=f'{get_column_letter(col)}{source}').translate_formula(
+            f'{get_column_letter(col)}{target}')
+    return value
+
+
+def compact_transactions(sheet, keep, last_row, end_row):
+    """
+    Move the kept rows (sheet row numbers, in order) of the Transactions sheet up to
+    start at row 2, with their values and styles; formulas are translated to their
+    new row. The cells below, up to end_row, are removed, except that an
+    emptied sheet keeps the styles of its last row in row 2 as the template for the
+    next import. Returns the new last data row.
+    """
+    template = [copy(sheet._cells[(last_row, col)]._style) if (last_row, col) in sheet._cells else None
+                for col in range(1, TRANSACTIONS_MAX_COLUMN + 1)]
+    target = 1
+    for target, source in enumerate(keep, start=2):
+        if target == source:
+            continue
+        for col in range(1, TRANSACTIONS_MAX_COLUMN + 1):
+            cell = sheet._cells.get((source, col))
+            if cell is None:
+                sheet._cells.pop((target, col), None)
+                continue
+            moved = sheet.cell(row=target, column=col)
+            moved.value = _moved(cell.value, source, target, col)
+            moved._style = copy(cell._style)
+    for row in range(target + 1, end_row + 1):
+        for col in range(1, TRANSACTIONS_MAX_COLUMN + 1):
+            sheet._cells.pop((row, col), None)
+    if target == 1:
+        for col, style in enumerate(template, start=1):
+            if style is not None:
+                sheet.cell(row=2, column=col)._style = style
+    return target
+
+
+def archive_closed_years(excel_path, before_year=None, archive_path=None):
+    """
+    Move the Transactions rows dated before before_year (default: the year of the
+    workbook's date) out of the daily workbook into one sheet per year of the archive
+    workbook, with column A resolved to values. The Years sheet of the daily workbook
+    then lists every archived year (rows, dates, Debit and Credit totals and the
+    closing Running Balance) and the archived totals per Name. The archive is saved
+    first, so an interrupted run leaves the rows in both and the next run skips them.
+    The dedup index is rebuilt from the whole history. Returns the number of rows moved.
+    """
+    before_year = int(before_year or workbook_date(excel_path)[:4])
+    archive_path = archive_path or archive_path_for(excel_path)
+    with WorkbookSession(excel_path) as session:
+        sheet = session.sheet(TRANSACTIONS_SHEET)
+        last_row = last_data_row(sheet)
+        end_row = max(last_row, last_formula_row(sheet))
+        with stage('archive_read') as current:
+            values = [[cell.value for cell in row] for row in
+                      sheet.iter_rows(min_row=2, max_row=last_row, max_col=TRANSACTIONS_MAX_COLUMN)]
+            frame = pd.DataFrame(values, columns=SHEET_COLUMNS)
+            years = pd.to_datetime(frame['Date'], errors='coerce').dt.year
+            closed = (years < before_year).to_numpy()
+            current.rows = len(frame)
+        if not closed.any():
+            print(f"No Transactions rows dated before {before_year} to archive")
+            return 0
+
+        maps = maps_for(session)
+        header = [cell.value for cell in sheet[1][:TRANSACTIONS_MAX_COLUMN]]
+        by_year = {}
+        for i in closed.nonzero()[0]:
+            row_idx = i + 2
+            row = []
+            for col, value in enumerate(values[i], start=1):
+                cell = sheet._cells.get((row_idx, col))
+                if col == 1 and isinstance(value, str) and value.startswith('='):
+                    value = maps.transaction_category(values[i][3], values[i][7])
+                row.append((value, cell.number_format if cell is not None else 'General'))
+            by_year.setdefault(int(years.iloc[i]), []).append((row_idx, row))
+
+        if not os.path.exists(archive_path):
+            book = openpyxl.Workbook()  # A workbook cannot be saved without a sheet
+            book.active.title = ARCHIVE_SHEET.format(year=min(by_year))
+            book.save(archive_path)
+        with WorkbookSession(archive_path) as archive:
+            with stage('archive_write') as current:
+                for year, rows in sorted(by_year.items()):
+                    _, appended = append_year_rows(archive.book, year, header, rows)
+                    print(f"{year}: {appended} rows archived to '{ARCHIVE_SHEET.format(year=year)}' "
+                          f"({len(rows) - appended} already there)")
+                current.rows = int(closed.sum())
+                partitions, names = summarize_archive(excel_path, archive_path, archive.book)
+            archive.mark_dirty()
+
+        with stage('archive_compact') as current:
+            new_last_row = compact_transactions(sheet, [i + 2 for i in (~closed).nonzero()[0]], last_row, end_row)
+            current.rows = new_last_row - 1
+        record_rows(sheet, data_row=new_last_row, formula_row=search_last_row(sheet, 'A'))
+        write_partitions(session.book, partitions, names)
+        session.mark_dirty()
+        session.on_save(lambda: TransactionIndex(index_path_for(excel_path)).rebuild_from(
+            load_history_frame(excel_path), new_last_row))
+    moved = int(closed.sum())
+    print(f"Archived {moved} Transactions rows dated before {before_year} to {archive_path}; "
+          f"{new_last_row - 1} rows stay in {excel_path}")
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move closed years of Transactions to the archive workbook")
+    parser.add_argument('action', choices=['archive', 'list'])
+    parser.add_argument('--before', type=int, help="archive: move the years before this one (default: workbook year)")
+    parser.add_argument('--excel', help="Workbook (default: excel_path in config.json)")
+    args = parser.parse_args()
+
+    config = load_config()
+    excel_path = args.excel or config.get("excel_path", DEFAULT_EXCEL_PATH)
+    try:
+        if args.action == 'archive':
+            archive_closed_years(excel_path, args.before, archive_path_for(excel_path, config))
+        else:
+            print(load_partitions(excel_path).to_string(index=False))
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except PermissionError as e:
+        print(f"Error: {e}")
+    except ValueError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
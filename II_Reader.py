@@ -0,0 +1,262 @@
+# II_Reader.py
+import argparse
+import json
+import os
+import time
+import openpyxl
+import pandas as pd
+from II_Constants import (
+    DEFAULT_EXCEL_PATH, TRANSACTIONS_SHEET, TRANSACTIONS_COLUMNS, INVESTMENTS_SHEET, INVESTMENTS_COLUMNS,
+    INVESTMENTS_AMOUNT_COLUMNS, FRAME_CACHE_SUFFIX, FRAME_CACHE_MAX_PARTS
+)
+from II_Config import load_config
+from II_Metrics import stage
+
+try:
+    import pyarrow  # noqa: F401  Optional: Parquet cache files
+    CACHE_EXTENSION = '.parquet'
+except ImportError:  # Without pyarrow the cache parts are pickles
+    CACHE_EXTENSION = '.pkl'
+
+# Column dtypes of the frames; repeated text columns are categoricals
+TRANSACTIONS_DTYPES = {
+    'Date': 'datetime64[ns]', 'Settlement Date': 'datetime64[ns]', 'Symbol': 'category', 'Sedol': 'category',
+    'Quantity': 'float64', 'Price': 'float64', 'Description': 'category', 'Reference': 'object',
+    'Debit': 'float64', 'Credit': 'float64', 'Running Balance': 'float64',
+}
+INVESTMENTS_DTYPES = dict({'Symbol': 'category', 'Name': 'category', 'Qty': 'float64'},
+                          **{col: 'float64' for col in INVESTMENTS_AMOUNT_COLUMNS})
+CACHE_DTYPES = {'transactions': TRANSACTIONS_DTYPES, 'investments': INVESTMENTS_DTYPES}  # By cache name
+
+
+def workbook_stat(excel_path):
+    """The cache key of a workbook: its absolute path, mtime and size."""
+    stat = os.stat(excel_path)
+    return {'path': os.path.abspath(excel_path), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def cache_folder_for(excel_path):
+    """Frame cache sidecar folder for a workbook (II_YYYYMMDD.frames)."""
+    return os.path.splitext(excel_path)[0] + FRAME_CACHE_SUFFIX
+
+
+def _text(series):
+    # Text columns hold str or None, also where the sheet stored a code such as a Sedol as a number
+    values = series.astype(object)
+    return values.where(values.isna(), values.astype(str)).where(values.notna(), None)
+
+
+def typed_frame(df, dtypes):
+    """df with dtypes applied; values that do not parse become NaN/NaT, missing text None."""
+    df = df.copy()
+    for col, dtype in dtypes.items():
+        if dtype == 'datetime64[ns]':
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        elif dtype == 'float64':
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+        elif dtype == 'category':
+            df[col] = _text(df[col]).astype('category')
+        else:
+            df[col] = _text(df[col])
+    return df
+
+
+class FrameCache:
+    """
+    One sheet's frame cached next to the workbook, as numbered part files (Parquet with
+    pyarrow installed, pickle otherwise) plus a JSON key: the workbook path, mtime and
+    size the parts describe. A frame is only returned while the key still matches the
+    workbook. An import appends its new rows as another part instead of re-reading
+    the sheet; the parts are concatenated, and the categoricals unified, on load, and
+    merged back into a single part once there are more than FRAME_CACHE_MAX_PARTS.
+    """
+
+    def __init__(self, excel_path, name, dtypes):
+        self.folder = cache_folder_for(excel_path)
+        self.name = name
+        self.dtypes = dtypes
+        self.key_path = os.path.join(self.folder, f'{name}.json')
+
+    def _key(self):
+        try:
+            with open(self.key_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _part_path(self, part):
+        return os.path.join(self.folder, f'{self.name}-{part:04d}{CACHE_EXTENSION}')
+
+    def load(self, stat):
+        """The cached frame if it was written for this workbook stat, else None."""
+        key = self._key()
+        if key is None or key.get('workbook') != stat or key.get('format') != CACHE_EXTENSION:
+            return None
+        try:
+            parts = [self._read(self._part_path(part)) for part in range(key['parts'])]
+        except (OSError, ValueError) as e:
+            print(f"Warning: Frame cache {self.key_path} is unreadable ({e}). It will be rebuilt.")
+            return None
+        df = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+        if len(df) != key['rows']:  # A merge interrupted between its part and its key
+            return None
+        for col, dtype in self.dtypes.items():
+            if dtype == 'category' and df[col].dtype != 'category':
+                df[col] = df[col].astype('category')
+        if len(parts) > FRAME_CACHE_MAX_PARTS:
+            self.write(df, stat, parts=len(parts))
+        return df
+
+    def write(self, df, stat, parts=None):
+        """Replace the cache (of parts parts, default: as the key says) with df as a single part."""
+        if parts is None:
+            key = self._key()
+            parts = key.get('parts', 1) if key else 1
+        os.makedirs(self.folder, exist_ok=True)
+        tmp_path = self._part_path(0) + '.tmp'
+        self._write(df, tmp_path)
+        os.replace(tmp_path, self._part_path(0))
+        self._write_key(stat, 1, len(df))
+        for part in range(1, parts):
+            if os.path.exists(self._part_path(part)):
+                os.remove(self._part_path(part))
+
+    def append(self, df, before, after):
+        """
+        Add df as a new part if the cache describes the workbook as it was before the
+        import (stat before); the key then moves to the workbook after it (stat after).
+        Returns False, leaving the stale cache to be rebuilt on the next load, otherwise.
+        """
+        key = self._key()
+        if key is None or key.get('workbook') != before or key.get('format') != CACHE_EXTENSION:
+            return False
+        self._write(typed_frame(df, self.dtypes), self._part_path(key['parts']))
+        self._write_key(after, key['parts'] + 1, key['rows'] + len(df))
+        return True
+
+    def carry_to(self, stat, excel_path):
+        """
+        Copy the cache, if it describes the workbook stat (its workbook as it is now), to
+        a copy of that workbook with the same sheet values, keyed to the copy and merged
+        into a single part. Returns True if it was copied.
+        """
+        df = self.load(stat)
+        if df is None:
+            return False
+        FrameCache(excel_path, self.name, self.dtypes).write(df, workbook_stat(excel_path))
+        return True
+
+    def _write_key(self, stat, parts, rows):
+        tmp_path = self.key_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'workbook': stat, 'format': CACHE_EXTENSION, 'parts': parts, 'rows': rows}, f)
+        os.replace(tmp_path, self.key_path)
+
+    @staticmethod
+    def _write(df, path):
+        if CACHE_EXTENSION == '.parquet':
+            df.to_parquet(path, index=False)
+        else:
+            df.to_pickle(path)
+
+    @staticmethod
+    def _read(path):
+        return pd.read_parquet(path) if CACHE_EXTENSION == '.parquet' else pd.read_pickle(path)
+
+
+def carry_frame_caches(source_path, target_path):
+    """
+    Give a copy of a workbook with the same sheet values (the next day's file after a
+    roll) the frame caches of the source that are current. Returns their names.
+    """
+    folder = cache_folder_for(source_path)
+    if not os.path.isdir(folder):
+        return []
+    stat = workbook_stat(source_path)
+    names = [entry[:-len('.json')] for entry in sorted(os.listdir(folder)) if entry.endswith('.json')]
+    return [name for name in names
+            if name in CACHE_DTYPES and FrameCache(source_path, name, CACHE_DTYPES[name]).carry_to(stat, target_path)]
+
+
+def read_sheet_rows(excel_path, sheet_name, columns, first_row=2, first_col=2):
+    """
+    The values of a sheet's data block (columns from first_col) read with openpyxl in
+    read-only mode, up to its last row with a value in the first column.
+    """
+    book = openpyxl.load_workbook(excel_path, read_only=True)
+    try:
+        if sheet_name not in book.sheetnames:
+            raise ValueError(f"Sheet '{sheet_name}' not found in the workbook")
+        rows = list(book[sheet_name].iter_rows(min_row=first_row, min_col=first_col,
+                                               max_col=first_col + len(columns) - 1, values_only=True))
+    finally:
+        book.close()
+    while rows and (rows[-1][0] is None or (isinstance(rows[-1][0], str) and not rows[-1][0].strip())):
+        rows.pop()
+    return pd.DataFrame(rows, columns=columns)
+
+
+def _load(excel_path, cache, name, read):
+    if not os.path.exists(excel_path):
+        raise FileNotFoundError(f"Excel file not found at: {excel_path}")
+    stat = workbook_stat(excel_path)
+    with stage(f'{name}_frame') as current:
+        df = cache.load(stat)
+        if df is None:
+            df = read()
+            cache.write(df, stat)
+        current.rows = len(df)
+    return df
+
+
+def load_transactions_frame(excel_path):
+    """
+    The Transactions sheet history (columns B:L, rows 2 to the last Date) as a typed
+    frame, from the frame cache when it matches the workbook and otherwise read with
+    openpyxl in read-only mode and cached.
+    """
+    return _load(excel_path, FrameCache(excel_path, 'transactions', TRANSACTIONS_DTYPES), 'transactions',
+                 lambda: typed_frame(read_sheet_rows(excel_path, TRANSACTIONS_SHEET, TRANSACTIONS_COLUMNS),
+                                     TRANSACTIONS_DTYPES))
+
+
+def load_investments_frame(excel_path):
+    """
+    The holdings in the Investments sheet (columns B:M, the rows with a Symbol; the
+    Totals/GBP/USD footer rows are left out) as a typed frame, cached as load_transactions_frame.
+    """
+    def read():
+        df = read_sheet_rows(excel_path, INVESTMENTS_SHEET, INVESTMENTS_COLUMNS)
+        return typed_frame(df[df['Symbol'].notna()].reset_index(drop=True), INVESTMENTS_DTYPES)
+    return _load(excel_path, FrameCache(excel_path, 'investments', INVESTMENTS_DTYPES), 'investments', read)
+
+
+def append_transactions_frame(excel_path, df, before):
+    """
+    After an import has appended the rows of df to the Transactions sheet and saved the
+    workbook, add them to the frame cache if it matched the workbook before the import
+    (stat before). A cache that did not is left to be rebuilt on the next load.
+    """
+    cache = FrameCache(excel_path, 'transactions', TRANSACTIONS_DTYPES)
+    if cache.append(df[TRANSACTIONS_COLUMNS], before, workbook_stat(excel_path)):
+        print(f"Transactions frame cache: {len(df)} rows appended")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the workbook's Transactions and Investments as frames")
+    parser.add_argument('--excel', help="Workbook (default: excel_path in config.json)")
+    args = parser.parse_args()
+
+    excel_path = args.excel or load_config().get("excel_path", DEFAULT_EXCEL_PATH)
+    try:
+        for name, load in (('Transactions', load_transactions_frame), ('Investments', load_investments_frame)):
+            start = time.perf_counter()
+            df = load(excel_path)
+            print(f"{name}: {len(df)} rows in {(time.perf_counter() - start) * 1000:.0f} ms")
+            df.info(memory_usage='deep')
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except ValueError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
@@ -0,0 +1,617 @@
+# II_Rebuild.py
+import argparse
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+import openpyxl
+import pandas as pd
+from openpyxl.cell.cell import ERROR_CODES, ILLEGAL_CHARACTERS_RE
+from openpyxl.packaging.custom import CustomPropertyList, IntProperty
+from openpyxl.utils import get_column_letter, column_index_from_string
+from openpyxl.utils.datetime import to_excel, from_excel
+from II_Constants import (
+    DEFAULT_EXCEL_PATH, DEFAULT_ACCOUNT, TRANSACTIONS_CSV_PATH, INVESTMENTS_CSV_PATH, TRANSACTIONS_SHEET,
+    TRANSACTIONS_COLUMNS, TRANSACTIONS_MAX_COLUMN, TRANSACTIONS_FORMULA, INVESTMENTS_SHEET, INVESTMENTS_START_CELL,
+    INVESTMENTS_FORMULA, CATEGORY_MODE_FORMULA, CATEGORY_MODE_VALUE, WATERMARK_LAST_DATA_ROW,
+    WATERMARK_LAST_FORMULA_ROW, REBUILD_CHUNK_BYTES
+)
+from II_Config import load_config
+from II_Ledger import open_ledger, workbook_date
+from II_Snapshots import open_snapshots
+from II_Normalize import load_transactions_csv
+from II_InvestmentsImport import load_investments_csv, sheet_columns
+from II_TransactionIndex import TransactionIndex
+from II_Reader import workbook_stat, append_transactions_frame
+from II_Partition import load_partitions, load_history_frame, partitions_closing_balance
+from II_Reconcile import Reconciliation, DATE_COLUMN, RUNNING_BALANCE_COLUMN
+from II_WorkbookSession import frame_rows
+from II_Format import formula_block
+from II_MapResolver import CategoryMaps
+from II_Metrics import run_metrics, stage, add_cells
+
+SHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+DOC_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+CUSTOM_PROPS_PART = 'docProps/custom.xml'
+CUSTOM_PROPS_TYPE = 'application/vnd.openxmlformats-officedocument.custom-properties+xml'
+CUSTOM_PROPS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/custom-properties'
+
+ROW_START = re.compile(rb'<row\b[^>]*?\br="(\d+)"[^>]*>')
+ROW_ELEMENT = re.compile(rb'<row\b[^>]*?(?:/>|>.*?</row>)', re.S)
+CELL_ELEMENT = re.compile(rb'<c\b[^>]*?(?:/>|>.*?</c>)', re.S)
+CELL_COLUMN = re.compile(rb'<c\b[^>]*?\br="([A-Z]+)\d+"')
+CELL_STYLE = re.compile(rb'<c\b[^>]*?\bs="(\d+)"')
+CELL_TYPE = re.compile(rb'<c\b[^>]*?\bt="(\w+)"')
+CELL_VALUE = re.compile(rb'<v>(.*?)</v>', re.S)
+CELL_TEXT = re.compile(rb'<t\b[^>]*>(.*?)</t>', re.S)
+ROW_SPANS = re.compile(rb'\sspans="[^"]*"')
+DIMENSION = re.compile(rb'<dimension ref="[^"]*"\s*/>')
+SHEET_DATA = re.compile(rb'<sheetData\s*(/?)>')
+
+
+def filled_cell(column):
+    """Regex for a cell of column with content (not a self-closing, style-only cell); group 1 is its row."""
+    return re.compile(rb'<c\b[^>]*?\br="' + column.encode() + rb'(\d+)"[^>]*(?<!/)>(?!</c>)')
+
+
+FILLED_A_CELL = filled_cell('A')
+FILLED_B_CELL = filled_cell('B')
+
+
+def sheet_parts(archive):
+    """Worksheet name -> its part in the package, from xl/workbook.xml and its relationships."""
+    workbook = ET.fromstring(archive.read('xl/workbook.xml'))
+    targets = {rel.get('Id'): rel.get('Target') for rel in ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))}
+    parts = {}
+    for sheet in workbook.iter(f'{{{SHEET_NS}}}sheet'):
+        target = targets[sheet.get(f'{{{DOC_REL_NS}}}id')]
+        parts[sheet.get('name')] = target.lstrip('/') if target.startswith('/') else \
+            posixpath.normpath(posixpath.join('xl', target))
+    return parts
+
+
+def iter_sheet_xml(archive, part, chunk_bytes=REBUILD_CHUNK_BYTES):
+    """
+    Stream a worksheet part as ('head', bytes) up to and including <sheetData>, then
+    ('rows', bytes) batches of whole <row> elements, then ('tail', bytes) from
+    </sheetData> on. Only about chunk_bytes of the sheet are held at a time.
+    """
+    with archive.open(part) as f:
+        buffer = b''
+        while True:
+            chunk = f.read(chunk_bytes)
+            buffer += chunk
+            match = SHEET_DATA.search(buffer)
+            if match:
+                break
+            if not chunk:
+                raise ValueError(f"{part} has no sheetData")
+        if match.group(1):  # <sheetData/>: an empty sheet
+            yield 'head', buffer[:match.start()] + b'<sheetData>'
+            yield 'tail', b'</sheetData>' + buffer[match.end():] + f.read()
+            return
+        yield 'head', buffer[:match.end()]
+        buffer = buffer[match.end():]
+        while True:
+            end = buffer.find(b'</sheetData>')
+            if end >= 0:
+                if end:
+                    yield 'rows', buffer[:end]
+                yield 'tail', buffer[end:] + f.read()
+                return
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                raise ValueError(f"{part} ends inside sheetData")
+            last = buffer.rfind(b'<row')
+            if last > 0:
+                yield 'rows', buffer[:last]
+                buffer = buffer[last:]
+            buffer += chunk
+
+
+def row_number(row_xml):
+    return int(ROW_START.match(row_xml).group(1))
+
+
+def row_cells(row_xml):
+    """{column number: cell XML} of a <row> element."""
+    return {column_index_from_string(CELL_COLUMN.match(cell.group()).group(1).decode()): cell.group()
+            for cell in CELL_ELEMENT.finditer(row_xml)}
+
+
+def cell_style(cell_xml):
+    match = CELL_STYLE.match(cell_xml) if cell_xml is not None else None
+    return int(match.group(1)) if match else None
+
+
+def row_styles(row_xml, max_column):
+    """Style id per column 1..max_column of a row (None where the cell has none)."""
+    cells = row_cells(row_xml) if row_xml is not None else {}
+    return [cell_style(cells.get(col)) for col in range(1, max_column + 1)]
+
+
+def cell_value(cell_xml, shared_strings):
+    """The stored value of a cell: text, number or bool, with shared strings looked up."""
+    if cell_xml is None:
+        return None
+    kind = CELL_TYPE.match(cell_xml)
+    kind = kind.group(1) if kind else b'n'
+    if kind == b'inlineStr':
+        return ET.fromstring(b'<t>' + b''.join(CELL_TEXT.findall(cell_xml)) + b'</t>').text or ''
+    value = CELL_VALUE.search(cell_xml)
+    if value is None:
+        return None
+    text = ET.fromstring(b'<v>' + value.group(1) + b'</v>').text or ''
+    if kind == b's':
+        return shared_strings[int(text)]
+    if kind in (b'str', b'e'):
+        return text
+    if kind == b'b':
+        return text == '1'
+    return float(text) if text else None
+
+
+def shared_strings_at(archive, indices):
+    """The shared strings at the given indices, read by streaming sharedStrings.xml."""
+    wanted, found = set(indices), {}
+    if not wanted or 'xl/sharedStrings.xml' not in archive.namelist():
+        return found
+    item, text = f'{{{SHEET_NS}}}si', f'{{{SHEET_NS}}}t'
+    position = 0
+    with archive.open('xl/sharedStrings.xml') as f:
+        for _, element in ET.iterparse(f):
+            if element.tag != item:
+                continue
+            if position in wanted:
+                found[position] = ''.join(t.text or '' for t in element.iter(text))
+                if len(found) == len(wanted):
+                    break
+            position += 1
+            element.clear()
+    return found
+
+
+def row_values(archive, row_xml, first_column, last_column):
+    """The values of a row's cells first_column..last_column, shared strings resolved."""
+    cells = row_cells(row_xml)
+    indices = [int(CELL_VALUE.search(cells[col]).group(1)) for col in range(first_column, last_column + 1)
+               if col in cells and CELL_TYPE.match(cells[col]) and CELL_TYPE.match(cells[col]).group(1) == b's']
+    shared = shared_strings_at(archive, indices)
+    return [cell_value(cells.get(col), shared) for col in range(first_column, last_column + 1)]
+
+
+def transaction_frame(values_rows):
+    """Rows of sheet values (columns B:L) as a frame with the dates converted from Excel serials."""
+    df = pd.DataFrame(values_rows, columns=TRANSACTIONS_COLUMNS)
+    for col in ('Date', 'Settlement Date'):
+        df[col] = df[col].map(lambda v: from_excel(v) if isinstance(v, float) else v)
+    return df
+
+
+class SheetScan:
+    """
+    One streaming pass over a worksheet part: the last row with a value in column B
+    (the data block) and in column A (the formulas), the last row of the sheet, and the
+    XML of the rows from the start of the batch holding the last data row up to it,
+    which gives the template styles, the dedup key and the closing Running Balance.
+    """
+
+    def __init__(self, archive, part):
+        self.last_data_row = 1
+        self.last_formula_row = 1
+        self.max_row = 0
+        self.data_rows = []
+        for kind, data in iter_sheet_xml(archive, part):
+            if kind != 'rows':
+                continue
+            last_b = None
+            for last_b in FILLED_B_CELL.finditer(data):
+                pass
+            if last_b is not None:
+                self.last_data_row = int(last_b.group(1))
+                end = data.find(b'</row>', last_b.end()) + len(b'</row>')
+                self.data_rows = [row.group() for row in ROW_ELEMENT.finditer(data, 0, end)]
+            last_a = None
+            for last_a in FILLED_A_CELL.finditer(data):
+                pass
+            if last_a is not None:
+                self.last_formula_row = int(last_a.group(1))
+            self.max_row = max(self.max_row, row_number(data[data.rfind(b'<row'):]))
+        self.data_rows = [row for row in self.data_rows if row_number(row) >= 2]
+
+    @property
+    def template_row(self):
+        return self.data_rows[-1] if self.data_rows else None
+
+
+def closing_balance(scan):
+    """
+    The sheet's last Running Balance, as II_Reconcile.sheet_closing_balance: the top
+    row of the last date, looked up in the rows kept by the scan.
+    """
+    closing, last_date = None, None
+    for row_xml in reversed(scan.data_rows):
+        cells = row_cells(row_xml)
+        date = cell_value(cells.get(DATE_COLUMN), {})
+        if last_date is None:
+            last_date = date
+        if date != last_date:
+            break
+        balance = cell_value(cells.get(RUNNING_BALANCE_COLUMN), {})
+        if isinstance(balance, float):
+            closing = balance
+    return closing
+
+
+def cell_xml(ref, value, style):
+    """A <c> element for a value: inline string, number, date serial, bool, error or formula."""
+    s = f' s="{style}"' if style is not None else ''
+    if value is None:
+        return f'<c r="{ref}"{s}/>'
+    if isinstance(value, str):
+        value = ILLEGAL_CHARACTERS_RE.sub('', value)
+        if value.startswith('='):
+            return f'<c r="{ref}"{s}><f>{escape(value[1:])}</f></c>'
+        if value in ERROR_CODES:
+            return f'<c r="{ref}"{s} t="e"><v>{value}</v></c>'
+        return f'<c r="{ref}"{s} t="inlineStr"><is><t xml:space="preserve">{escape(value)}</t></is></c>'
+    if isinstance(value, bool):
+        return f'<c r="{ref}"{s} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, pd.Timestamp) or hasattr(value, 'year'):
+        value = to_excel(value)
+    value = float(value)
+    return f'<c r="{ref}"{s}><v>{int(value) if value.is_integer() else repr(value)}</v></c>'
+
+
+def row_xml(row, cells, existing=None):
+    """
+    A <row> element from {column: value-or-cell-XML}. Cells of an existing row at the
+    same position are kept where cells has nothing for their column, as are its
+    attributes (height, style) apart from spans.
+    """
+    merged = row_cells(existing) if existing is not None else {}
+    merged.update(cells)
+    start = ROW_SPANS.sub(b'', ROW_START.match(existing).group()) if existing is not None \
+        else f'<row r="{row}">'.encode()
+    return start + b''.join(merged[col] for col in sorted(merged)) + b'</row>'
+
+
+def sheet_dimension(head, last_column, last_row):
+    return DIMENSION.sub(f'<dimension ref="A1:{get_column_letter(last_column)}{last_row}"/>'.encode(), head, count=1)
+
+
+def write_transactions_part(archive, part, out, scan, rows, categories, category_mode):
+    """
+    Stream the Transactions part into out: the existing rows are copied as they are up
+    to the last data row, then the new rows follow with the template row's styles and
+    column A formulas or categories, merged into any formatted rows already below.
+    Returns the last data row written.
+    """
+    template = row_styles(scan.template_row, TRANSACTIONS_MAX_COLUMN)
+    first_new_row = scan.last_data_row + 1
+    trailing = {}
+    with out.open(part, 'w', force_zip64=True) as dst:
+        for kind, data in iter_sheet_xml(archive, part):
+            if kind == 'head':
+                dst.write(sheet_dimension(data, TRANSACTIONS_MAX_COLUMN, max(scan.max_row, scan.last_data_row + len(rows))))
+            elif kind == 'rows':
+                for row in ROW_ELEMENT.finditer(data):
+                    if row_number(row.group()) < first_new_row:
+                        dst.write(row.group())
+                    else:
+                        trailing[row_number(row.group())] = row.group()
+            else:
+                last_row = scan.last_data_row
+                formulas = formula_block(TRANSACTIONS_FORMULA, first_new_row, first_new_row + len(rows) - 1)
+                for i, values in enumerate(rows):
+                    last_row = first_new_row + i
+                    existing = trailing.pop(last_row, None)
+                    cells = {col: cell_xml(f'{get_column_letter(col)}{last_row}', value, template[col - 1]).encode()
+                             for col, value in enumerate(values, start=2)}
+                    if last_row > scan.last_formula_row:
+                        category = categories[i] if category_mode == CATEGORY_MODE_VALUE else formulas[i]
+                        cells[1] = cell_xml(f'A{last_row}', category, template[0]).encode()
+                    for col in range(2 + len(values), TRANSACTIONS_MAX_COLUMN + 1):
+                        cells[col] = cell_xml(f'{get_column_letter(col)}{last_row}', None, template[col - 1]).encode()
+                    dst.write(row_xml(last_row, cells, existing))
+                for row in sorted(trailing):
+                    dst.write(trailing[row])
+                dst.write(data)
+    add_cells(len(rows) * TRANSACTIONS_MAX_COLUMN)
+    return last_row
+
+
+def investments_part(archive, part, df, maps, category_mode, start_cell=INVESTMENTS_START_CELL):
+    """
+    The Investments part with its data block regenerated from df in CSV order: each row
+    takes the styles of the row it replaces, or of the last old data row beyond the old
+    block. Header rows and formatted rows below the block are kept. Returns (XML, last
+    holding row, last row with a column A formula or category).
+    """
+    frame = sheet_columns(df)
+    start_col = column_index_from_string(re.match(r'[A-Z]+', start_cell).group())
+    start_row = int(re.search(r'\d+', start_cell).group())
+    width = len(frame.columns)
+    rows = [values for values in frame_rows(frame) if any(value is not None for value in values)]
+    holdings = sum(1 for values in rows if values[0] is not None)
+
+    data = archive.read(part)
+    match = SHEET_DATA.search(data)
+    head = data[:match.start()] + b'<sheetData>'
+    body_end = match.end() if match.group(1) else data.find(b'</sheetData>')
+    tail = data[body_end:] if not match.group(1) else b'</sheetData>' + data[match.end():]
+    old = {row_number(row.group()): row.group() for row in ROW_ELEMENT.finditer(data, match.end(), body_end)}
+
+    def has_data(row):
+        cells = row_cells(row)
+        return any(start_col <= col < start_col + width and (CELL_VALUE.search(cell) or b'<is>' in cell)
+                   for col, cell in cells.items())
+    old_block = [row for row in sorted(old) if row >= start_row and has_data(old[row])]
+    old_end = old_block[-1] if old_block else start_row - 1
+    fallback = old[old_block[-1]] if old_block else None
+    max_column = start_col + width - 1
+    formulas = formula_block(INVESTMENTS_FORMULA, start_row, start_row + len(rows) - 1)
+
+    out = []
+    for row in sorted(old):
+        if row < start_row:
+            out.append(old[row])
+    new_end = start_row + len(rows) - 1
+    for i, values in enumerate(rows):
+        row = start_row + i
+        existing = old.get(row)
+        template = row_styles(existing if existing is not None else fallback, max_column)
+        cells = {col: cell_xml(f'{get_column_letter(col)}{row}', value, template[col - 1]).encode()
+                 for col, value in enumerate(values, start=start_col)}
+        if category_mode != CATEGORY_MODE_VALUE:
+            category = formulas[i]  # Shows "" on the footer rows
+        else:
+            category = maps.investment_category(values[0]) if values[0] is not None else None
+        cells[1] = cell_xml(f'A{row}', category, template[0]).encode()
+        out.append(row_xml(row, cells, existing if existing is not None and row > old_end else None))
+    for row in sorted(old):
+        if row > max(new_end, old_end):
+            out.append(old[row])
+    add_cells(len(rows) * max_column)
+    last_row = max([row_number(row) for row in out] or [1])
+    formula_row = start_row + (holdings if category_mode == CATEGORY_MODE_VALUE else len(rows)) - 1
+    return sheet_dimension(head, max_column, last_row) + b''.join(out) + tail, formula_row
+
+
+def full_calc_on_load(workbook_xml):
+    """workbook.xml with Excel told to recalculate every formula when the file is opened."""
+    if re.search(rb'<calcPr\b', workbook_xml):
+        workbook_xml = re.sub(rb'\sfullCalcOnLoad="[^"]*"', b'', workbook_xml)
+        return re.sub(rb'<calcPr\b', b'<calcPr fullCalcOnLoad="1"', workbook_xml, count=1)
+    anchor = b'</definedNames>' if b'</definedNames>' in workbook_xml else b'</sheets>'
+    return workbook_xml.replace(anchor, anchor + b'<calcPr fullCalcOnLoad="1"/>', 1)
+
+
+def without_relationship(rels_xml, target):
+    return re.sub(rb'<Relationship\b[^>]*\bTarget="/?(?:xl/)?' + re.escape(target.encode()) + rb'"[^>]*/>', b'',
+                  rels_xml)
+
+
+def custom_properties(archive, watermarks):
+    """docProps/custom.xml with the watermark properties set, creating it if the package has none."""
+    props = CustomPropertyList()
+    if CUSTOM_PROPS_PART in archive.namelist():
+        props = CustomPropertyList.from_tree(ET.fromstring(archive.read(CUSTOM_PROPS_PART)))
+    for name, row in watermarks.items():
+        if name in props.names:
+            props[name].value = int(row)
+        else:
+            props.append(IntProperty(name=name, value=int(row)))
+    return b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n' + ET.tostring(props.to_tree())
+
+
+def write_package(excel_path, archive, parts, write_transactions=None, investments_xml=None, watermarks=None):
+    """
+    Write the rebuilt package next to the workbook and replace it. Every part is copied
+    through unchanged except the regenerated sheets, workbook.xml (full recalculation on
+    load) and the calculation chain, which is dropped as Excel rebuilds it.
+    """
+    names = archive.namelist()
+    replaced = {'xl/workbook.xml': full_calc_on_load(archive.read('xl/workbook.xml')),
+                'xl/_rels/workbook.xml.rels': without_relationship(archive.read('xl/_rels/workbook.xml.rels'),
+                                                                   'calcChain.xml')}
+    content_types = re.sub(rb'<Override PartName="/xl/calcChain.xml"[^>]*/>', b'', archive.read('[Content_Types].xml'))
+    if watermarks:
+        replaced[CUSTOM_PROPS_PART] = custom_properties(archive, watermarks)
+        if CUSTOM_PROPS_PART not in names:
+            content_types = content_types.replace(
+                b'</Types>', f'<Override PartName="/{CUSTOM_PROPS_PART}" ContentType="{CUSTOM_PROPS_TYPE}"/></Types>'
+                .encode())
+            rels = archive.read('_rels/.rels')
+            replaced['_rels/.rels'] = rels.replace(b'</Relationships>', f'<Relationship Id="rIdIICustom" Type="'
+                                                   f'{CUSTOM_PROPS_REL}" Target="{CUSTOM_PROPS_PART}"/>'
+                                                   f'</Relationships>'.encode())
+    replaced['[Content_Types].xml'] = content_types
+    if investments_xml is not None:
+        replaced[parts[INVESTMENTS_SHEET]] = investments_xml
+
+    folder = os.path.dirname(os.path.abspath(excel_path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.ii_rebuild_', suffix='.xlsx', dir=folder)
+    os.close(fd)
+    result = None
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as out:
+            for name in names + [name for name in replaced if name not in names]:
+                if name == 'xl/calcChain.xml':
+                    continue
+                if write_transactions is not None and name == parts[TRANSACTIONS_SHEET]:
+                    result = write_transactions(out)
+                elif name in replaced:
+                    out.writestr(name, replaced[name])
+                else:
+                    with archive.open(name) as src, out.open(name, 'w', force_zip64=True) as dst:
+                        shutil.copyfileobj(src, dst, REBUILD_CHUNK_BYTES)
+        archive.close()
+        shutil.copymode(excel_path, tmp_path)  # mkstemp files are private to the user
+        os.replace(tmp_path, excel_path)
+    except PermissionError:
+        raise PermissionError(f"Permission denied when saving {excel_path}. "
+                              f"Ensure the file is not open in another application.")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    print(f"File saved successfully: {excel_path}")
+    return result
+
+
+def rebuild_workbook(excel_path, transactions=None, investments=None, ledger=None, account=DEFAULT_ACCOUNT,
+                     category_mode=CATEGORY_MODE_FORMULA, snapshots=None):
+    """
+    Import normalized Transactions and/or Investments frames without loading the
+    workbook into openpyxl: the Transactions sheet is scanned once as a stream, the new
+    rows are spliced in after its last data row, the Investments data block is
+    regenerated, and every other part (PnL with its pivot table and conditional
+    formats, MapName, MapEdgeCases, styles) is copied through as it is. Peak memory
+    is bounded by the new rows plus one chunk of sheet XML rather than the workbook.
+    The dedup index, ledger and snapshot store are updated as the normal import does,
+    once the workbook has been replaced. Returns the number of rows appended.
+    """
+    if not os.path.exists(excel_path):
+        raise FileNotFoundError(f"Excel file not found at: {excel_path}")
+    archive = zipfile.ZipFile(excel_path)
+    try:
+        parts = sheet_parts(archive)
+        for name in ([TRANSACTIONS_SHEET] if transactions is not None else []) + \
+                    ([INVESTMENTS_SHEET] if investments is not None else []):
+            if name not in parts:
+                raise ValueError(f"Sheet '{name}' not found in the workbook")
+
+        maps = None
+        if category_mode == CATEGORY_MODE_VALUE:
+            book = openpyxl.load_workbook(excel_path, read_only=True)
+            try:
+                maps = CategoryMaps.from_workbook(book)
+            finally:
+                book.close()
+
+        watermarks, write_transactions, investments_xml = {}, None, None
+        new_df, new_keys, index, scan = None, None, None, None
+        if transactions is not None:
+            with stage('rebuild_scan') as current:
+                scan = SheetScan(archive, parts[TRANSACTIONS_SHEET])
+                current.rows = scan.max_row
+            print(f"Last non-empty row in column B: {scan.last_data_row}")
+
+            with stage('dedup_index') as current:
+                index = TransactionIndex.load(excel_path)
+                last = scan.template_row
+                if not (index.last_row == scan.last_data_row and
+                        (last is None or index.matches_last_key(transaction_frame(
+                            [row_values(archive, last, 2, 1 + len(TRANSACTIONS_COLUMNS))])))):
+                    print(f"Rebuilding transactions index from sheet rows 2 to {scan.last_data_row}...")
+                    index.rebuild_from(load_history_frame(excel_path), scan.last_data_row)
+                current.rows = len(index.keys)
+
+            csv_rows = len(transactions)
+            with stage('dedup_filter') as current:
+                new_df, new_keys = index.filter_new(transactions)
+                current.rows = csv_rows
+            with stage('reconcile') as current:
+                reconciliation = Reconciliation()
+                reconciliation.add(transactions, transactions.index.isin(new_df.index))
+                current.rows = reconciliation.rows
+                ledger_quantities = None
+                if investments is not None and ledger is not None:
+                    ledger_quantities = ledger.symbol_quantities(account)
+                sheet_balance = closing_balance(scan)
+                if sheet_balance is None:  # Every row archived: join with the last archived year
+                    sheet_balance = partitions_closing_balance(load_partitions(excel_path))
+                reconciliation.finish(sheet_balance, investments, ledger_quantities)
+            reconciliation.report()
+            print(f"New transactions to import: {len(new_df)} of {csv_rows} ({csv_rows - len(new_df)} already imported)")
+            if new_df.empty:
+                print("No new transactions to import")
+            else:
+                rows = list(frame_rows(new_df))
+                categories = [maps.transaction_category(row[2], row[6]) for row in rows] if maps else None
+                last_row = scan.last_data_row + len(rows)
+                watermarks[WATERMARK_LAST_DATA_ROW.format(sheet=TRANSACTIONS_SHEET)] = last_row
+                watermarks[WATERMARK_LAST_FORMULA_ROW.format(sheet=TRANSACTIONS_SHEET)] = \
+                    max(scan.last_formula_row, last_row)
+
+                def write_transactions(out):
+                    return write_transactions_part(archive, parts[TRANSACTIONS_SHEET], out, scan, rows, categories,
+                                                   category_mode)
+
+        if investments is not None:
+            with stage('investments_rebuild') as current:
+                investments_xml, formula_row = investments_part(archive, parts[INVESTMENTS_SHEET], investments,
+                                                                   maps, category_mode)
+                current.rows = len(investments)
+            watermarks[WATERMARK_LAST_FORMULA_ROW.format(sheet=INVESTMENTS_SHEET)] = formula_row
+
+        if write_transactions is None and investments_xml is None:
+            return 0
+        before = workbook_stat(excel_path)
+        with stage('rebuild_write'):
+            last_row = write_package(excel_path, archive, parts, write_transactions, investments_xml, watermarks)
+    finally:
+        archive.close()
+
+    if write_transactions is not None:
+        print(f"Data successfully written to rows up to {last_row} in Transactions sheet")
+        index.record(new_keys, last_row)
+        append_transactions_frame(excel_path, new_df, before)
+        if ledger is not None:
+            ledger.stage_transactions(frame_rows(new_df), new_keys, account)
+    if investments is not None:
+        print(f"Investments sheet rebuilt with {len(investments)} rows")
+        if ledger is not None:
+            ledger.stage_investments(investments, workbook_date(excel_path), account)
+        if snapshots is not None:
+            snapshots.append(investments, workbook_date(excel_path))
+    if ledger is not None:
+        ledger.commit()
+    return len(new_df) if write_transactions is not None else 0
+
+
+def rebuild_import(excel_path, transactions_csv=None, investments_csv=None, ledger=None, account=DEFAULT_ACCOUNT,
+                   category_mode=CATEGORY_MODE_FORMULA, snapshots=None):
+    """Read the given CSV downloads and import them with rebuild_workbook."""
+    if transactions_csv is not None and not os.path.exists(transactions_csv):
+        raise FileNotFoundError(f"CSV file not found at: {transactions_csv}")
+    transactions = load_transactions_csv(transactions_csv) if transactions_csv is not None else None
+    investments = load_investments_csv(investments_csv) if investments_csv is not None else None
+    return rebuild_workbook(excel_path, transactions, investments, ledger, account, category_mode, snapshots)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import the downloads by rebuilding the workbook as a stream")
+    parser.add_argument('--transactions-csv', default=TRANSACTIONS_CSV_PATH)
+    parser.add_argument('--investments-csv', default=INVESTMENTS_CSV_PATH)
+    parser.add_argument('--no-investments', action='store_true', help="Import the Transactions download only")
+    args = parser.parse_args()
+
+    config = load_config()
+    excel_path = config.get("excel_path", DEFAULT_EXCEL_PATH)
+    account = config.get("account", DEFAULT_ACCOUNT)
+    ledger = open_ledger(config)
+    snapshots = open_snapshots(config, account)
+
+    try:
+        with run_metrics('import_rebuild', excel_path, profile=config.get("profile", False)):
+            rebuild_import(excel_path, args.transactions_csv, None if args.no_investments else args.investments_csv,
+                           ledger=ledger, account=account,
+                           category_mode=config.get("category_mode", CATEGORY_MODE_FORMULA), snapshots=snapshots)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except PermissionError as e:
+        print(f"Error: {e}")
+    except ValueError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
+    finally:
+        if ledger is not None:
+            ledger.close()
+        if snapshots is not None:
+            snapshots.close()
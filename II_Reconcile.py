@@ -0,0 +1,190 @@
+# II_Reconcile.py
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from II_Constants import (
+    TRANSACTIONS_CSV_PATH, INVESTMENTS_CSV_PATH, TRANSACTIONS_COLUMNS,
+    RECONCILE_BALANCE_TOLERANCE, RECONCILE_QTY_TOLERANCE, RECONCILE_REPORT_ROWS
+)
+
+DATE_COLUMN = 2  # Column B
+RUNNING_BALANCE_COLUMN = DATE_COLUMN + TRANSACTIONS_COLUMNS.index('Running Balance')
+BREAK_COLUMNS = ['Date', 'Description', 'Reference', 'Previous Balance', 'Amount', 'Running Balance', 'Difference']
+
+
+def holding_keys(df):
+    """Symbol of each row, or its Sedol where there is no Symbol."""
+    return df['Symbol'].where(df['Symbol'].notna(), df['Sedol'])
+
+
+def sheet_closing_balance(sheet, last_row):
+    """
+    Latest Running Balance in the Transactions sheet. Rows are in date order and, within
+    a day, in download order (newest first), so it is the top row of the last date.
+    """
+    closing = None
+    last_date = sheet.cell(row=last_row, column=DATE_COLUMN).value if last_row > 1 else None
+    row = last_row
+    while row > 1 and sheet.cell(row=row, column=DATE_COLUMN).value == last_date:
+        balance = sheet.cell(row=row, column=RUNNING_BALANCE_COLUMN).value
+        if isinstance(balance, (int, float)):
+            closing = float(balance)
+        row -= 1
+    return closing
+
+
+class Reconciliation:
+    """
+    Checks a Transactions download before it is written: Running Balance continuity
+    against Debit and Credit, the join between the first new row and the sheet's last
+    Running Balance, and summed Quantity per holding against Qty in Investments.csv.
+
+    add() takes the normalized download in one frame or in chunks (in download order,
+    newest first, as the streaming import reads them); each chunk is one vectorized
+    pass. finish() runs the checks that need the sheet, the ledger or Investments.csv.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.breaks = []  # DataFrames of BREAK_COLUMNS
+        self.break_count = 0
+        self._segments = []  # (opening, closing, first row) of each chunk, newest chunk first
+        self.new_opening = None  # Balance before the oldest new row
+        self.quantities = pd.Series(dtype=float)  # Per holding, every row of the download
+        self.new_quantities = pd.Series(dtype=float)  # Per holding, new rows only
+        self.sheet_balance = None
+        self.holdings = None  # DataFrame of holdings whose quantities differ
+        self.quantity_source = None
+
+    def add(self, df, is_new=None):
+        """Check a normalized chunk; is_new marks the rows not yet in the workbook (default: all)."""
+        if df.empty:
+            return
+        self.rows += len(df)
+        is_new = np.ones(len(df), dtype=bool) if is_new is None else np.asarray(is_new, dtype=bool)
+
+        # Chronological order: by date, and within a day oldest first (the download lists each day newest first)
+        dates = df['Date'].to_numpy(dtype='datetime64[ns]')
+        order = np.lexsort((-np.arange(len(df)), dates))
+        balance = df['Running Balance'].to_numpy(dtype=float)[order]
+        amount = (df['Credit'].astype(float).fillna(0) + df['Debit'].astype(float).fillna(0)).to_numpy()[order]
+        valid = ~np.isnat(dates[order]) & ~np.isnan(balance)
+        order, balance, amount = order[valid], balance[valid], amount[valid]
+
+        if len(order):
+            difference = balance[1:] - (balance[:-1] + amount[1:])
+            bad = np.flatnonzero(np.abs(difference) > RECONCILE_BALANCE_TOLERANCE)
+            if len(bad):
+                self._add_breaks(df.iloc[order[bad + 1]], balance[bad], amount[bad + 1],
+                                 balance[bad + 1], difference[bad])
+            self._segments.append((balance[0] - amount[0], balance[-1], df.iloc[order[0]]))
+            new = np.flatnonzero(is_new[order])
+            if len(new):
+                self.new_opening = balance[new[0]] - amount[new[0]]  # Later chunks are older
+
+        traded = df['Quantity'].notna().to_numpy()
+        keys = holding_keys(df)
+        self.quantities = self.quantities.add(df['Quantity'][traded].groupby(keys[traded]).sum(), fill_value=0)
+        traded &= is_new
+        self.new_quantities = self.new_quantities.add(
+            df['Quantity'][traded].groupby(keys[traded]).sum(), fill_value=0)
+
+    def _add_breaks(self, rows, previous, amount, balance, difference):
+        self.break_count += len(rows)
+        self.breaks.append(pd.DataFrame({
+            'Date': rows['Date'].to_numpy(), 'Description': rows['Description'].to_numpy(),
+            'Reference': rows['Reference'].to_numpy(), 'Previous Balance': previous, 'Amount': amount,
+            'Running Balance': balance, 'Difference': difference.round(2),
+        }))
+
+    def finish(self, sheet_balance=None, investments=None, ledger_quantities=None):
+        """
+        Check the chunk boundaries, the join with sheet_balance (the sheet's last Running
+        Balance) and, given an Investments frame, the holdings. Quantities are the
+        ledger_quantities plus the new rows when the ledger has history for the account,
+        otherwise the whole download, which then has to cover the account's full history.
+        """
+        for newer, older in zip(self._segments, self._segments[1:]):
+            difference = newer[0] - older[1]
+            if abs(difference) > RECONCILE_BALANCE_TOLERANCE:
+                row = newer[2].to_frame().T
+                self._add_breaks(row, np.array([older[1]]), np.array([newer[2]['Running Balance'] - newer[0]]),
+                                 np.array([newer[2]['Running Balance']]), np.array([difference]))
+        self.sheet_balance = sheet_balance
+
+        if investments is not None:
+            if ledger_quantities is not None and len(ledger_quantities):
+                quantities = ledger_quantities.add(self.new_quantities, fill_value=0)
+                self.quantity_source = "ledger and new rows"
+            else:
+                quantities = self.quantities
+                self.quantity_source = "download"
+            held = investments[investments['Symbol'].notna() & (investments['Symbol'] != '')]
+            qty = pd.to_numeric(held['Qty'], errors='coerce').groupby(held['Symbol']).sum()
+            df = pd.DataFrame({'Transactions Qty': quantities, 'Qty': qty}).astype(float).fillna(0)
+            df['Difference'] = df['Transactions Qty'] - df['Qty']
+            df = df[df['Difference'].abs() > RECONCILE_QTY_TOLERANCE]
+            self.holdings = df.rename_axis('Holding').reset_index()
+        return self
+
+    @property
+    def join_difference(self):
+        if self.sheet_balance is None or self.new_opening is None:
+            return None
+        return round(self.new_opening - self.sheet_balance, 2)
+
+    @property
+    def ok(self):
+        join = self.join_difference
+        return (self.break_count == 0 and (join is None or abs(join) <= RECONCILE_BALANCE_TOLERANCE)
+                and (self.holdings is None or self.holdings.empty))
+
+    def report(self):
+        """Print the discrepancies, at most RECONCILE_REPORT_ROWS per check."""
+        print(f"Reconciliation of {self.rows} download rows:")
+        if self.break_count:
+            print(f"  Running Balance: {self.break_count} break(s) against Debit/Credit")
+            breaks = pd.concat(self.breaks, ignore_index=True).sort_values('Date', kind='stable')
+            print(breaks.head(RECONCILE_REPORT_ROWS).to_string(index=False))
+        else:
+            print("  Running Balance: continuous")
+
+        join = self.join_difference
+        if join is None:
+            print("  Join with the sheet: not checked")
+        elif abs(join) > RECONCILE_BALANCE_TOLERANCE:
+            print(f"  Join with the sheet: the new rows open at {self.new_opening:,.2f} but the sheet's last "
+                  f"Running Balance is {self.sheet_balance:,.2f} (difference {join:,.2f}); "
+                  f"rows may be missing from the download")
+        else:
+            print(f"  Join with the sheet: opens at the sheet's last Running Balance {self.sheet_balance:,.2f}")
+
+        if self.holdings is None:
+            print("  Holdings: not checked")
+        elif len(self.holdings):
+            print(f"  Holdings: {len(self.holdings)} quantity difference(s) ({self.quantity_source} against Qty)")
+            print(self.holdings.head(RECONCILE_REPORT_ROWS).to_string(index=False))
+        else:
+            print(f"  Holdings: quantities match Qty ({self.quantity_source})")
+
+
+if __name__ == "__main__":
+    from II_Normalize import load_transactions_csv
+    from II_InvestmentsImport import load_investments_csv
+
+    parser = argparse.ArgumentParser(description="Reconcile the CSV downloads on their own, without a workbook")
+    parser.add_argument('--transactions-csv', default=TRANSACTIONS_CSV_PATH)
+    parser.add_argument('--investments-csv', default=INVESTMENTS_CSV_PATH)
+    args = parser.parse_args()
+
+    try:
+        reconciliation = Reconciliation()
+        reconciliation.add(load_transactions_csv(args.transactions_csv))
+        investments = load_investments_csv(args.investments_csv) if os.path.exists(args.investments_csv) else None
+        reconciliation.finish(investments=investments)
+        reconciliation.report()
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
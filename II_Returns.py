@@ -0,0 +1,226 @@
+# II_Returns.py
+import argparse
+import numpy as np
+import pandas as pd
+from II_Constants import (
+    DEFAULT_EXCEL_PATH, DEFAULT_ACCOUNT, RETURNS_PORTFOLIO, XIRR_GUESS, XIRR_TOLERANCE, XIRR_MAX_ITERATIONS
+)
+from II_Config import load_config
+from II_Ledger import workbook_date
+from II_Metrics import stage
+from II_Reader import load_investments_frame
+from II_Partition import load_history_frame
+from II_Snapshots import open_snapshots
+
+RETURN_COLUMNS = ['Symbol', 'First Flow', 'Flows', 'Invested', 'Returned', 'Market Value £', 'XIRR', 'TWR']
+
+
+def _days(dates):
+    return pd.to_datetime(pd.Series(dates)).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+def _npv(rates, amounts, years, groups, count):
+    """NPV of every series at its rate and the derivative by the rate."""
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        growth = np.log1p(rates)
+        discounted = amounts * np.exp(-years * growth[groups])
+        value = np.bincount(groups, discounted, count)
+        slope = np.bincount(groups, -years * discounted, count) / (1 + rates)
+    return value, slope
+
+
+def xirr(amounts, dates, groups=None, guess=XIRR_GUESS):
+    """
+    Excel's XIRR of many cash-flow series solved as one batch. amounts, dates and groups
+    (the series number of each flow, 0 to n-1) are flat arrays; returns the n rates.
+    The year fractions are days / 365 from each series' first date, as in Excel.
+
+    Newton steps run on every series at once, each step one pass over the flows. A
+    series that has not converged after XIRR_MAX_ITERATIONS, or whose rate left
+    (-1, inf), is solved by bisection instead, again all together. A series whose flows
+    are all of one sign has no rate and gives NaN (Excel's #NUM!).
+    """
+    amounts = np.asarray(amounts, dtype=float)
+    days = _days(dates)
+    groups = np.zeros(len(amounts), dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+    count = int(groups.max()) + 1 if len(groups) else 0
+    first = np.full(count, np.iinfo(np.int64).max)
+    np.minimum.at(first, groups, days)
+    years = (days - first[groups]) / 365.0
+    solvable = ((np.bincount(groups, amounts > 0, count) > 0) & (np.bincount(groups, amounts < 0, count) > 0))
+
+    rates = np.where(solvable, float(guess), np.nan)
+    active = solvable.copy()
+    for _ in range(XIRR_MAX_ITERATIONS):
+        value, slope = _npv(rates, amounts, years, groups, count)
+        with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+            step = np.where(active, value / slope, 0.0)
+        rates = rates - step
+        converged = np.abs(step) <= XIRR_TOLERANCE * np.maximum(1.0, np.abs(rates))
+        active &= ~converged & np.isfinite(rates) & (rates > -1)
+        if not active.any():
+            break
+    failed = solvable & (active | ~np.isfinite(rates) | (rates <= -1))
+    if failed.any():
+        rates[failed] = _bisect(failed, amounts, years, groups, count)[failed]
+    return rates
+
+
+def _bisect(selected, amounts, years, groups, count):
+    """Rates of the selected series by bisection; NaN where no bracket is found up to a rate of 1e9."""
+    low = np.full(count, -1 + 1e-9)
+    high = np.ones(count)
+    low_value = _npv(low, amounts, years, groups, count)[0]
+    bracketed = np.zeros(count, dtype=bool)
+    while True:
+        bracketed |= selected & (np.sign(_npv(high, amounts, years, groups, count)[0]) != np.sign(low_value))
+        widen = selected & ~bracketed & (high < 1e9)
+        if not widen.any():
+            break
+        high = np.where(widen, high * 10, high)
+    for _ in range(4 * XIRR_MAX_ITERATIONS):
+        middle = (low + high) / 2
+        value = _npv(middle, amounts, years, groups, count)[0]
+        same = np.sign(value) == np.sign(low_value)
+        low, low_value = np.where(same, middle, low), np.where(same, value, low_value)
+        high = np.where(same, high, middle)
+        if np.all((high - low)[bracketed] <= XIRR_TOLERANCE * np.maximum(1.0, np.abs(low[bracketed]))):
+            break
+    return np.where(bracketed, (low + high) / 2, np.nan)
+
+
+def _holding(df):
+    def text(column):
+        values = df[column].astype(object).where(df[column].notna())
+        return values.where(values.astype(str).str.strip().ne('') & values.ne('n/a'))
+    return text('Symbol').fillna(text('Sedol'))
+
+
+def holding_flows(transactions):
+    """
+    Cash flows of each holding from Transactions rows, from the investor's side: the
+    Debit of a buy (negative) and the Credit of a sale or dividend (positive), per
+    Symbol (the Sedol where a row has none) and Date. Rows of neither, such as
+    interest, are not holding flows.
+    """
+    debit = pd.to_numeric(transactions['Debit'], errors='coerce')
+    credit = pd.to_numeric(transactions['Credit'], errors='coerce')
+    dates = pd.to_datetime(transactions['Date'], errors='coerce').dt.normalize()
+    symbol = _holding(transactions)
+    flows = symbol.notna() & dates.notna() & (debit.notna() | credit.notna())
+    return pd.DataFrame({
+        'Symbol': symbol[flows].astype(str), 'Date': dates[flows],
+        'Amount': debit[flows].fillna(0.0) + credit[flows].fillna(0.0),
+    }).reset_index(drop=True)
+
+
+def money_weighted_returns(transactions, investments, as_of=None):
+    """
+    XIRR of every holding and of the portfolio (all holdings together; cash and interest
+    left out) from its cash flows, with the Market Value £ of the holdings in the
+    Investments frame as a final inflow on as_of (default: the latest flow). Flows
+    after as_of are left out. Returns a frame of RETURN_COLUMNS but TWR, the portfolio last.
+    """
+    flows = holding_flows(transactions)
+    as_of = pd.Timestamp(as_of).normalize() if as_of is not None else flows['Date'].max()
+    flows = flows[flows['Date'] <= as_of]
+    holdings = investments[investments['Symbol'].notna()]
+    values = pd.to_numeric(holdings['Market Value £'], errors='coerce').fillna(0.0).groupby(
+        holdings['Symbol'].astype(str)).sum()
+    values = values[values != 0]
+    values[RETURNS_PORTFOLIO] = values.sum()
+    final = pd.DataFrame({'Symbol': values.index, 'Date': as_of, 'Amount': values.to_numpy()})
+
+    series = pd.concat([flows, flows.assign(Symbol=RETURNS_PORTFOLIO), final], ignore_index=True)
+    symbols = sorted(set(series['Symbol']) - {RETURNS_PORTFOLIO}) + [RETURNS_PORTFOLIO]
+    codes = pd.Categorical(series['Symbol'], categories=symbols).codes
+    with stage('xirr') as current:
+        rates = xirr(series['Amount'], series['Date'], codes)
+        current.rows = len(series)
+
+    paid = series.iloc[:len(series) - len(final)]
+    paid = paid.assign(Invested=(-paid['Amount']).clip(lower=0.0), Returned=paid['Amount'].clip(lower=0.0))
+    grouped = paid.groupby(pd.Categorical(paid['Symbol'], categories=symbols), observed=False)
+    return pd.DataFrame({
+        'Symbol': symbols,
+        'First Flow': grouped['Date'].min().to_numpy(),
+        'Flows': grouped['Amount'].size().to_numpy(),
+        'Invested': grouped['Invested'].sum().to_numpy(),
+        'Returned': grouped['Returned'].sum().to_numpy(),
+        'Market Value £': values.reindex(symbols, fill_value=0.0).to_numpy(),
+        'XIRR': rates,
+    })
+
+
+def time_weighted_returns(transactions, valuations):
+    """
+    Returns over each period between consecutive snapshot dates, per symbol and for the
+    portfolio, as a date x symbol frame indexed by the period's end. valuations is the
+    Market Value £ frame of SnapshotStore.valuations(). A period's return is
+    (V1 + out) / (V0 + in) - 1, with purchases in the period counted as invested at its
+    start and sales and dividends as taken out at its end, so a holding bought or sold
+    out within a period still has that period's return. NaN where nothing was invested.
+    """
+    flows = holding_flows(transactions)
+    dates = valuations.index.to_numpy().astype('datetime64[D]')
+    period = np.searchsorted(dates, flows['Date'].to_numpy().astype('datetime64[D]'), side='left')
+    within = (period > 0) & (period < len(dates))  # After the first snapshot, up to the last
+    flows, period = flows[within], period[within]
+    symbols = sorted(set(valuations.columns) | set(flows['Symbol']))
+    value = valuations.reindex(columns=symbols, fill_value=0.0).to_numpy(dtype=float)
+    column = pd.Categorical(flows['Symbol'], categories=symbols).codes
+    amount = flows['Amount'].to_numpy()
+    paid_in, paid_out = np.zeros_like(value), np.zeros_like(value)
+    np.add.at(paid_in, (period, column), np.where(amount < 0, -amount, 0.0))
+    np.add.at(paid_out, (period, column), np.where(amount > 0, amount, 0.0))
+    value, paid_in, paid_out = (np.column_stack([array, array.sum(axis=1)]) for array in (value, paid_in, paid_out))
+
+    start = value[:-1] + paid_in[1:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = np.where(start > 0, (value[1:] + paid_out[1:]) / start - 1, np.nan)
+    return pd.DataFrame(returns, index=valuations.index[1:], columns=symbols + [RETURNS_PORTFOLIO])
+
+
+def portfolio_returns(excel_path, snapshots=None, as_of=None):
+    """
+    XIRR of every holding and the portfolio from the workbook's Transactions history
+    (archived years included) and Investments sheet and, with a snapshot store, the TWR compounded over its
+    snapshot history. Returns the RETURN_COLUMNS frame and the period returns (or None).
+    """
+    transactions = load_history_frame(excel_path)
+    investments = load_investments_frame(excel_path)
+    if as_of is None:
+        as_of = max(pd.Timestamp(workbook_date(excel_path)), transactions['Date'].max())
+    df = money_weighted_returns(transactions, investments, as_of)
+    periods = None
+    if snapshots is not None:
+        valuations = snapshots.valuations(end=as_of)
+        if len(valuations) > 1:
+            with stage('twr') as current:
+                periods = time_weighted_returns(transactions, valuations)
+                current.rows = len(periods)
+    df['TWR'] = df['Symbol'].map((1 + periods.fillna(0.0)).prod() - 1) if periods is not None else np.nan
+    return df[RETURN_COLUMNS], periods
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="XIRR and time-weighted return per holding and for the portfolio")
+    parser.add_argument('--excel', help="Workbook (default: excel_path in config.json)")
+    parser.add_argument('--as-of', help="Valuation date of the Investments sheet (default: workbook date or latest transaction)")
+    parser.add_argument('--periods', action='store_true', help="Also print the return of every snapshot period")
+    args = parser.parse_args()
+
+    config = load_config()
+    excel_path = args.excel or config.get("excel_path", DEFAULT_EXCEL_PATH)
+    snapshots = open_snapshots(config, config.get("account", DEFAULT_ACCOUNT))
+    try:
+        returns, periods = portfolio_returns(excel_path, snapshots, args.as_of)
+        print(returns.to_string(index=False))
+        if args.periods and periods is not None:
+            print(periods.to_string())
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except ValueError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
@@ -1,26 +1,27 @@
 # II_RollReport.py
 import os
 import logging
-import tkinter as tk
-from tkinter import messagebox, filedialog, simpledialog
 from datetime import datetime, timedelta
 import shutil
 
 # Import centralized config and constants
 from II_Config import load_config, update_config
 from II_Constants import DEFAULT_BASE_PATH
+from II_Metrics import run_metrics, stage
 
 # ----------------------------------------------------------------------
 # LOGGING
 # ----------------------------------------------------------------------
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler("roll_report.log", mode="a", encoding="utf-8"),
-        logging.StreamHandler()
-    ]
-)
+def setup_logging(log_path="roll_report.log"):
+    """Log to log_path (in the working directory) and the console; called by the entry points, not on import."""
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        handlers=[
+            logging.FileHandler(log_path, mode="a", encoding="utf-8"),
+            logging.StreamHandler()
+        ]
+    )
 
 # ----------------------------------------------------------------------
 # HELPERS
@@ -56,11 +57,36 @@ def extract_date_from_filename(filepath: str) -> str:
     return date_part
 
 
+def previous_business_day(today=None) -> str:
+    """Default business date as MM/DD/YYYY: Friday on a Monday, else yesterday."""
+    today = today or datetime.now()
+    days_back = 3 if today.weekday() == 0 else 1  # Monday → Friday, else yesterday
+    return (today - timedelta(days=days_back)).strftime("%m/%d/%Y")
+
+
+def confirm_overwrite(new_file_path: str) -> bool:
+    """Ask in a dialog whether an existing report may be overwritten."""
+    import tkinter as tk
+    from tkinter import messagebox
+
+    root = tk.Tk()
+    root.withdraw()
+    confirm = messagebox.askyesno("Overwrite?", f"File already exists:\n{new_file_path}\n\nOverwrite?")
+    root.destroy()
+    return confirm
+
+
 # ----------------------------------------------------------------------
 # CORE ROLL FUNCTION
 # ----------------------------------------------------------------------
-def roll_to_next_business_day(workbook_path: str, business_date_str: str) -> str:
-    """Copy the workbook to a new file named after the given business date."""
+def roll_to_next_business_day(workbook_path: str, business_date_str: str, overwrite=None, compact=None) -> str:
+    """
+    Copy the workbook to a new file named after the given business date.
+    If the target exists, overwrite=None asks in a dialog; True or False decide
+    without one, for scheduled and headless runs.
+    With compact (default: "compact_on_roll" in config.json) the new file is a
+    compacted copy instead (see II_Compact), with the savings logged.
+    """
     logging.info(f"Rolling workbook: {workbook_path}")
 
     # 1. Validate source file
@@ -99,22 +125,46 @@ def roll_to_next_business_day(workbook_path: str, business_date_str: str) -> str
 
     # 7. Prevent overwrite without confirmation
     if os.path.exists(new_file_path):
-        root = tk.Tk()
-        root.withdraw()
-        confirm = messagebox.askyesno("Overwrite?", f"File already exists:\n{new_file_path}\n\nOverwrite?")
-        root.destroy()
-        if not confirm:
-            raise RuntimeError("Operation cancelled by user.")
-
-    # 8. Copy file
+        if overwrite is None:
+            if not confirm_overwrite(new_file_path):
+                raise RuntimeError("Operation cancelled by user.")
+        elif not overwrite:
+            raise RuntimeError(f"Target file already exists: {new_file_path}")
+
+    # 8. Copy file, compacted if asked for
+    if compact is None:
+        compact = config.get("compact_on_roll", False)
+    compacted = False
+    if compact:
+        from II_Compact import compact_workbook, describe  # Loads openpyxl, so only when compacting
+        try:
+            with stage('roll_compact') as current:
+                stats = compact_workbook(workbook_path, new_file_path)
+            logging.info(f"Compacted to {new_file_path} in {current.seconds:.2f}s: {describe(stats)}")
+            compacted = True
+        except Exception as e:
+            logging.warning(f"Compaction failed ({e}); copying the workbook unchanged instead")
+
+    if not compacted:
+        try:
+            with stage('roll_copy') as current:
+                shutil.copy2(workbook_path, new_file_path)
+            logging.info(f"Copied to {new_file_path} in {current.seconds:.2f}s")
+        except Exception as e:
+            logging.error(f"Copy failed: {e}")
+            raise RuntimeError(f"Failed to copy file: {e}")
+
+    # 9. Carry the dedup index and frame caches over, so the next import reads only the new rows
+    from II_TransactionIndex import carry_index  # Loads pandas, so only once the file is written
+    from II_Reader import carry_frame_caches
     try:
-        shutil.copy2(workbook_path, new_file_path)
-        logging.info(f"Copied to {new_file_path}")
-    except Exception as e:
-        logging.error(f"Copy failed: {e}")
-        raise RuntimeError(f"Failed to copy file: {e}")
+        carried = (['transactions index'] if carry_index(workbook_path, new_file_path) else [])
+        carried += [f"{name} frame cache" for name in carry_frame_caches(workbook_path, new_file_path)]
+        logging.info(f"Carried over: {', '.join(carried) or 'nothing'}")
+    except OSError as e:
+        logging.warning(f"Could not carry the index and caches over ({e}); the next import rebuilds them")
 
-    # 9. Update config with new path
+    # 10. Update config with new path
     update_config(new_file_path)
 
     return new_file_path
@@ -124,6 +174,10 @@ def roll_to_next_business_day(workbook_path: str, business_date_str: str) -> str
 # MAIN / GUI
 # ----------------------------------------------------------------------
 def main():
+    import tkinter as tk
+    from tkinter import messagebox, filedialog, simpledialog
+
+    setup_logging()
     logging.info("=== Roll-Report utility started ===")
     root = tk.Tk()
     root.withdraw()
@@ -149,10 +203,7 @@ def main():
         return
 
     # Default business date (previous business day)
-    today = datetime.now()
-    weekday = today.weekday()
-    days_back = 3 if weekday == 0 else 1  # Monday → Friday, else yesterday
-    default_date = (today - timedelta(days=days_back)).strftime("%m/%d/%Y")
+    default_date = previous_business_day()
 
     business_date = simpledialog.askstring(
         "Business Date",
@@ -171,7 +222,8 @@ def main():
 
     # Perform the roll
     try:
-        new_path = roll_to_next_business_day(workbook_path, business_date)
+        with run_metrics('roll_report', workbook_path, profile=config.get("profile", False)):
+            new_path = roll_to_next_business_day(workbook_path, business_date)
         messagebox.showinfo(
             "Success",
             f"New report created:\n{new_path}"
@@ -0,0 +1,225 @@
+# II_Snapshots.py
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from II_Constants import DEFAULT_BASE_PATH, DEFAULT_ACCOUNT, SNAPSHOTS_DIRNAME, SNAPSHOT_COLUMNS, UNIT_COLUMN_SUFFIX
+from II_Config import load_config
+
+# One holding on one date. batch numbers the imports, so a date imported twice keeps its last snapshot
+SNAPSHOT_DTYPE = np.dtype([
+    ('date', '<i4'), ('batch', '<i4'), ('symbol', '<i4'), ('currency', 'u1'),
+    ('qty', '<f8'), ('price', '<f8'), ('market_value_gbp', '<f8'), ('book_cost', '<f8'),
+])
+SNAPSHOT_FIELDS = ['qty', 'price', 'market_value_gbp', 'book_cost']  # In SNAPSHOT_COLUMNS order
+CURRENCIES = ['', 'GBP', 'USD']  # currency field codes; '' where the download did not say
+RECORDS_FILENAME = 'snapshots.dat'
+SYMBOLS_FILENAME = 'symbols.txt'
+
+
+def snapshots_path_for(config):
+    """Snapshot store location: config "snapshots_path", else II_Snapshots in the base folder."""
+    return config.get("snapshots_path") or os.path.join(config.get("base_path", DEFAULT_BASE_PATH), SNAPSHOTS_DIRNAME)
+
+
+def open_snapshots(config, account=DEFAULT_ACCOUNT):
+    """Open an account's snapshot store, or return None if the folder it lives in does not exist."""
+    path = snapshots_path_for(config)
+    if not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+        print(f"Warning: Snapshot folder not found for {path}. Holdings will not be recorded as snapshots.")
+        return None
+    return SnapshotStore(os.path.join(path, account))
+
+
+def _day(value):
+    return int(np.datetime64(pd.Timestamp(value).date(), 'D').astype(np.int64))
+
+
+class SnapshotStore:
+    """
+    Append-only history of the holdings, one dated snapshot per Investments import.
+
+    Each holding is a fixed-width record (date, batch, symbol id, currency, Qty, Price,
+    Market Value £, Book Cost) appended to snapshots.dat; symbols.txt maps symbol ids
+    to symbols, one per line. Reads memory-map the record file, so a position series
+    or a whole portfolio is a few numpy masks over it and no workbook is opened.
+    Price and Book Cost are in the holding's Currency (pounds, not pence, for GBP);
+    Market Value £ is always in pounds.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.records_path = os.path.join(folder, RECORDS_FILENAME)
+        self.symbols_path = os.path.join(folder, SYMBOLS_FILENAME)
+        self._symbols = None
+        self._records = None
+        self._current = None
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+    def symbols(self):
+        """Symbols in id order."""
+        if self._symbols is None:
+            self._symbols = []
+            if os.path.exists(self.symbols_path):
+                with open(self.symbols_path, 'r', encoding='utf-8') as f:
+                    self._symbols = f.read().splitlines()
+        return self._symbols
+
+    def records(self):
+        """The records, memory-mapped. A torn record at the end of the file (an interrupted append) is ignored."""
+        count = os.path.getsize(self.records_path) // SNAPSHOT_DTYPE.itemsize if os.path.exists(self.records_path) else 0
+        if self._records is None or len(self._records) != count:
+            self._records = (np.memmap(self.records_path, dtype=SNAPSHOT_DTYPE, mode='r', shape=(count,))
+                             if count else np.zeros(0, dtype=SNAPSHOT_DTYPE))
+            self._current = None
+        return self._records
+
+    def append(self, df, as_of):
+        """
+        Append the holdings in an Investments frame (rows with a Symbol) as the snapshot
+        for as_of. New symbols are added to symbols.txt before the records that use them.
+        Returns the number of holdings recorded.
+        """
+        holdings = df[df['Symbol'].notna() & (df['Symbol'].astype(str) != '')]
+        symbols = self.symbols()
+        ids = {symbol: i for i, symbol in enumerate(symbols)}
+        new = [symbol for symbol in dict.fromkeys(holdings['Symbol'].astype(str)) if symbol not in ids]
+        os.makedirs(self.folder, exist_ok=True)
+        if new:
+            with open(self.symbols_path, 'a', encoding='utf-8') as f:
+                f.write(''.join(f"{symbol}\n" for symbol in new))
+            ids.update((symbol, len(symbols) + i) for i, symbol in enumerate(new))
+            symbols.extend(new)
+
+        records = self.records()
+        count = len(records)
+        batch = int(records['batch'][-1]) + 1 if count else 0
+        records = self._records = None  # Unmap before writing; Windows cannot resize a mapped file
+        block = np.zeros(len(holdings), dtype=SNAPSHOT_DTYPE)
+        block['date'] = _day(as_of)
+        block['batch'] = batch
+        block['symbol'] = holdings['Symbol'].astype(str).map(ids).to_numpy()
+        unit_column = 'Price' + UNIT_COLUMN_SUFFIX
+        if unit_column in holdings.columns:
+            codes = holdings[unit_column].map({code: i for i, code in enumerate(CURRENCIES)})
+            block['currency'] = codes.fillna(0).to_numpy(dtype=np.uint8)
+        for column, field in zip(SNAPSHOT_COLUMNS, SNAPSHOT_FIELDS):
+            block[field] = pd.to_numeric(holdings[column], errors='coerce') if column in holdings.columns else np.nan
+
+        # Records are only ever appended, and a torn tail from an interrupted append is cut first
+        with open(self.records_path, 'ab') as f:
+            if f.tell() != count * SNAPSHOT_DTYPE.itemsize:
+                f.truncate(count * SNAPSHOT_DTYPE.itemsize)
+            f.write(block.tobytes())
+        print(f"Snapshot recorded: {len(block)} holdings as of {pd.Timestamp(as_of):%Y-%m-%d}")
+        return len(block)
+
+    def close(self):
+        self._records = None
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def current(self):
+        """Mask of the records in the last snapshot of their date: re-importing a date replaces its snapshot."""
+        records = self.records()
+        if self._current is None:
+            # Batches only grow along the file, so a date's last batch is the batch of its last record
+            dates = records['date']
+            unique, last = np.unique(dates[::-1], return_index=True)
+            latest = records['batch'][len(dates) - 1 - last]
+            self._current = records['batch'] == latest[np.searchsorted(unique, dates)]
+        return self._current
+
+    def _frame(self, selected):
+        df = pd.DataFrame({column: selected[field] for column, field in zip(SNAPSHOT_COLUMNS, SNAPSHOT_FIELDS)})
+        df.insert(0, 'Currency', np.array(CURRENCIES, dtype=object)[selected['currency']])
+        return df
+
+    def dates(self):
+        """Dates with a snapshot, oldest first."""
+        return pd.to_datetime(np.unique(self.records()['date']).astype('datetime64[D]'))
+
+    def position(self, symbol, start=None, end=None):
+        """
+        One symbol's Qty, Price, Market Value £ and Book Cost on every snapshot date,
+        indexed by date, optionally within an inclusive date range.
+        """
+        ids = {s: i for i, s in enumerate(self.symbols())}
+        records = self.records()
+        mask = self.current() & (records['symbol'] == ids.get(symbol, -1))
+        if start is not None:
+            mask &= records['date'] >= _day(start)
+        if end is not None:
+            mask &= records['date'] <= _day(end)
+        selected = records[mask]
+        selected = selected[np.argsort(selected['date'], kind='stable')]
+        df = self._frame(selected)
+        df.index = pd.DatetimeIndex(selected['date'].astype('datetime64[D]'), name='Date')
+        return df
+
+    def valuation(self, symbol, start=None, end=None):
+        """One symbol's Market Value £ series, indexed by date."""
+        return self.position(symbol, start, end)['Market Value £']
+
+    def valuations(self, start=None, end=None):
+        """
+        Market Value £ of every symbol on every snapshot date as a date x symbol frame,
+        optionally within an inclusive date range; 0 where a symbol was not held.
+        """
+        records = self.records()
+        mask = self.current().copy()
+        if start is not None:
+            mask &= records['date'] >= _day(start)
+        if end is not None:
+            mask &= records['date'] <= _day(end)
+        selected = records[mask]
+        dates, rows = np.unique(selected['date'], return_inverse=True)
+        symbols, columns = np.unique(selected['symbol'], return_inverse=True)
+        values = np.zeros((len(dates), len(symbols)))
+        np.add.at(values, (rows, columns), np.nan_to_num(selected['market_value_gbp']))
+        return pd.DataFrame(values, index=pd.DatetimeIndex(dates.astype('datetime64[D]'), name='Date'),
+                            columns=np.array(self.symbols(), dtype=object)[symbols])
+
+    def portfolio(self, as_of=None):
+        """The holdings in the latest snapshot on or before as_of (default: the latest), in download order."""
+        records = self.records()
+        dates = records['date'][self.current()]
+        if as_of is not None:
+            dates = dates[dates <= _day(as_of)]
+        if not len(dates):
+            return pd.DataFrame(columns=['Symbol', 'Currency'] + SNAPSHOT_COLUMNS)
+        selected = records[self.current() & (records['date'] == dates.max())]
+        df = self._frame(selected)
+        df.insert(0, 'Symbol', np.array(self.symbols(), dtype=object)[selected['symbol']])
+        df.attrs['as_of'] = pd.Timestamp(np.datetime64(int(dates.max()), 'D'))
+        return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the holdings snapshot history")
+    parser.add_argument('--account', help="Account (default: account in config.json)")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--symbol', help="Print this symbol's position on every snapshot date")
+    group.add_argument('--date', help="Print the portfolio on this date (default: the latest snapshot)")
+    args = parser.parse_args()
+
+    config = load_config()
+    try:
+        store = open_snapshots(config, args.account or config.get("account", DEFAULT_ACCOUNT))
+        if store is None:
+            raise FileNotFoundError("Snapshot store not available")
+        if args.symbol:
+            print(store.position(args.symbol).to_string())
+        else:
+            portfolio = store.portfolio(args.date)
+            print(f"Portfolio as of {portfolio.attrs.get('as_of', '-')}:")
+            print(portfolio.to_string(index=False))
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except ValueError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
@@ -0,0 +1,137 @@
+# II_Streaming.py
+import heapq
+import os
+import pickle
+import tempfile
+from itertools import repeat
+import numpy as np
+import pandas as pd
+from II_Normalize import read_transactions_csv, normalize_transactions
+from II_TransactionIndex import transaction_keys
+from II_WorkbookSession import frame_rows
+
+DEFAULT_CHUNK_ROWS = 100_000
+RUN_BATCH_ROWS = 4096  # Rows per pickle record in a spilled run; bounds read-back memory per run
+
+
+def iter_normalized_chunks(csv_path, chunksize=DEFAULT_CHUNK_ROWS):
+    """Read a Transactions.csv in chunks and yield each chunk normalized and sorted by Date."""
+    for chunk in read_transactions_csv(csv_path, chunksize=chunksize):
+        yield normalize_transactions(chunk)
+
+
+def _date_sort_key(item):
+    # Same order as sort_values(by='Date', na_position='last'): unparsed dates go last
+    date = item[0][0]
+    return (1, 0) if date is None else (0, date.value)
+
+
+class SortedRuns:
+    """
+    Spill sorted chunks ("runs") to a temporary folder and merge them back in Date
+    order, so an external sort of any size only ever holds one chunk plus one small
+    batch per run in memory. Each item is a (row, key) pair: the row values as they
+    are written to the sheet (column B onwards) and the row's dedup key.
+    """
+
+    def __init__(self):
+        self._tmp = tempfile.TemporaryDirectory(prefix='ii_runs_')
+        self.paths = []
+        self.rows = 0
+        self.input_rows = 0  # Rows read before dedup filtering
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def add(self, df, keys):
+        """Spill one sorted chunk and its dedup keys as a run."""
+        if df.empty:
+            return
+        path = os.path.join(self._tmp.name, f'run_{len(self.paths):05d}.pkl')
+        items = list(zip(frame_rows(df), keys))
+        with open(path, 'wb') as f:
+            for start in range(0, len(items), RUN_BATCH_ROWS):
+                pickle.dump(items[start:start + RUN_BATCH_ROWS], f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.paths.append(path)
+        self.rows += len(items)
+
+    @staticmethod
+    def _iter_run(path):
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    batch = pickle.load(f)
+                except EOFError:
+                    return
+                yield from batch
+
+    def merge(self):
+        """
+        Yield (row, key) pairs from all runs in Date order. heapq.merge prefers the
+        earlier run on equal dates, so same-day rows keep their CSV order exactly as
+        the in-memory stable sort does.
+        """
+        return heapq.merge(*(self._iter_run(path) for path in self.paths), key=_date_sort_key)
+
+    def close(self):
+        self._tmp.cleanup()
+
+
+def spill_transaction_runs(csv_path, index=None, chunksize=DEFAULT_CHUNK_ROWS, reconciliation=None,
+                           check_new_rows=None):
+    """
+    Normalize a Transactions.csv chunk by chunk into SortedRuns, dropping rows the
+    dedup index already has. Each chunk is also added to an II_Reconcile.Reconciliation
+    when one is given, and its new rows passed to check_new_rows when that is given.
+    """
+    runs = SortedRuns()
+    seen = {}
+    try:
+        for chunk in iter_normalized_chunks(csv_path, chunksize):
+            runs.input_rows += len(chunk)
+            if index is not None:
+                new_chunk, keys = index.filter_new(chunk, seen)
+            else:
+                new_chunk, keys = chunk, [None] * len(chunk)
+            if reconciliation is not None:
+                reconciliation.add(chunk, chunk.index.isin(new_chunk.index))
+            chunk = new_chunk
+            if check_new_rows is not None and not chunk.empty:
+                check_new_rows(chunk)
+            runs.add(chunk, list(keys))
+    except Exception:
+        runs.close()
+        raise
+    return runs
+
+
+def _download_items(number, df):
+    """(date, download number, row position, dedup key) of the rows of one download, in Date order."""
+    dates = pd.to_datetime(df['Date'], errors='coerce')
+    order = np.where(dates.isna(), np.iinfo(np.int64).max, dates.to_numpy().astype('datetime64[ns]').astype(np.int64))
+    positions = np.argsort(order, kind='stable')  # Already sorted after normalize_transactions: one linear pass
+    keys = transaction_keys(df).to_numpy()
+    return zip(order[positions].tolist(), repeat(number), positions.tolist(), keys[positions].tolist())
+
+
+def merge_downloads(frames):
+    """
+    k-way merge of normalized Transactions downloads, given newest first, into one
+    Date-ordered frame without the rows they share. heapq.merge streams the date and
+    dedup key of every row in date order; a row whose key an earlier row of the merge
+    already had is dropped, so of two overlapping downloads the newer one's copy is
+    kept. Rows with equal dates come in download order, then in their order in the
+    download, as a stable sort of the frames concatenated newest first would put them.
+    Only the kept row positions are collected; the frame is assembled in one take.
+    """
+    seen, kept = set(), []
+    offsets = np.cumsum([0] + [len(df) for df in frames])
+    for _, number, position, key in heapq.merge(*(_download_items(number, df) for number, df in enumerate(frames))):
+        if key not in seen:
+            seen.add(key)
+            kept.append(offsets[number] + position)
+    return pd.concat(frames, ignore_index=True).take(kept).reset_index(drop=True)
@@ -0,0 +1,276 @@
+# II_SyntheticData.py
+import argparse
+import csv
+import os
+import random
+from copy import copy
+from datetime import datetime, timedelta
+import openpyxl
+import pandas as pd
+from openpyxl.cell import WriteOnlyCell
+from II_Constants import (
+    TRANSACTIONS_SHEET, TRANSACTIONS_FORMULA, TRANSACTIONS_COLUMNS, INVESTMENTS_SHEET, INVESTMENTS_FORMULA,
+    INVESTMENTS_COLUMNS, MAPNAME_SHEET, MAPEDGECASES_SHEET
+)
+from II_Format import formula_block
+from II_Normalize import normalize_transactions
+from II_WorkbookSession import frame_rows
+
+# Instruments from the sample downloads, then generated ones: (symbol, sedol, isin, name, currency)
+SAMPLE_INSTRUMENTS = [
+    ('AU', 'BRXH266', None, 'AngloGold', 'USD'),
+    ('EDV', 'BL6K5J4', None, 'Endeavour', 'GBP'),
+    ('HSBA', 'B2QPKJ1', None, 'HSBC Bank', 'GBP'),
+    ('SHEL', 'BF0P7H5', 'GB00BF0P7H59', 'Royal Dutch Shell Ord', 'GBP'),
+    ('CEY', 'B5TT187', 'JE00B5TT1872', 'Centamin', 'GBP'),
+    ('BATS', '287580', 'GB0002875804', 'BAT', 'GBP'),
+    ('AEWU', 'BWD2415', 'GB00BWD24154', 'Aew UK Reit', 'GBP'),
+]
+EDGE_CASES = [
+    ('GROSS INTEREST', 'Interest'),
+    ('Tax Credit AEW UK', 'Aew UK Reit'),
+]
+TRANSACTIONS_CSV_HEADER = TRANSACTIONS_COLUMNS + ['']  # The download ends every line with a comma
+SPAN_YEARS = 15  # Transactions are spread over this many years of business days, however many rows
+
+# Number formats of the real workbook's data columns
+TRANSACTIONS_NUMBER_FORMATS = {
+    'Date': 'dd/mm/yy', 'Settlement Date': 'dd/mm/yy', 'Quantity': '#,##0_);[Red](#,##0)',
+    'Price': '[$£-809]#,##0.000;[Red]\\-[$£-809]#,##0.000', 'Debit': '#,##0.00_);[Red](#,##0.00)',
+    'Credit': '#,##0.00_);[Red](#,##0.00)', 'Running Balance': '#,##0.00_);[Red](#,##0.00)',
+}
+
+
+def instruments(count):
+    """The sample instruments followed by generated ones, count in total (at least the samples)."""
+    result = list(SAMPLE_INSTRUMENTS)
+    for i in range(len(result), count):
+        currency = 'USD' if i % 5 == 0 else 'GBP'
+        result.append((f'S{i:04d}', f'B{i:06d}', f'GB00B{i:06d}', f'Synthetic {i:04d} Plc', currency))
+    return result
+
+
+def money(value, symbol='£'):
+    """Format like the downloads: £1,234.56 and -£79.20."""
+    sign = '-' if value < 0 else ''
+    return f"{sign}{symbol}{abs(value):,.2f}"
+
+
+def business_days(start, years=SPAN_YEARS):
+    """The weekdays from start up to years later, as datetimes."""
+    end = pd.Timestamp(start) + pd.DateOffset(years=years) - pd.Timedelta(days=1)
+    return list(pd.bdate_range(start, end).to_pydatetime())
+
+
+def transaction_records(rows, seed=0, start=datetime(2010, 1, 4), opening_balance=100_000.0, universe=20,
+                        total=None, years=SPAN_YEARS):
+    """
+    Yield rows Transactions rows oldest first, as the CSV strings of a download: buys
+    and sells of instruments that are held, Div and GROSS INTEREST credits, n/a cells
+    and a Running Balance that follows the Debit and Credit columns.
+
+    The dates spread total rows (default: rows) evenly over the business days of years
+    years from start, several a day for large sets, so a stream of any size stays in
+    range of pandas dates; the first rows of a longer stream are the rows of a shorter
+    one with the same total.
+    """
+    rng = random.Random(seed)
+    pool = instruments(universe)
+    holdings = {}
+    balance = opening_balance
+    days = business_days(start, years)
+    total = max(total or rows, rows)
+    for i in range(rows):
+        date = days[i * len(days) // total]
+        symbol, sedol, _, name, _ = rng.choice(pool)
+        held = holdings.get(symbol, 0)
+        roll = rng.random()
+        if roll < 0.08:
+            credit = round(rng.uniform(5, 150), 2)
+            balance += credit
+            yield (date.strftime('%d/%m/%Y'), date.strftime('%d/%m/%Y'), 'n/a', 'n/a', 'n/a', 'n/a',
+                   'GROSS INTEREST', 'n/a', 'n/a', money(credit), money(balance), '')
+            continue
+        if roll < 0.2 and held:
+            credit = round(held * rng.uniform(0.005, 0.05), 2)
+            balance += credit
+            yield (date.strftime('%d/%m/%Y'), date.strftime('%d/%m/%Y'), symbol, sedol, 'n/a', 'n/a',
+                   f'Div {held}   {name.upper()}   ORD', 'n/a', 'n/a', money(credit), money(balance), '')
+            continue
+
+        settlement = date + timedelta(days=2)
+        price = round(rng.uniform(0.5, 80), 2)
+        reference = ''.join(rng.choice('ABCDEFGHJKLMNPQRSTUVWXYZ0123456789') for _ in range(11))
+        quantity = max(1, int(rng.uniform(500, 10_000) / price))  # Trades of £500 to £10,000
+        if held and (roll < 0.45 or quantity * price * 1.005 > balance):
+            quantity = min(quantity, held)
+            holdings[symbol] = held - quantity
+            debit, credit = 'n/a', round(quantity * price * 0.995, 2)
+            balance += credit
+            credit = money(credit)
+        else:
+            holdings[symbol] = held + quantity
+            debit, credit = round(quantity * price * 1.005, 2), 'n/a'
+            balance -= debit
+            debit = money(debit)
+        description = (f"{quantity} {name}  Del   {price:.2f} S Date "
+                       f"{(settlement - timedelta(days=1)).strftime('%d/%m/%y')}")
+        yield (date.strftime('%d/%m/%Y'), settlement.strftime('%d/%m/%Y'), symbol, sedol, str(quantity),
+               money(price), description, reference, debit, credit, money(balance), '')
+
+
+def write_transactions_csv(path, records):
+    """Write records newest first, as the download lists them, with the BOMs the real file starts with."""
+    lines = list(records)
+    lines.reverse()
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('\ufeff\ufeff\ufeff')
+        writer = csv.writer(f)
+        writer.writerow(TRANSACTIONS_CSV_HEADER)
+        writer.writerows(lines)
+    return path
+
+
+def make_transactions_csv(path, rows, seed=0, **kwargs):
+    """Write a synthetic Transactions.csv of rows rows."""
+    return write_transactions_csv(path, transaction_records(rows, seed, **kwargs))
+
+
+def make_investments_csv(path, rows, seed=0):
+    """
+    Write a synthetic Investments.csv of rows holdings followed by the Totals, GBP and
+    USD footer lines: $ prices for USD holdings, pence prices for GBP, % strings and n/a.
+    """
+    rng = random.Random(seed)
+    totals = {'GBP': [0.0, 0.0, 0.0, 0.0], 'USD': [0.0, 0.0, 0.0, 0.0]}  # day gain, value, book cost, value £
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write('\ufeff\ufeff\ufeff')
+        writer = csv.writer(f)
+        writer.writerow(INVESTMENTS_COLUMNS)
+        for symbol, _, _, name, currency in instruments(rows)[:rows]:
+            qty = rng.randint(10, 50_000)
+            price = rng.uniform(0.5, 80)
+            average = price * rng.uniform(0.6, 1.4)
+            day_gain = qty * price * rng.uniform(-0.03, 0.03)
+            value, cost = qty * price, qty * average
+            value_gbp = value * 0.75 if currency == 'USD' else value
+            if currency == 'USD':
+                row = [symbol, name, qty, money(price, '$'), money(day_gain, '$'),
+                       f"{day_gain / value * 100:.2f}%", money(value_gbp), money(value, '$'), money(cost, '$'),
+                       money(value - cost, '$'), f"{(value - cost) / cost * 100:.2f}%", f"${average:.6f}"]
+            else:
+                row = [symbol, name, qty, f"{price * 100:,.2f}p", money(day_gain),
+                       f"{day_gain / value * 100:.2f}%", money(value), money(value), money(cost),
+                       money(value - cost), f"{(value - cost) / cost * 100:.2f}%", f"{average * 100:,.4f}p"]
+            if rng.random() < 0.02:
+                row[4] = row[5] = 'n/a'
+            else:
+                totals[currency][0] += day_gain
+            totals[currency][1] += value
+            totals[currency][2] += cost
+            totals[currency][3] += value_gbp
+            writer.writerow(row)
+
+        writer.writerow(['', '', '', 'Totals'] + [''] * 8)
+        for currency, symbol in (('GBP', '£'), ('USD', '$')):
+            day_gain, value, cost, value_gbp = totals[currency]
+            gain_pct = (value - cost) / cost * 100 if cost else 0
+            writer.writerow(['', '', '', currency, money(day_gain, symbol),
+                             f"{day_gain / value * 100 if value else 0:.2f}%", money(value_gbp), money(value, symbol),
+                             money(cost, symbol), money(value - cost, symbol), f"{gain_pct:.2f}%", ''])
+    return path
+
+
+def _style_array(sheet, number_format):
+    # Resolve a number format to a StyleArray once; cells then get a copy of it
+    cell = WriteOnlyCell(sheet)
+    cell.number_format = number_format
+    return copy(cell._style)
+
+
+def make_template_workbook(path, history, seed=0, holdings=20, chunksize=100_000, total=None):
+    """
+    Write a template II_YYYYMMDD.xlsx with Transactions, Investments, MapName and
+    MapEdgeCases sheets. The Transactions sheet holds history rows normalized exactly
+    as the importer writes them, with the column A formula and the real number
+    formats, so the template can be appended to by a CSV from transaction_records
+    continuing after it, total rows in all (see make_benchmark_set).
+    """
+    book = openpyxl.Workbook(write_only=True)
+    sheet = book.create_sheet(TRANSACTIONS_SHEET)
+    styles = {col: _style_array(sheet, fmt) for col, fmt in TRANSACTIONS_NUMBER_FORMATS.items()}
+    column_styles = [styles.get(col) for col in TRANSACTIONS_COLUMNS]
+    sheet.append(['Name'] + TRANSACTIONS_COLUMNS + ['ISIN'])
+    records = transaction_records(history, seed, total=total)
+    row_idx = 2
+    while True:
+        # n/a and empty cells become missing values, as read_csv's default na_values make them
+        chunk = [[None if value in ('n/a', '') else value for value in record[:-1]]
+                 for _, record in zip(range(chunksize), records)]
+        if not chunk:
+            break
+        df = normalize_transactions(pd.DataFrame(chunk, columns=TRANSACTIONS_COLUMNS, dtype=str))
+        if df['Date'].isna().any():
+            raise ValueError(f"Synthetic Transactions rows from row {row_idx} have dates pandas cannot represent")
+        formulas = formula_block(TRANSACTIONS_FORMULA, row_idx, row_idx + len(df) - 1)
+        for formula, values in zip(formulas, frame_rows(df)):
+            cells = [formula]
+            for value, style in zip(values, column_styles):
+                cell = WriteOnlyCell(sheet, value)
+                if style is not None:
+                    cell._style = copy(style)
+                cells.append(cell)
+            sheet.append(cells)
+        row_idx += len(df)
+
+    sheet = book.create_sheet(INVESTMENTS_SHEET)
+    sheet.append(['Name'] + INVESTMENTS_COLUMNS)
+    for row_idx, (symbol, _, _, name, _) in enumerate(instruments(holdings)[:holdings], start=2):
+        sheet.append([INVESTMENTS_FORMULA.format(row=row_idx), symbol, name])
+
+    pool = instruments(max(holdings, 20))
+    sheet = book.create_sheet(MAPNAME_SHEET)
+    sheet.append(['Symbol', 'Sedol', 'ISIN', 'Name'])
+    for symbol, sedol, isin, name, _ in pool:
+        sheet.append([symbol, sedol, isin, name])
+
+    sheet = book.create_sheet(MAPEDGECASES_SHEET)
+    sheet.append(['Description', 'Name'])
+    for description, name in EDGE_CASES:
+        sheet.append([description, name])
+
+    book.save(path)
+    return path
+
+
+def make_benchmark_set(folder, rows, history=None, holdings=50, seed=0):
+    """
+    Write a matching set into folder: a template workbook II_20250101.xlsx with history
+    Transactions rows (default: rows) and the Transactions.csv/Investments.csv downloads
+    that follow it, rows new transactions and holdings positions. Returns the three paths.
+    """
+    history = rows if history is None else history
+    os.makedirs(folder, exist_ok=True)
+    excel_path = make_template_workbook(os.path.join(folder, 'II_20250101.xlsx'), history, seed, holdings,
+                                        total=history + rows)
+
+    records = transaction_records(history + rows, seed)
+    for _ in range(history):  # The same stream as the template, so the CSV continues after it
+        next(records)
+    transactions_csv = write_transactions_csv(os.path.join(folder, 'Transactions.csv'), records)
+    investments_csv = make_investments_csv(os.path.join(folder, 'Investments.csv'), holdings, seed)
+    return excel_path, transactions_csv, investments_csv
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic Interactive Investor downloads and workbooks")
+    parser.add_argument('folder', help="Output folder; one sub-folder per size")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    parser.add_argument('--holdings', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        paths = make_benchmark_set(os.path.join(args.folder, f'rows_{rows}'), rows, holdings=args.holdings,
+                                   seed=args.seed)
+        print(f"{rows:>9,} rows: " + ", ".join(paths))
@@ -0,0 +1,172 @@
+# II_TransactionIndex.py
+import hashlib
+import json
+import os
+import shutil
+import pandas as pd
+from II_Constants import TRANSACTIONS_COLUMNS, TRANSACTIONS_INDEX_SUFFIX
+
+HASH_COLUMNS = ['Date', 'Symbol', 'Description', 'Credit', 'Debit']
+
+
+def index_path_for(excel_path):
+    """Return the dedup index sidecar path for a workbook (II_YYYYMMDD.txindex.jsonl)."""
+    return os.path.splitext(excel_path)[0] + TRANSACTIONS_INDEX_SUFFIX
+
+
+def carry_index(source_path, target_path):
+    """
+    Copy a workbook's dedup index to a copy of the workbook (the next day's file after a
+    roll), so its first import does not rebuild the index from the whole history. The
+    last-row and last-key check still catches a copy whose rows differ. Returns True if
+    there was an index to copy.
+    """
+    source = index_path_for(source_path)
+    if not os.path.exists(source):
+        return False
+    shutil.copyfile(source, index_path_for(target_path))
+    return True
+
+
+def _text(series):
+    return series.astype(object).fillna('').astype(str).str.strip()
+
+
+def _amount(series):
+    values = pd.to_numeric(series, errors='coerce')
+    return values.map(lambda v: '' if pd.isna(v) else f'{v:.2f}')
+
+
+def transaction_keys(df, seen=None):
+    """
+    Return a dedup key per row: 'ref:<Reference>' where the row has a Reference,
+    otherwise 'hash:<sha1 of Date/Symbol/Description/Credit/Debit>' (GROSS INTEREST,
+    dividends). Repeated keys get an occurrence suffix so genuinely identical rows
+    (e.g. two equal dividends on one day) are kept apart. When a file is keyed in
+    chunks, pass the same `seen` dict (base key -> occurrences so far) to every call
+    so the occurrence numbers carry over between chunks.
+    """
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+
+    reference = _text(df['Reference']) if 'Reference' in df.columns else pd.Series('', index=df.index)
+    has_reference = (reference != '') & (reference.str.lower() != 'n/a')
+    keys = 'ref:' + reference
+
+    hashed = ~has_reference
+    if hashed.any():
+        subset = df.loc[hashed]
+        dates = pd.to_datetime(subset['Date'], errors='coerce').dt.strftime('%Y-%m-%d').fillna('')
+        payload = dates.str.cat([
+            _text(subset['Symbol']), _text(subset['Description']),
+            _amount(subset['Credit']), _amount(subset['Debit'])
+        ], sep='|')
+        keys[hashed] = 'hash:' + payload.map(lambda text: hashlib.sha1(text.encode('utf-8')).hexdigest())
+
+    occurrence = keys.groupby(keys).cumcount()
+    if seen is not None:
+        occurrence = occurrence + keys.map(seen).fillna(0).astype(int)
+        for key, count in keys.value_counts().items():
+            seen[key] = seen.get(key, 0) + count
+    return keys + '#' + occurrence.astype(str)
+
+
+def sheet_transactions_frame(sheet, last_row, first_row=2):
+    """Read the Transactions sheet data block (columns B:L) into a frame of raw values."""
+    rows = sheet.iter_rows(min_row=first_row, max_row=last_row, min_col=2,
+                           max_col=1 + len(TRANSACTIONS_COLUMNS), values_only=True)
+    return pd.DataFrame(list(rows), columns=TRANSACTIONS_COLUMNS)
+
+
+class TransactionIndex:
+    """
+    Persistent set of already-imported transaction keys, stored as an append-only
+    JSON-lines sidecar next to the workbook. Each line records the keys added by one
+    import plus the sheet's last data row and the key of that row, which is how a
+    stale or missing index is detected and rebuilt from the Transactions sheet.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.keys = set()
+        self.last_row = None
+        self.last_key = None
+
+    @classmethod
+    def load(cls, excel_path):
+        index = cls(index_path_for(excel_path))
+        if not os.path.exists(index.path):
+            return index
+        try:
+            with open(index.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if entry.get('rebuild'):
+                        index.keys = set()
+                    index.keys.update(entry.get('keys', []))
+                    index.last_row = entry.get('last_row')
+                    index.last_key = entry.get('last_key')
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Warning: Transactions index {index.path} is unreadable ({e}). It will be rebuilt.")
+            index.keys, index.last_row, index.last_key = set(), None, None
+        return index
+
+    def is_current(self, sheet, last_row):
+        """Cheap staleness check: the recorded last row and its key must match the sheet."""
+        if self.last_row != last_row:
+            return False
+        if last_row < 2:
+            return True
+        return self.matches_last_key(sheet_transactions_frame(sheet, last_row, last_row))
+
+    def matches_last_key(self, row):
+        """True if a one-row frame of sheet values (columns B:L) has the recorded last key."""
+        return transaction_keys(row).iloc[-1].split('#')[0] == (self.last_key or '').split('#')[0]
+
+    def rebuild(self, sheet, last_row, archived=None):
+        """
+        Rebuild the index from the rows already in the Transactions sheet and, when the
+        workbook is partitioned, the archived years: archived() returns their frame
+        (see II_Partition.load_archived_frame).
+        """
+        print(f"Rebuilding transactions index from sheet rows 2 to {last_row}...")
+        existing = sheet_transactions_frame(sheet, last_row) if last_row >= 2 else pd.DataFrame(columns=TRANSACTIONS_COLUMNS)
+        archived = archived() if archived is not None else None
+        if archived is not None and len(archived):
+            existing = pd.concat([archived[TRANSACTIONS_COLUMNS].astype(object), existing], ignore_index=True)
+        self.rebuild_from(existing, last_row)
+
+    def rebuild_from(self, existing, last_row):
+        """Rebuild the index from a frame of the sheet's rows 2 to last_row (see II_Reader)."""
+        keys = transaction_keys(existing)
+        self.keys = set(keys)
+        self.last_row = last_row
+        self.last_key = keys.iloc[-1] if len(keys) else None
+        self._write({'rebuild': True, 'last_row': self.last_row, 'last_key': self.last_key,
+                     'keys': sorted(self.keys)}, mode='w')
+        print(f"Transactions index rebuilt with {len(self.keys)} keys: {self.path}")
+
+    def ensure_current(self, sheet, last_row, archived=None):
+        if not self.is_current(sheet, last_row):
+            self.rebuild(sheet, last_row, archived)
+
+    def filter_new(self, df, seen=None):
+        """Return (new_rows, keys) for the rows of df that are not yet in the index."""
+        keys = transaction_keys(df, seen)
+        is_new = ~keys.isin(self.keys)
+        return df[is_new], keys[is_new]
+
+    def record(self, keys, last_row):
+        """Append the keys of newly written rows and the new last data row."""
+        keys = list(keys)
+        self.keys.update(keys)
+        self.last_row = last_row
+        if keys:
+            self.last_key = keys[-1]
+        self._write({'last_row': self.last_row, 'last_key': self.last_key, 'keys': keys}, mode='a')
+
+    def _write(self, entry, mode):
+        with open(self.path, mode, encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
@@ -1,178 +1,318 @@
-import pandas as pd
 import os
-import openpyxl
+import re
+import numpy as np
+import pandas as pd
 from openpyxl.utils import get_column_letter
-from openpyxl.styles import PatternFill
-import copy
-import json
 from II_Constants import (
-    TRANSACTIONS_CSV_PATH, DEFAULT_EXCEL_PATH, TRANSACTIONS_SHEET,
-    TRANSACTIONS_MAX_COLUMN, TRANSACTIONS_FORMULA
+    TRANSACTIONS_CSV_PATH, DEFAULT_EXCEL_PATH, DEFAULT_ACCOUNT, TRANSACTIONS_SHEET, TRANSACTIONS_COLUMNS,
+    TRANSACTIONS_MAX_COLUMN, TRANSACTIONS_FORMULA, CATEGORY_MODE_FORMULA, CATEGORY_MODE_VALUE,
+    DESCRIPTION_PRICE_TOLERANCE, RECONCILE_REPORT_ROWS
 )
 from II_Config import load_config  # Import load_config from II_Config.py
+from II_Normalize import load_transactions_csv
+from II_TransactionIndex import TransactionIndex
+from II_Streaming import DEFAULT_CHUNK_ROWS, spill_transaction_runs
+from II_Ledger import open_ledger
+from II_Reconcile import Reconciliation, sheet_closing_balance
+from II_Reader import append_transactions_frame
+from II_Partition import load_archived_frame, archived_closing_balance
+from II_WorkbookSession import WorkbookSession, frame_rows, write_rows
+from II_Format import write_formulas, template_row_styles, apply_row_styles
+from II_Watermark import last_data_row, last_formula_row, record_rows
+from II_MapResolver import maps_for, write_transaction_categories
+from II_Metrics import run_metrics, stage
+
+# Description layouts: "164 ENDR MINI  Del   30.18 S Date 02/10/25" (a trade: quantity, instrument,
+# Del flag, dealt price, S Date), "Div 216   ANGLOGOLD ASHANTI PLC   ORD USD1" and "GROSS INTEREST".
+# Every line matches (anything else as the last, empty alternative), so one findall over the
+# descriptions joined by newlines returns one tuple per description.
+DESCRIPTION_PATTERN = re.compile(
+    r'^ *(?:(\d+) +(.*[^ ]) +(\d*\.?\d+) +S Date +(\d\d/\d\d/\d\d)|Div +(\d+) +(.*[^ ])|(GROSS INTEREST)|.*?) *$',
+    re.M)
+DESCRIPTION_GROUPS = ['trade_quantity', 'trade_name', 'price', 's_date', 'div_quantity', 'div_name', 'interest']
+DESCRIPTION_TYPES = ['trade', 'dividend', 'interest', 'other']
+DESCRIPTION_COLUMNS = ['Type', 'Parsed Quantity', 'Instrument', 'Dealt Price', 'Delivery', 'S Date',
+                       'Quantity Mismatch', 'Price Mismatch']
+
+def _by_value(values, convert):
+    """Apply a vectorized conversion to the distinct values of an array only, then map it back."""
+    codes, uniques = pd.factorize(values)
+    return np.asarray(convert(pd.Series(uniques, dtype=object)))[codes]
+
+def parse_descriptions(df):
+    """
+    Extract the fields the Description strings carry. The distinct descriptions (GROSS
+    INTEREST and the dividend lines repeat) are parsed by a single regex pass over them
+    joined into one string, and each field is converted once per distinct value.
+    Returns a frame on df's index with DESCRIPTION_COLUMNS: the Type (trade, dividend,
+    interest or other), the quantity (for a dividend, the shares it was paid on),
+    Instrument, the dealt price, the Del flag and the S Date, plus flags for trades whose
+    quantity or price disagrees with the Quantity/Price columns. The dealt price in the
+    Description is cut to two decimals, so prices within DESCRIPTION_PRICE_TOLERANCE agree.
+    """
+    codes, descriptions = pd.factorize(df['Description'].astype(object).where(df['Description'].notna(), ''))
+    try:
+        text = '\n'.join(descriptions)
+    except TypeError:  # Numbers read back from the sheet
+        text = '\n'.join(str(value) for value in descriptions)
+    if text.count('\n') != max(len(descriptions) - 1, 0):  # A description spans lines
+        text = '\n'.join(str(value).replace('\n', ' ') for value in descriptions)
+    fields = np.array(DESCRIPTION_PATTERN.findall(text), dtype=object).reshape(-1, len(DESCRIPTION_GROUPS))
+    fields = pd.DataFrame(fields[codes] if len(codes) else fields[:0], columns=DESCRIPTION_GROUPS, index=df.index)
+
+    is_trade = (fields['trade_quantity'] != '').to_numpy()
+    is_dividend = (fields['div_quantity'] != '').to_numpy()
+    kind = np.select([is_trade, is_dividend, (fields['interest'] != '').to_numpy()], [0, 1, 2], 3)
+    names = np.where(is_trade, fields['trade_name'], fields['div_name'])
+    delivery = _by_value(names, lambda v: v.str.endswith(' Del')) & is_trade
+    parsed = pd.DataFrame({
+        'Type': pd.Categorical.from_codes(kind, DESCRIPTION_TYPES),
+        'Parsed Quantity': _by_value(np.where(is_trade, fields['trade_quantity'], fields['div_quantity']),
+                                     lambda v: pd.to_numeric(v.replace('', None)).astype(float)),
+        'Instrument': _by_value(names, lambda v: v.str.replace(r' +Del$', '', regex=True)
+                                .str.replace(r'\s+', ' ', regex=True).replace('', None)),
+        'Dealt Price': _by_value(fields['price'], lambda v: pd.to_numeric(v.replace('', None)).astype(float)),
+        'Delivery': delivery,
+        'S Date': _by_value(fields['s_date'], lambda v: pd.to_datetime(v.replace('', None), format='%d/%m/%y')),
+    }, index=df.index)
+    parsed['Instrument'] = parsed['Instrument'].astype('category')
+    parsed['S Date'] = parsed['S Date'].astype('datetime64[ns]')
+
+    quantity = pd.to_numeric(df['Quantity'], errors='coerce').abs().to_numpy()
+    price = pd.to_numeric(df['Price'], errors='coerce').to_numpy()
+    with np.errstate(invalid='ignore'):
+        parsed['Quantity Mismatch'] = is_trade & ~np.isnan(quantity) & (quantity != parsed['Parsed Quantity'].to_numpy())
+        parsed['Price Mismatch'] = is_trade & ~np.isnan(price) & (
+            np.abs(price - parsed['Dealt Price'].to_numpy()) > DESCRIPTION_PRICE_TOLERANCE + 1e-9)
+    return parsed
 
-# File paths and constants
-config = load_config()
-excel_path = config.get("excel_path", DEFAULT_EXCEL_PATH)  # Use config.json with fallback
-csv_path = TRANSACTIONS_CSV_PATH
+def report_description_mismatches(df):
+    """Print the trades whose Description disagrees with their Quantity or Price. Returns their count."""
+    with stage('descriptions') as current:
+        current.rows = len(df)
+        parsed = parse_descriptions(df)
+        mismatched = parsed['Quantity Mismatch'] | parsed['Price Mismatch']
+    if mismatched.any():
+        rows = df.loc[mismatched, ['Date', 'Description', 'Quantity', 'Price']].join(
+            parsed.loc[mismatched, ['Parsed Quantity', 'Dealt Price']])
+        print(f"Descriptions: {len(rows)} trade(s) whose Description disagrees with Quantity/Price")
+        print(rows.head(RECONCILE_REPORT_ROWS).to_string(index=False))
+    return int(mismatched.sum())
 
 def populate_formulas(sheet, start_row, end_row):
     """Populate column A with the formula from start_row to end_row."""
-    formula = TRANSACTIONS_FORMULA
-    for row in range(start_row, end_row + 1):
-        sheet[f'A{row}'] = formula.format(row=row)
+    write_formulas(sheet, TRANSACTIONS_FORMULA, start_row, end_row)
     print(f"Formula populated in column A from row {start_row} to {end_row}")
 
+def populate_categories(session, sheet, start_row, end_row):
+    """Fill column A from start_row to end_row with formulas or resolved values, per the session's category_mode."""
+    if session.category_mode == CATEGORY_MODE_VALUE:
+        write_transaction_categories(sheet, maps_for(session), start_row, end_row)
+        print(f"Categories resolved in column A from row {start_row} to {end_row}")
+    else:
+        populate_formulas(sheet, start_row, end_row)
+
 def copy_row_formatting(sheet, source_row, start_row, end_row):
     """Copy number_format and fill from source_row to rows from start_row to end_row for columns A:M."""
-    for row in range(start_row, end_row + 1):
-        for col in range(1, TRANSACTIONS_MAX_COLUMN + 1):
-            source_cell = sheet.cell(row=source_row, column=col)
-            target_cell = sheet.cell(row=row, column=col)
-            target_cell.number_format = source_cell.number_format
-            target_cell.fill = copy.copy(source_cell.fill) if source_cell.fill else PatternFill()
+    template = template_row_styles(sheet, source_row, TRANSACTIONS_MAX_COLUMN)
+    apply_row_styles(sheet, template, start_row, end_row)
     print(f"Number formats and fills copied from row {source_row} to rows {start_row} to {end_row} for columns A to {get_column_letter(TRANSACTIONS_MAX_COLUMN)}")
 
-try:
+def prepare_append(session):
+    """Return (sheet, last_row, index) for appending to the Transactions sheet of a session."""
+    sheet = session.sheet(TRANSACTIONS_SHEET)
+
+    # Last non-empty row in column B (Date), from the workbook watermark when it is still valid
+    with stage('last_row'):
+        last_row = last_data_row(sheet)
+    print(f"Last non-empty row in column B: {last_row}")
+
+    # Dedup index of rows that an earlier (overlapping) download already imported
+    with stage('dedup_index') as current:
+        index = TransactionIndex.load(session.excel_path)
+        index.ensure_current(sheet, last_row, lambda: load_archived_frame(session.excel_path))
+        current.rows = len(index.keys)
+    return sheet, last_row, index
+
+def write_transaction_rows(session, sheet, rows, last_row):
+    """
+    Append row tuples (CSV columns, written from column B) after last_row, then populate
+    formulas and formatting for them. Returns the new last data row.
+    """
+    # Append the data starting at column B and the next available row
+    first_new_row = last_row + 1
+    with stage('append') as current:
+        last_row = write_rows(sheet, rows, start_row=first_new_row, start_col=2)
+        current.rows = last_row - first_new_row + 1
+    if last_row < first_new_row:
+        return last_row
+    print(f"Data successfully written to rows up to {last_row} in Transactions sheet")
+
+    # First empty cell in column A follows the last formula row
+    formula_row = last_formula_row(sheet)
+    first_empty_row = formula_row + 1
+
+    if first_empty_row <= last_row:
+        with stage('formulas_format') as current:
+            current.rows = last_row - first_empty_row + 1
+
+            # Populate formulas (or their values)
+            populate_categories(session, sheet, first_empty_row, last_row)
+
+            # Copy formatting from the row above first_empty_row; row 2 of an emptied sheet keeps its own
+            if first_empty_row > 1:
+                copy_row_formatting(sheet, first_empty_row - 1 if first_empty_row > 2 else 2, first_empty_row, last_row)
+            else:
+                print("Error: No row above first_empty_row to copy formatting from")
+
+    record_rows(sheet, data_row=last_row, formula_row=max(formula_row, last_row))
+    session.mark_dirty()
+    return last_row
+
+def reconcile(session, reconciliation, sheet, last_row, investments=None, df=None, is_new=None):
+    """
+    Finish a Reconciliation of the download (adding df first, if given) against the
+    sheet, the ledger and Investments, and report it.
+    """
+    with stage('reconcile') as current:
+        if df is not None:
+            reconciliation.add(df, is_new)
+        current.rows = reconciliation.rows
+        ledger_quantities = None
+        if investments is not None and session.ledger is not None:
+            ledger_quantities = session.ledger.symbol_quantities(session.account)
+        sheet_balance = sheet_closing_balance(sheet, last_row)
+        if sheet_balance is None:  # Every row archived (see II_Partition): join with the last archived year
+            sheet_balance = archived_closing_balance(session.book)
+        reconciliation.finish(sheet_balance, investments, ledger_quantities)
+    reconciliation.report()
+    return reconciliation
+
+def append_transactions(session, df, investments=None):
+    """
+    Append the rows of a normalized Transactions frame that are not yet in the workbook
+    to the Transactions sheet of an open WorkbookSession, then populate formulas and
+    formatting for them. The download is reconciled first (see II_Reconcile), against
+    the Qty of a normalized Investments frame as well when one is given. Nothing is
+    saved here; the dedup index and the frame cache (see II_Reader) are updated once
+    the session saves. Returns the number of rows appended.
+    """
+    sheet, last_row, index = prepare_append(session)
+
+    # Skip rows that an earlier (overlapping) download already imported
+    csv_rows = len(df)
+    with stage('dedup_filter') as current:
+        new_df, new_keys = index.filter_new(df)
+        current.rows = csv_rows
+    reconcile(session, Reconciliation(), sheet, last_row, investments, df, df.index.isin(new_df.index))
+    report_description_mismatches(new_df)
+    df = new_df
+    print(f"New transactions to import: {len(df)} of {csv_rows} ({csv_rows - len(df)} already imported)")
+    if df.empty:
+        print("No new transactions to import")
+        return 0
+
+    last_row = write_transaction_rows(session, sheet, frame_rows(df), last_row)
+
+    # Record the imported rows so the next run only appends what is new
+    session.on_save(lambda: index.record(new_keys, last_row))
+    before = session.stat
+    session.on_save(lambda: append_transactions_frame(session.excel_path, df, before))
+    if session.ledger is not None:
+        session.ledger.stage_transactions(frame_rows(df), new_keys, session.account)
+        session.on_save(session.ledger.commit)
+    return len(df)
+
+def append_transactions_streaming(session, csv_path, chunksize=DEFAULT_CHUNK_ROWS):
+    """
+    Streaming variant of append_transactions for very large downloads: the CSV is read
+    and normalized in chunks, each chunk is reconciled, sorted and spilled to disk, and
+    the sorted runs are merged in Date order straight into the sheet. Memory stays
+    bounded by the chunk size and the new rows, which are kept as plain tuples for the
+    ledger and the frame cache; the rows written are the same as append_transactions
+    would write.
+    """
+    sheet, last_row, index = prepare_append(session)
+
+    print(f"Reading CSV file in chunks of {chunksize} rows...")
+    reconciliation = Reconciliation()
+    with stage('transactions_csv_spill') as current:
+        runs = spill_transaction_runs(csv_path, index, chunksize, reconciliation, report_description_mismatches)
+        current.rows = runs.input_rows
+    with runs:
+        reconcile(session, reconciliation, sheet, last_row)
+        print(f"New transactions to import: {runs.rows} of {runs.input_rows} "
+              f"({runs.input_rows - runs.rows} already imported, sorted in {len(runs.paths)} runs)")
+        if not runs.rows:
+            print("No new transactions to import")
+            return 0
+
+        new_rows, new_keys = [], []
+        def rows():
+            for row, key in runs.merge():
+                new_rows.append(row)
+                new_keys.append(key)
+                yield row
+        last_row = write_transaction_rows(session, sheet, rows(), last_row)
+
+    session.on_save(lambda: index.record(new_keys, last_row))
+    before = session.stat
+    def append_frame():
+        df = pd.DataFrame([row[:len(TRANSACTIONS_COLUMNS)] for row in new_rows], columns=TRANSACTIONS_COLUMNS)
+        append_transactions_frame(session.excel_path, df, before)
+    session.on_save(append_frame)
+    if session.ledger is not None:
+        session.ledger.stage_transactions(new_rows, new_keys, session.account)
+        session.on_save(session.ledger.commit)
+    return len(new_keys)
+
+def import_transactions(csv_path, excel_path, chunksize=None, ledger=None, account=DEFAULT_ACCOUNT,
+                        category_mode=CATEGORY_MODE_FORMULA):
+    """
+    Import a Transactions.csv download into the workbook with a single load and save.
+    Pass chunksize to use the bounded-memory streaming mode for very large exports,
+    an II_Ledger.Ledger to record the new rows in the local store as well, and
+    category_mode=CATEGORY_MODE_VALUE to write column A categories as values.
+    """
     # Verify CSV file exists
     if not os.path.exists(csv_path):
         raise FileNotFoundError(f"CSV file not found at: {csv_path}")
-    
-    # Verify Excel file exists
-    if not os.path.exists(excel_path):
-        raise FileNotFoundError(f"Excel file not found at: {excel_path}")
-
-    # Read CSV file with UTF-8-SIG encoding to handle BOM
-    print("Reading CSV file...")
-    df = pd.read_csv(csv_path, encoding='utf-8-sig')
-    print(f"CSV rows read: {len(df)}")
-
-    # Clean column names by removing BOM characters
-    df.columns = df.columns.str.replace('\ufeff', '')
-    print("Column names in CSV:", list(df.columns))
-
-    # Replace 'n/a' with empty string
-    df = df.replace('n/a', '')
-
-    # Clean numeric columns by removing currency symbols (£) and commas
-    for col in ['Quantity', 'Price', 'Debit', 'Credit', 'Running Balance']:
-        if col in df.columns:
-            df[col] = df[col].replace('[\£,]', '', regex=True).replace('', None).astype(float, errors='ignore')
-
-    # Sort by Date in ascending order
-    print("Sorting data by Date...")
-    if 'Date' not in df.columns:
-        raise ValueError("Column 'Date' not found in CSV. Available columns: " + str(list(df.columns)))
-    
+
+    if chunksize:
+        with WorkbookSession(excel_path, ledger, account, category_mode) as session:
+            append_transactions_streaming(session, csv_path, chunksize)
+        return
+
+    # Read and normalize CSV data (BOM cleanup, £/comma stripping, dates, sort, sign rules)
+    df = load_transactions_csv(csv_path)
+
+    with WorkbookSession(excel_path, ledger, account, category_mode) as session:
+        append_transactions(session, df)
+
+
+if __name__ == "__main__":
+    # File paths and constants
+    config = load_config()
+    excel_path = config.get("excel_path", DEFAULT_EXCEL_PATH)  # Use config.json with fallback
+    csv_path = TRANSACTIONS_CSV_PATH
+
+    ledger = open_ledger(config)
+
     try:
-        # Convert Date to datetime
-        df['Date'] = pd.to_datetime(df['Date'], dayfirst=True, errors='coerce')
-        if df['Date'].isna().any():
-            print("Warning: Some dates in 'Date' could not be parsed. Invalid dates will be left as-is:")
-            print(df[df['Date'].isna()][['Date']])
-        
-        # Convert Settlement Date to datetime
-        if 'Settlement Date' in df.columns:
-            df['Settlement Date'] = pd.to_datetime(df['Settlement Date'], dayfirst=True, errors='coerce')
-            if df['Settlement Date'].isna().any():
-                print("Warning: Some dates in 'Settlement Date' could not be parsed. Invalid dates will be left as-is:")
-                print(df[df['Settlement Date'].isna()][['Settlement Date']])
-        else:
-            print("Warning: 'Settlement Date' column not found in CSV. Available columns: " + str(list(df.columns)))
-
-        df = df.sort_values(by='Date', ascending=True, na_position='last')
+        # "stream_chunk_rows" in config.json switches to the bounded-memory streaming mode;
+        # "profile": true records a cProfile of the run next to the metrics file
+        with run_metrics('import_transactions', excel_path, profile=config.get("profile", False)):
+            import_transactions(csv_path, excel_path, chunksize=config.get("stream_chunk_rows"),
+                                ledger=ledger, account=config.get("account", DEFAULT_ACCOUNT),
+                                category_mode=config.get("category_mode", CATEGORY_MODE_FORMULA))
+    except FileNotFoundError as e:
+        print(f"Error: {str(e)}")
+    except PermissionError:
+        print(f"Error: Permission denied when accessing {excel_path}. Ensure the file is not open in another application.")
+    except ValueError as ve:
+        print(f"Error: {ve}")
     except Exception as e:
-        print(f"Warning: Failed to sort by Date or parse dates due to: {str(e)}. Proceeding without sorting.")
-
-    # Apply negative sign to Quantity when Credit has a value, unless Description starts with "Div" or "GROSS INTEREST"
-    df['Quantity'] = df.apply(
-        lambda row: -float(row['Quantity']) if pd.notnull(row['Credit']) and row['Credit'] != '' 
-        and not (str(row['Description']).startswith('Div') or str(row['Description']).startswith('GROSS INTEREST')) 
-        else float(row['Quantity']) if pd.notnull(row['Quantity']) else None,
-        axis=1
-    )
-
-    # Apply negative sign to Debit when Debit has a value
-    df['Debit'] = df.apply(
-        lambda row: -float(row['Debit']) if pd.notnull(row['Debit']) else None,
-        axis=1
-    )
-
-    # Ensure Credit and Running Balance are float
-    df['Credit'] = df['Credit'].astype(float, errors='ignore')
-    df['Running Balance'] = df['Running Balance'].astype(float, errors='ignore')
-
-    # Load existing Excel file
-    print("Loading Excel file...")
-    book = openpyxl.load_workbook(excel_path)
-    
-    # Verify Transactions sheet exists
-    if TRANSACTIONS_SHEET not in book.sheetnames:
-        raise ValueError("Transactions sheet not found in Excel file")
-
-    # Get the Transactions sheet
-    sheet = book[TRANSACTIONS_SHEET]
-
-    # Find last non-empty row based on column B (Date)
-    last_row = 1
-    for row in range(1, sheet.max_row + 1):
-        cell = sheet[f'B{row}']
-        if cell.value is None or (isinstance(cell.value, str) and not cell.value.strip()):
-            last_row = max(1, row - 1)
-            break
-        last_row = row
-    print(f"Last non-empty row in column B: {last_row}")
-
-    # Use pandas to append data to Excel, starting at column B (index 1) and the next available row
-    with pd.ExcelWriter(excel_path, engine='openpyxl', mode='a', if_sheet_exists='overlay') as writer:
-        writer.workbook = book
-        df.to_excel(
-            writer,
-            sheet_name=TRANSACTIONS_SHEET,
-            startrow=last_row,  # Start at the row after the last non-empty row
-            startcol=1,  # Start at column B (index 1)
-            index=False,  # Don't write DataFrame index
-            header=False  # Don't write column headers
-        )
-
-    print(f"Data successfully written to {excel_path} in Transactions sheet")
-
-    # Re-load workbook for formatting
-    book = openpyxl.load_workbook(excel_path)
-    sheet = book[TRANSACTIONS_SHEET]
-
-    # Find the last row with data in column B
-    last_row = sheet.max_row
-    for row in range(last_row, 1, -1):
-        if sheet[f'B{row}'].value is not None:
-            last_row = row
-            break
-
-    # Find the first empty cell in column A
-    first_empty_row = 2
-    for row in range(2, last_row + 1):
-        if sheet[f'A{row}'].value is None:
-            first_empty_row = row
-            break
-
-    # Populate formulas
-    populate_formulas(sheet, first_empty_row, last_row)
-
-    # Copy formatting from the row above first_empty_row
-    if first_empty_row > 1:
-        copy_row_formatting(sheet, first_empty_row - 1, first_empty_row, last_row)
-    else:
-        print("Error: No row above first_empty_row to copy formatting from")
-
-    # Save the workbook
-    book.save(excel_path)
-    print("File saved successfully")
-
-except FileNotFoundError as e:
-    print(f"Error: {str(e)}")
-except PermissionError:
-    print(f"Error: Permission denied when accessing {excel_path}. Ensure the file is not open in another application.")
-except ValueError as ve:
-    print(f"Error: {ve}")
-except Exception as e:
-    print(f"An unexpected error occurred: {str(e)}")
\ No newline at end of file
+        print(f"An unexpected error occurred: {str(e)}")
+    finally:
+        if ledger is not None:
+            ledger.close()
@@ -0,0 +1,278 @@
+# II_Watch.py
+import argparse
+import asyncio
+import fnmatch
+import ntpath
+import os
+import threading
+import time
+from II_Constants import (
+    DEFAULT_EXCEL_PATH, DEFAULT_ACCOUNT, TRANSACTIONS_CSV_PATH, CATEGORY_MODE_FORMULA, WATCH_PATTERNS,
+    WATCH_POLL_SECONDS, WATCH_SETTLE_SECONDS, WATCH_IDLE_SECONDS, WATCH_FLUSH_SECONDS
+)
+from II_Config import load_config
+from II_Ledger import open_ledger
+from II_Snapshots import open_snapshots
+from II_Normalize import load_transactions_csv
+from II_InvestmentsImport import load_investments_csv, refresh_investments
+from II_TransactionsImport import append_transactions
+from II_Streaming import merge_downloads
+from II_WorkbookSession import WorkbookSession
+from II_Metrics import run_metrics
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # Optional: without watchdog the folder is polled
+    Observer = None
+
+
+def download_folder(config):
+    """Folder to watch: config "watch_folder", else the folder of the Transactions.csv download."""
+    return config.get("watch_folder") or ntpath.dirname(TRANSACTIONS_CSV_PATH)
+
+
+def download_kind(name):
+    """'transactions' or 'investments' for a download file name (Transactions (1).csv too), else None."""
+    for kind, pattern in WATCH_PATTERNS.items():
+        if fnmatch.fnmatchcase(name.lower(), pattern):
+            return kind
+    return None
+
+
+def merge_transaction_downloads(frames):
+    """
+    Combine normalized Transactions downloads, newest first, into one frame: rows of an
+    older download that a newer one already has (by dedup key) are dropped, so a burst
+    of overlapping downloads is appended once (see II_Streaming.merge_downloads).
+    """
+    if len(frames) == 1:
+        return frames[0]
+    return merge_downloads(frames)
+
+
+class DownloadFolder:
+    """
+    The Transactions/Investments downloads in a folder. ready() reports each new or
+    changed download once it is complete: its size and mtime have not changed for
+    settle_seconds and it can be opened, so a file the browser is still writing is
+    left for a later scan. Downloads already there at start are skipped unless
+    import_existing is set.
+    """
+
+    def __init__(self, folder, settle_seconds=WATCH_SETTLE_SECONDS, import_existing=False):
+        self.folder = folder
+        self.settle_seconds = settle_seconds
+        self.pending = {}  # path -> (signature, monotonic time it was first seen)
+        self.done = {} if import_existing else dict(self._scan())
+
+    def _scan(self):
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if download_kind(entry.name) and entry.is_file():
+                    stat = entry.stat()
+                    yield entry.path, (stat.st_size, stat.st_mtime_ns)
+
+    def ready(self, now=None):
+        now = time.monotonic() if now is None else now
+        ready = []
+        for path, signature in self._scan():
+            if self.done.get(path) == signature:
+                continue
+            seen = self.pending.get(path)
+            if seen is None or seen[0] != signature:
+                self.pending[path] = (signature, now)
+            elif signature[0] > 0 and now - seen[1] >= self.settle_seconds and self._readable(path):
+                del self.pending[path]
+                self.done[path] = signature
+                ready.append(path)
+        return ready
+
+    @staticmethod
+    def _readable(path):
+        try:
+            with open(path, 'rb'):
+                return True
+        except OSError:  # Still locked by the browser on Windows
+            return False
+
+
+class ImportBatcher:
+    """
+    Queued downloads, imported in batches into a workbook that stays loaded between
+    batches: the Transactions downloads of a batch are merged and appended once, the
+    newest Investments download refreshes the sheet, and the workbook is saved once.
+    The workbook is reloaded only when config.json points at another one or the file
+    was changed by something else since the last save.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.account = config.get("account", DEFAULT_ACCOUNT)
+        self.ledger = open_ledger(config)
+        self.snapshots = open_snapshots(config, self.account)
+        self.queue = []
+        self.session = None
+        self._saved_mtime = None
+        self._lock = threading.Lock()  # flush() runs in a worker thread, and once more on shutdown
+
+    def add(self, path):
+        print(f"Queued download: {path}")
+        self.queue.append(path)
+
+    def _session(self, excel_path):
+        session = self.session
+        if session is not None and (session.excel_path != excel_path or
+                                    os.path.getmtime(excel_path) != self._saved_mtime):
+            print(f"Workbook changed since the last batch; reloading {excel_path}")
+            self.close_session()
+        if self.session is None:
+            self.session = WorkbookSession(excel_path, self.ledger, self.account,
+                                           self.config.get("category_mode", CATEGORY_MODE_FORMULA), self.snapshots)
+        return self.session
+
+    def flush(self):
+        """Import the queued downloads in one workbook write. Errors are reported and the batch dropped."""
+        with self._lock:
+            batch, self.queue = self.queue, []
+            if batch:
+                self._import(batch)
+
+    def _import(self, batch):
+        batch = sorted(set(batch), key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0,
+                       reverse=True)  # Newest first
+        transactions = [path for path in batch if download_kind(os.path.basename(path)) == 'transactions']
+        investments = [path for path in batch if download_kind(os.path.basename(path)) == 'investments']
+        excel_path = load_config().get("excel_path", self.config.get("excel_path", DEFAULT_EXCEL_PATH))
+        print(f"Importing {len(transactions)} Transactions and {len(investments)} Investments download(s) "
+              f"into {excel_path}")
+        try:
+            with run_metrics('watch_import', excel_path):
+                frames = [load_transactions_csv(path) for path in transactions]
+                holdings = load_investments_csv(investments[0]) if investments else None
+                session = self._session(excel_path)
+                appended = append_transactions(session, merge_transaction_downloads(frames), holdings) if frames else 0
+                if holdings is not None:
+                    refresh_investments(session, holdings)
+                if session.dirty:
+                    session.save()
+                self._saved_mtime = os.path.getmtime(excel_path)
+            print(f"Batch imported: {appended} new transactions"
+                  f"{', holdings refreshed' if holdings is not None else ''}")
+        except Exception as e:
+            print(f"Error importing {', '.join(batch)}: {type(e).__name__}: {e}")
+            self.close_session()  # Unsaved changes are dropped with the loaded workbook
+
+    def close_session(self):
+        if self.ledger is not None:
+            self.ledger.rollback()
+        if self.session is not None:
+            self.session.close()
+        self.session = None
+        self._saved_mtime = None
+
+    def close(self):
+        with self._lock:
+            self.close_session()
+        if self.ledger is not None:
+            self.ledger.close()
+
+
+def start_observer(folder, loop, wake):
+    """
+    Set wake on every file-system event in folder (inotify, FSEvents or
+    ReadDirectoryChangesW) when watchdog is installed; returns None otherwise.
+    """
+    if Observer is None:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            loop.call_soon_threadsafe(wake.set)
+
+    observer = Observer()
+    observer.schedule(Handler(), folder, recursive=False)
+    observer.start()
+    return observer
+
+
+async def scan_downloads(downloads, queue, wake, poll_seconds, events):
+    """
+    Put each completed download on the queue. With file-system events the folder is
+    rescanned on each event and, while a download settles, every poll_seconds.
+    """
+    while True:
+        for path in downloads.ready():
+            await queue.put(path)
+        timeout = poll_seconds if not events or downloads.pending else None
+        try:
+            await asyncio.wait_for(wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        wake.clear()
+
+
+async def import_batches(batcher, queue, idle_seconds, flush_seconds):
+    """
+    Coalesce queued downloads: a batch closes once no download has arrived for
+    idle_seconds, or flush_seconds after its first one. The import runs in a worker
+    thread, so downloads arriving meanwhile queue up for the next batch.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        batcher.add(await queue.get())
+        first = last = time.monotonic()
+        while True:
+            timeout = min(last + idle_seconds, first + flush_seconds) - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batcher.add(await asyncio.wait_for(queue.get(), timeout))
+                last = time.monotonic()
+            except asyncio.TimeoutError:
+                break
+        await loop.run_in_executor(None, batcher.flush)
+
+
+async def watch(config, import_existing=False):
+    """Watch the download folder and import new downloads until cancelled (Ctrl+C)."""
+    folder = download_folder(config)
+    if not os.path.isdir(folder):
+        raise FileNotFoundError(f"Download folder not found: {folder}")
+    poll_seconds = float(config.get("watch_poll_seconds", WATCH_POLL_SECONDS))
+    downloads = DownloadFolder(folder, float(config.get("watch_settle_seconds", WATCH_SETTLE_SECONDS)),
+                               import_existing)
+    batcher = ImportBatcher(config)
+    queue, wake = asyncio.Queue(), asyncio.Event()
+    observer = start_observer(folder, asyncio.get_running_loop(), wake)
+    print(f"Watching {folder} ({'file-system events' if observer else f'polling every {poll_seconds:g}s'}); "
+          f"Ctrl+C to stop")
+    try:
+        await asyncio.gather(
+            scan_downloads(downloads, queue, wake, poll_seconds, observer is not None),
+            import_batches(batcher, queue, float(config.get("watch_idle_seconds", WATCH_IDLE_SECONDS)),
+                           float(config.get("watch_flush_seconds", WATCH_FLUSH_SECONDS))))
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+        while not queue.empty():
+            batcher.add(queue.get_nowait())
+        batcher.flush()
+        batcher.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import new downloads from the download folder as they arrive")
+    parser.add_argument('--import-existing', action='store_true', help="Import the downloads already in the folder too")
+    args = parser.parse_args()
+
+    config = load_config()
+    try:
+        asyncio.run(watch(config, args.import_existing))
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
@@ -0,0 +1,87 @@
+# II_Watermark.py
+from openpyxl.packaging.custom import IntProperty
+from openpyxl.utils import column_index_from_string
+from II_Constants import WATERMARK_LAST_DATA_ROW, WATERMARK_LAST_FORMULA_ROW
+
+
+def _is_filled(sheet, column, row):
+    # Look the cell up without creating it, so probing never grows the used range
+    cell = sheet._cells.get((row, column_index_from_string(column)))
+    value = cell.value if cell is not None else None
+    return value is not None and not (isinstance(value, str) and not value.strip())
+
+
+def get_watermark(book, name):
+    """Return the row recorded under a custom document property, or None."""
+    props = book.custom_doc_props
+    if name not in props.names:
+        return None
+    try:
+        return int(props[name].value)
+    except (TypeError, ValueError):
+        return None
+
+
+def set_watermark(book, name, row):
+    """Record a row number as an integer custom document property."""
+    props = book.custom_doc_props
+    if name in props.names:
+        props[name].value = int(row)
+    else:
+        props.append(IntProperty(name=name, value=int(row)))
+
+
+def is_valid_watermark(sheet, column, row, first_row=2):
+    """Cheap check: the recorded row is filled (or is the header) and the next one is empty."""
+    if row is None or row < first_row - 1:
+        return False
+    if row >= first_row and not _is_filled(sheet, column, row):
+        return False
+    return not _is_filled(sheet, column, row + 1)
+
+
+def search_last_row(sheet, column, first_row=2):
+    """
+    Binary search for the last filled row of a contiguous block in column that starts
+    at first_row. Returns first_row - 1 when the block is empty.
+    """
+    low, high = first_row - 1, max(sheet.max_row, first_row - 1)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if _is_filled(sheet, column, mid):
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def find_last_row(sheet, column, watermark_name, first_row=2):
+    """
+    Return the last filled row of column using the workbook watermark when it is still
+    valid, falling back to a binary search over the used range otherwise.
+    """
+    book = sheet.parent
+    name = watermark_name.format(sheet=sheet.title)
+    row = get_watermark(book, name)
+    if is_valid_watermark(sheet, column, row, first_row):
+        return row
+    row = search_last_row(sheet, column, first_row)
+    print(f"Watermark '{name}' missing or stale; found last row {row} in column {column} by search")
+    return row
+
+
+def last_data_row(sheet, column='B'):
+    return find_last_row(sheet, column, WATERMARK_LAST_DATA_ROW)
+
+
+def last_formula_row(sheet, column='A'):
+    return find_last_row(sheet, column, WATERMARK_LAST_FORMULA_ROW)
+
+
+def record_rows(sheet, data_row=None, formula_row=None):
+    """Update the data/formula watermarks of a sheet after rows have been written."""
+    book = sheet.parent
+    if data_row is not None:
+        set_watermark(book, WATERMARK_LAST_DATA_ROW.format(sheet=sheet.title), data_row)
+    if formula_row is not None:
+        set_watermark(book, WATERMARK_LAST_FORMULA_ROW.format(sheet=sheet.title), formula_row)
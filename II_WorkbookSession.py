@@ -0,0 +1,117 @@
+# II_WorkbookSession.py
+import os
+import shutil
+import tempfile
+import openpyxl
+import pandas as pd
+from II_Constants import DEFAULT_ACCOUNT, CATEGORY_MODE_FORMULA
+from II_Metrics import stage, add_cells
+from II_Reader import workbook_stat
+
+
+def frame_rows(df):
+    """Yield the rows of df as plain cell values, with NaN/NaT mapped to empty cells."""
+    for row in df.itertuples(index=False, name=None):
+        yield tuple(None if pd.isna(value) else value for value in row)
+
+
+def write_rows(sheet, rows, start_row, start_col):
+    """Write an iterable of row tuples into sheet from (start_row, start_col). Returns the last row written."""
+    row_idx = start_row - 1
+    cells = 0
+    for row_idx, row in enumerate(rows, start=start_row):
+        for col_idx, value in enumerate(row, start=start_col):
+            if value is not None:
+                sheet.cell(row=row_idx, column=col_idx, value=value)
+                cells += 1
+    add_cells(cells)
+    return row_idx
+
+
+class WorkbookSession:
+    """
+    Open a workbook once, let the importers modify it in memory, and save it once.
+    The save goes to a temporary file in the same folder which then replaces the
+    workbook, so an interrupted save never leaves a half-written II_YYYYMMDD.xlsx.
+
+    An optional II_Ledger.Ledger receives the same normalized rows; the importers stage
+    them and commit once the workbook has been saved. An optional II_Snapshots.SnapshotStore
+    gets the holdings of each Investments refresh appended, also once the workbook is saved.
+
+    category_mode selects how column A is filled for new rows: the VLOOKUP formulas
+    (CATEGORY_MODE_FORMULA) or their values resolved in Python (CATEGORY_MODE_VALUE,
+    see II_MapResolver, which caches the loaded map sheets in category_maps).
+
+    Usage:
+        with WorkbookSession(excel_path) as session:
+            append_transactions(session, transactions_df)
+            refresh_investments(session, investments_df)
+        # saved on a clean exit
+    """
+
+    def __init__(self, excel_path, ledger=None, account=DEFAULT_ACCOUNT, category_mode=CATEGORY_MODE_FORMULA,
+                 snapshots=None):
+        if not os.path.exists(excel_path):
+            raise FileNotFoundError(f"Excel file not found at: {excel_path}")
+        self.excel_path = excel_path
+        self.ledger = ledger
+        self.account = account
+        self.category_mode = category_mode
+        self.category_maps = None
+        self.snapshots = snapshots
+        print("Loading Excel file...")
+        with stage('workbook_load'):
+            self.book = openpyxl.load_workbook(excel_path)
+        self.stat = workbook_stat(excel_path)  # As loaded, then as last saved (see II_Reader)
+        self.dirty = False
+        self._on_save = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and self.dirty:
+            self.save()
+        self.close()
+        return False
+
+    def sheet(self, name):
+        """Return a worksheet, raising ValueError if the workbook does not have it."""
+        if name not in self.book.sheetnames:
+            raise ValueError(f"Sheet '{name}' not found in the workbook")
+        return self.book[name]
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def on_save(self, callback):
+        """Register a callback to run once the workbook has been saved successfully."""
+        self._on_save.append(callback)
+
+    def save(self):
+        """Save atomically: write a temporary file next to the workbook, with its permissions, then replace it."""
+        folder = os.path.dirname(os.path.abspath(self.excel_path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.ii_save_', suffix='.xlsx', dir=folder)
+        os.close(fd)
+        try:
+            with stage('workbook_save'):
+                self.book.save(tmp_path)
+                if os.path.exists(self.excel_path):
+                    shutil.copymode(self.excel_path, tmp_path)  # mkstemp files are private to the user
+                os.replace(tmp_path, self.excel_path)
+        except PermissionError:
+            raise PermissionError(f"Permission denied when saving {self.excel_path}. "
+                                  f"Ensure the file is not open in another application.")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.dirty = False
+        self.stat = workbook_stat(self.excel_path)
+        print(f"File saved successfully: {self.excel_path}")
+
+        callbacks, self._on_save = self._on_save, []
+        for callback in callbacks:
+            callback()
+
+    def close(self):
+        self.book.close()
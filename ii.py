@@ -0,0 +1,389 @@
+# ii.py
+"""
+Command-line entry point for the Interactive Investor scripts.
+
+    python ii.py import transactions|investments|all|accounts [--rebuild]
+    python ii.py backfill FOLDER|GLOB [--workers N] [--processes] [--rebuild]
+    python ii.py roll [--date MM/DD/YYYY] [--workbook PATH] [--overwrite] [--compact]
+    python ii.py ledger seed|render
+    python ii.py categories convert [WORKBOOK]
+    python ii.py snapshots portfolio [--date YYYY-MM-DD] | position SYMBOL
+    python ii.py gains [--rebuild] [--investments-csv PATH]
+    python ii.py returns [--as-of YYYY-MM-DD] [--periods]
+    python ii.py partition archive [--before YEAR] | list
+    python ii.py watch [--import-existing]
+    python ii.py startup
+
+Nothing here opens a dialog, so it runs on a headless box or from a scheduled task.
+pandas, openpyxl and the importers are only imported by the subcommands that use
+them; `python ii.py startup` measures the cold start of each subcommand.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Subcommands measured by `ii startup`, as argument lists
+STARTUP_COMMANDS = [
+    ['import', 'transactions'], ['import', 'investments'], ['import', 'all'], ['import', 'accounts'],
+    ['import', 'all', '--rebuild'], ['backfill', '.'],
+    ['roll'], ['ledger', 'seed'], ['categories', 'convert'], ['snapshots', 'portfolio'],
+    ['gains'], ['returns'], ['partition', 'list'], ['watch'],
+]
+
+
+def _config():
+    from II_Config import load_config
+    return load_config()
+
+
+def _excel_path(args, config):
+    from II_Constants import DEFAULT_EXCEL_PATH
+    return getattr(args, 'excel', None) or config.get("excel_path", DEFAULT_EXCEL_PATH)
+
+
+def cmd_import(args):
+    from II_Constants import (
+        DEFAULT_ACCOUNT, TRANSACTIONS_CSV_PATH, INVESTMENTS_CSV_PATH, INVESTMENTS_SHEET, INVESTMENTS_START_CELL,
+        CATEGORY_MODE_FORMULA
+    )
+    from II_Metrics import run_metrics
+    if args.what == 'transactions':
+        from II_TransactionsImport import import_transactions
+    elif args.what == 'investments':
+        from II_InvestmentsImport import import_csv_to_excel
+    elif args.what == 'all':
+        from II_ImportAll import import_all
+    else:
+        from II_MultiAccount import import_accounts
+    if args.rebuild:
+        from II_Rebuild import rebuild_import
+    from II_Ledger import open_ledger
+    from II_Snapshots import open_snapshots
+    if args.import_only:
+        return 0
+
+    config = _config()
+    if args.what == 'accounts':
+        if args.rebuild:
+            raise ValueError("--rebuild imports one workbook; use it with transactions, investments or all")
+        results = import_accounts(config)
+        return 1 if any(result["error"] for result in results) else 0
+
+    excel_path = _excel_path(args, config)
+    account = config.get("account", DEFAULT_ACCOUNT)
+    category_mode = args.category_mode or config.get("category_mode", CATEGORY_MODE_FORMULA)
+    ledger = open_ledger(config)
+    snapshots = open_snapshots(config, account) if args.what != 'transactions' else None
+    try:
+        with run_metrics(f'import_{args.what}', excel_path, profile=args.profile or config.get("profile", False)):
+            if args.rebuild:
+                rebuild_import(excel_path,
+                               args.transactions_csv or TRANSACTIONS_CSV_PATH if args.what != 'investments' else None,
+                               args.investments_csv or INVESTMENTS_CSV_PATH if args.what != 'transactions' else None,
+                               ledger=ledger, account=account, category_mode=category_mode, snapshots=snapshots)
+            elif args.what == 'transactions':
+                import_transactions(args.transactions_csv or TRANSACTIONS_CSV_PATH, excel_path,
+                                    chunksize=args.stream_rows or config.get("stream_chunk_rows"),
+                                    ledger=ledger, account=account, category_mode=category_mode)
+            elif args.what == 'investments':
+                import_csv_to_excel(args.investments_csv or INVESTMENTS_CSV_PATH, excel_path, INVESTMENTS_SHEET,
+                                    INVESTMENTS_START_CELL, ledger=ledger, account=account,
+                                    category_mode=category_mode, snapshots=snapshots)
+            else:
+                import_all(excel_path, args.transactions_csv or TRANSACTIONS_CSV_PATH,
+                           args.investments_csv or INVESTMENTS_CSV_PATH, ledger=ledger, account=account,
+                           category_mode=category_mode, snapshots=snapshots)
+    finally:
+        if ledger is not None:
+            ledger.close()
+    return 0
+
+
+def cmd_backfill(args):
+    from II_Constants import DEFAULT_ACCOUNT, CATEGORY_MODE_FORMULA
+    from II_Metrics import run_metrics
+    from II_Backfill import backfill
+    from II_Ledger import open_ledger
+    if args.import_only:
+        return 0
+
+    config = _config()
+    excel_path = _excel_path(args, config)
+    ledger = open_ledger(config)
+    try:
+        with run_metrics('backfill', excel_path, profile=args.profile or config.get("profile", False)):
+            appended = backfill(args.source, excel_path, args.workers, args.processes, args.rebuild, ledger,
+                                config.get("account", DEFAULT_ACCOUNT),
+                                args.category_mode or config.get("category_mode", CATEGORY_MODE_FORMULA))
+    finally:
+        if ledger is not None:
+            ledger.close()
+    print(f"Backfill complete: {appended} new transactions")
+    return 0
+
+
+def cmd_roll(args):
+    from II_RollReport import roll_to_next_business_day, previous_business_day, validate_date, setup_logging
+    from II_Metrics import run_metrics
+    if args.import_only:
+        return 0
+
+    setup_logging()
+
+    config = _config()
+    workbook_path = args.workbook or config.get("excel_path")
+    business_date = args.date or previous_business_day()
+    if not workbook_path:
+        raise ValueError("No workbook given and no excel_path in config.json")
+    if not validate_date(business_date):
+        raise ValueError("Business date must be MM/DD/YYYY")
+    with run_metrics('roll_report', workbook_path, profile=args.profile or config.get("profile", False)):
+        new_path = roll_to_next_business_day(workbook_path, business_date, overwrite=args.overwrite,
+                                             compact=args.compact)
+    print(f"New report created: {new_path}")
+    return 0
+
+
+def cmd_ledger(args):
+    from II_Constants import DEFAULT_ACCOUNT, CATEGORY_MODE_FORMULA
+    from II_Ledger import open_ledger
+    from II_LedgerView import seed_ledger, render_view
+    if args.import_only:
+        return 0
+
+    config = _config()
+    excel_path = _excel_path(args, config)
+    account = config.get("account", DEFAULT_ACCOUNT)
+    ledger = open_ledger(config)
+    if ledger is None:
+        raise FileNotFoundError("Ledger not available")
+    try:
+        if args.action == 'seed':
+            seed_ledger(excel_path, ledger, account)
+        else:
+            render_view(excel_path, ledger, account,
+                        args.category_mode or config.get("category_mode", CATEGORY_MODE_FORMULA))
+    finally:
+        ledger.close()
+    return 0
+
+
+def cmd_categories(args):
+    from II_MapResolver import convert_formulas_to_values
+    from II_WorkbookSession import WorkbookSession
+    if args.import_only:
+        return 0
+
+    excel_path = args.workbook or _excel_path(args, _config())
+    with WorkbookSession(excel_path) as session:
+        convert_formulas_to_values(session)
+    return 0
+
+
+def cmd_snapshots(args):
+    from II_Constants import DEFAULT_ACCOUNT
+    from II_Snapshots import open_snapshots
+    if args.import_only:
+        return 0
+
+    config = _config()
+    store = open_snapshots(config, args.account or config.get("account", DEFAULT_ACCOUNT))
+    if store is None:
+        raise FileNotFoundError("Snapshot store not available")
+    if args.action == 'position':
+        if not args.symbol:
+            raise ValueError("position needs a SYMBOL")
+        print(store.position(args.symbol).to_string())
+    else:
+        portfolio = store.portfolio(args.date)
+        print(f"Portfolio as of {portfolio.attrs.get('as_of', '-')}:")
+        print(portfolio.to_string(index=False))
+    return 0
+
+
+def cmd_gains(args):
+    from II_Constants import DEFAULT_ACCOUNT, INVESTMENTS_CSV_PATH
+    from II_Ledger import open_ledger
+    from II_CostBasis import CostBasis, cost_basis_path_for, update_from_ledger, compare_book_cost
+    if args.import_only:
+        return 0
+
+    config = _config()
+    ledger = open_ledger(config)
+    if ledger is None:
+        raise FileNotFoundError("Ledger not available")
+    try:
+        cost_basis = CostBasis(cost_basis_path_for(config), config.get("account", DEFAULT_ACCOUNT))
+        update_from_ledger(cost_basis, ledger, rebuild=args.rebuild)
+        cost_basis.save()
+    finally:
+        ledger.close()
+    print(cost_basis.realized_gains().to_string(index=False))
+    investments_csv = args.investments_csv or INVESTMENTS_CSV_PATH
+    if os.path.exists(investments_csv):
+        from II_InvestmentsImport import load_investments_csv
+        print(compare_book_cost(cost_basis.pools(), load_investments_csv(investments_csv)).to_string(index=False))
+    return 0
+
+
+def cmd_returns(args):
+    from II_Constants import DEFAULT_ACCOUNT
+    from II_Snapshots import open_snapshots
+    from II_Returns import portfolio_returns
+    if args.import_only:
+        return 0
+    config = _config()
+    snapshots = open_snapshots(config, args.account or config.get("account", DEFAULT_ACCOUNT))
+    returns, periods = portfolio_returns(_excel_path(args, config), snapshots, args.as_of)
+    print(returns.to_string(index=False))
+    if args.periods and periods is not None:
+        print(periods.to_string())
+    return 0
+
+
+def cmd_partition(args):
+    from II_Partition import archive_closed_years, archive_path_for, load_partitions
+    if args.import_only:
+        return 0
+
+    config = _config()
+    excel_path = _excel_path(args, config)
+    if args.action == 'archive':
+        archive_closed_years(excel_path, args.before, archive_path_for(excel_path, config))
+    else:
+        print(load_partitions(excel_path).to_string(index=False))
+    return 0
+
+
+def cmd_watch(args):
+    import asyncio
+    from II_Watch import watch
+    if args.import_only:
+        return 0
+
+    try:
+        asyncio.run(watch(_config(), args.import_existing))
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    return 0
+
+
+def cmd_startup(args):
+    """Time `python ii.py --import-only <subcommand>` in fresh interpreters: start-up plus imports, no work."""
+    script = os.path.abspath(__file__)
+    print(f"Cold start per subcommand (median of {args.repeat} runs, interpreter start-up included):")
+    baseline = None
+    for command in [[]] + STARTUP_COMMANDS:
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, script, '--import-only'] + (command or ['--version']), check=True,
+                           stdout=subprocess.DEVNULL)
+            times.append(time.perf_counter() - start)
+        median = statistics.median(times)
+        if baseline is None:
+            baseline = median
+            print(f"  {'(CLI only)':<24} {median * 1000:7.0f} ms")
+        else:
+            print(f"  {' '.join(command):<24} {median * 1000:7.0f} ms  (+{(median - baseline) * 1000:.0f} ms imports)")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='ii', description="Interactive Investor workbook tools")
+    parser.add_argument('--version', action='version', version='ii 1.0')
+    parser.add_argument('--import-only', action='store_true', help=argparse.SUPPRESS)  # Used by `ii startup`
+    parser.add_argument('--profile', action='store_true', help="Profile the run with cProfile")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('import', help="Import the CSV downloads into the workbook")
+    p.add_argument('what', choices=['transactions', 'investments', 'all', 'accounts'])
+    p.add_argument('--excel', help="Workbook (default: excel_path in config.json)")
+    p.add_argument('--transactions-csv', help="Transactions.csv download")
+    p.add_argument('--investments-csv', help="Investments.csv download")
+    p.add_argument('--stream-rows', type=int, help="Import Transactions in chunks of this many rows")
+    p.add_argument('--category-mode', choices=['formula', 'value'], help="Column A formulas or resolved values")
+    p.add_argument('--rebuild', action='store_true',
+                   help="Stream the workbook through instead of loading it (large workbooks)")
+    p.set_defaults(func=cmd_import)
+
+    p = subparsers.add_parser('backfill', help="Import a folder or glob of overlapping Transactions downloads at once")
+    p.add_argument('source', help="Folder of Transactions*.csv downloads, or a glob such as 'Transactions_*.csv'")
+    p.add_argument('--excel', help="Workbook (default: excel_path in config.json)")
+    p.add_argument('--workers', type=int, help="Parallel readers (default: one per file, up to the CPU count)")
+    p.add_argument('--processes', action='store_true', help="Read in worker processes instead of threads")
+    p.add_argument('--category-mode', choices=['formula', 'value'], help="Column A formulas or resolved values")
+    p.add_argument('--rebuild', action='store_true',
+                   help="Stream the workbook through instead of loading it (large workbooks)")
+    p.set_defaults(func=cmd_backfill)
+
+    p = subparsers.add_parser('roll', help="Copy the workbook to the next business date")
+    p.add_argument('--date', help="Business date MM/DD/YYYY (default: previous business day)")
+    p.add_argument('--workbook', help="Workbook to roll (default: excel_path in config.json)")
+    p.add_argument('--overwrite', action='store_true', help="Replace an existing report instead of failing")
+    p.add_argument('--compact', action='store_true', default=None,
+                   help="Write a compacted copy (default: compact_on_roll in config.json)")
+    p.set_defaults(func=cmd_roll)
+
+    p = subparsers.add_parser('ledger', help="Seed the ledger from the workbook, or render the workbook from it")
+    p.add_argument('action', choices=['seed', 'render'])
+    p.add_argument('--excel', help="Workbook (default: excel_path in config.json)")
+    p.add_argument('--category-mode', choices=['formula', 'value'], help="Column A formulas or resolved values")
+    p.set_defaults(func=cmd_ledger)
+
+    p = subparsers.add_parser('categories', help="Replace the column A category formulas with values")
+    p.add_argument('action', choices=['convert'])
+    p.add_argument('workbook', nargs='?', help="Workbook (default: excel_path in config.json)")
+    p.set_defaults(func=cmd_categories)
+
+    p = subparsers.add_parser('snapshots', help="Query the holdings snapshot history")
+    p.add_argument('action', choices=['portfolio', 'position'])
+    p.add_argument('symbol', nargs='?', help="position: the symbol")
+    p.add_argument('--date', help="portfolio: latest snapshot on or before this date (default: the latest)")
+    p.add_argument('--account', help="Account (default: account in config.json)")
+    p.set_defaults(func=cmd_snapshots)
+
+    p = subparsers.add_parser('gains', help="Update the Section 104 cost basis from the ledger and list realized gains")
+    p.add_argument('--rebuild', action='store_true', help="Replay every ledger transaction instead of the new ones")
+    p.add_argument('--investments-csv', help="Investments.csv to compare Book Cost with")
+    p.set_defaults(func=cmd_gains)
+
+    p = subparsers.add_parser('returns', help="XIRR and time-weighted return per holding and for the portfolio")
+    p.add_argument('--excel', help="Workbook (default: excel_path in config.json)")
+    p.add_argument('--as-of', help="Valuation date of the Investments sheet (default: workbook date or latest transaction)")
+    p.add_argument('--periods', action='store_true', help="Also print the return of every snapshot period")
+    p.add_argument('--account', help="Account of the snapshot store (default: account in config.json)")
+    p.set_defaults(func=cmd_returns)
+
+    p = subparsers.add_parser('partition', help="Move closed years of Transactions to the archive workbook")
+    p.add_argument('action', choices=['archive', 'list'])
+    p.add_argument('--before', type=int, help="archive: move the years before this one (default: workbook year)")
+    p.add_argument('--excel', help="Workbook (default: excel_path in config.json)")
+    p.set_defaults(func=cmd_partition)
+
+    p = subparsers.add_parser('watch', help="Import new downloads from the download folder as they arrive")
+    p.add_argument('--import-existing', action='store_true', help="Import the downloads already in the folder too")
+    p.set_defaults(func=cmd_watch)
+
+    p = subparsers.add_parser('startup', help="Measure the cold-start time of each subcommand")
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=cmd_startup)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (FileNotFoundError, PermissionError, ValueError, RuntimeError) as e:
+        print(f"Error: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+# test_cost_basis.py
+import numpy as np
+import pandas as pd
+import pytest
+from II_CostBasis import CostBasis, RULE_30_DAY, RULE_POOL, RULE_SAME_DAY, _pool
+
+
+def transactions(*rows):
+    """Normalized Transactions rows from (date, symbol, quantity, description, debit, credit)."""
+    return pd.DataFrame(rows, columns=['Date', 'Symbol', 'Quantity', 'Description', 'Debit', 'Credit'])
+
+
+def buy(date, symbol, qty, cost):
+    return (date, symbol, qty, f"Bought {qty} {symbol}", cost, None)
+
+
+def sell(date, symbol, qty, proceeds):
+    return (date, symbol, -qty, f"Sold {qty} {symbol}", None, proceeds)
+
+
+def dividend(date, symbol, amount):
+    return (date, symbol, None, f"Div {symbol}", None, amount)
+
+
+def gains_of(cost_basis):
+    return cost_basis.realized_gains()[['Date', 'Symbol', 'Rule', 'Quantity', 'Proceeds', 'Cost', 'Gain']]
+
+
+def replay(tmp_path, batches):
+    """Gains and pools of the batches fed one update at a time, and of all of them in one update."""
+    incremental = CostBasis(str(tmp_path / 'incremental.json'))
+    for batch in batches:
+        incremental.update(transactions(*batch))
+        incremental.save()
+        incremental = CostBasis(incremental.path)  # Reloaded from the state file, as by the next import
+    full = CostBasis(str(tmp_path / 'full.json'))
+    full.update(transactions(*[row for batch in batches for row in batch]))
+    return incremental, full
+
+
+def test_dividend_does_not_finalize_a_disposal_within_30_days(tmp_path):
+    incremental, full = replay(tmp_path, [
+        [buy('2024-01-01', 'ABC', 10, 1000.0), sell('2024-03-01', 'ABC', 10, 1500.0), dividend('2024-03-31', 'ABC', 5.0)],
+        [buy('2024-03-31', 'ABC', 10, 1450.0)],
+    ])
+    gains = gains_of(incremental)
+    assert list(gains['Rule']) == [RULE_30_DAY]
+    assert gains['Gain'].iloc[0] == pytest.approx(50.0)
+    pd.testing.assert_frame_equal(gains, gains_of(full))
+
+
+def test_acquisition_on_the_last_trade_day_is_still_matched(tmp_path):
+    # The sell is 30 days before the last trade; another buy dated that day arrives later
+    incremental, full = replay(tmp_path, [
+        [buy('2024-01-01', 'ABC', 10, 1000.0), sell('2024-03-01', 'ABC', 10, 1500.0), buy('2024-03-31', 'ABC', 5, 700.0)],
+        [buy('2024-03-31', 'ABC', 5, 750.0)],
+    ])
+    pd.testing.assert_frame_equal(gains_of(incremental), gains_of(full))
+    assert gains_of(full)['Rule'].tolist() == [RULE_30_DAY]
+
+
+def test_incremental_updates_match_a_full_replay(tmp_path):
+    rng = np.random.default_rng(7)
+    dates = pd.bdate_range('2023-01-02', periods=300)
+    rows, held = [], {'ABC': 0, 'XYZ': 0}
+    for date in dates:
+        for symbol in list(held) * 2:  # Up to two trades a symbol a day, for same day matches
+            if rng.random() < 0.3:
+                qty = int(rng.integers(1, 20))
+                price = round(float(rng.uniform(5, 15)), 2)
+                if held[symbol] >= qty and rng.random() < 0.5:
+                    rows.append(sell(str(date.date()), symbol, qty, round(qty * price, 2)))
+                    held[symbol] -= qty
+                else:
+                    rows.append(buy(str(date.date()), symbol, qty, round(qty * price + 5.0, 2)))
+                    held[symbol] += qty
+        if rng.random() < 0.05:
+            rows.append(dividend(str(date.date()), 'ABC', 12.5))
+    batches = [rows[start:start + 25] for start in range(0, len(rows), 25)]
+
+    incremental, full = replay(tmp_path, batches)
+    expected, actual = gains_of(full), gains_of(incremental)
+    assert {RULE_SAME_DAY, RULE_30_DAY, RULE_POOL} <= set(expected['Rule'])
+    pd.testing.assert_frame_equal(actual, expected, check_exact=False, atol=0.02)
+    pd.testing.assert_frame_equal(incremental.pools(), full.pools(), check_exact=False, atol=0.02)
+
+
+def test_pool_matches_a_day_by_day_loop():
+    acquired = np.array([10.0, 0.0, 5.0, 0.0, 0.0, 8.0])
+    cost = np.array([100.0, 0.0, 80.0, 0.0, 0.0, 90.0])
+    disposed = np.array([0.0, 4.0, 0.0, 11.0, 2.0, 0.0])  # Empties the pool, then one more than it holds
+
+    quantity, total, costs, unmatched = _pool(acquired, cost, disposed, 0.0, 0.0)
+
+    pool_qty = pool_cost = 0.0
+    for i in range(len(acquired)):
+        matched = min(disposed[i], pool_qty)
+        allowable = pool_cost * matched / pool_qty if matched else 0.0
+        assert costs[i] == pytest.approx(allowable)
+        assert unmatched[i] == pytest.approx(disposed[i] - matched)
+        pool_qty, pool_cost = pool_qty - matched + acquired[i], pool_cost - allowable + cost[i]
+        assert quantity[i] == pytest.approx(pool_qty)
+        assert total[i] == pytest.approx(pool_cost)
@@ -0,0 +1,27 @@
+# test_multi_account.py
+import pytest
+from II_Constants import TRANSACTIONS_CSV_PATH
+from II_MultiAccount import account_configs
+
+
+def account(name, **paths):
+    return dict({"name": name, "excel_path": f"{name}.xlsx"}, **paths)
+
+
+def test_single_account_uses_the_default_downloads():
+    accounts = account_configs({"accounts": [account("isa")]})
+    assert accounts[0]["transactions_csv"] == TRANSACTIONS_CSV_PATH
+
+
+def test_accounts_need_their_own_downloads():
+    config = {"accounts": [account("isa", transactions_csv="isa/T.csv", investments_csv="isa/I.csv"),
+                           account("trading", investments_csv="trading/I.csv")]}
+    with pytest.raises(ValueError, match="'trading'.*transactions_csv"):
+        account_configs(config)
+
+
+def test_accounts_may_not_share_a_download():
+    config = {"accounts": [account("isa", transactions_csv="T.csv", investments_csv="isa/I.csv"),
+                           account("trading", transactions_csv="./T.csv", investments_csv="trading/I.csv")]}
+    with pytest.raises(ValueError, match="transactions_csv"):
+        account_configs(config)
@@ -0,0 +1,41 @@
+# test_normalize.py
+import numpy as np
+import pandas as pd
+import pytest
+from II_Normalize import parse_amount_column
+
+
+@pytest.mark.parametrize('text, value, unit', [
+    ('£1,234.56', 1234.56, 'GBP'),
+    ('-£79.20', -79.2, 'GBP'),
+    ('£-79.20', -79.2, 'GBP'),
+    ('£0.00', 0.0, 'GBP'),
+    ('$69.29', 69.29, 'USD'),
+    ('-$1,005.10', -1005.1, 'USD'),
+    ('3,054.00p', 30.54, 'GBP'),
+    ('68.1394p', 0.681394, 'GBP'),
+    ('1.45%', 1.45, '%'),
+    ('-0.37%', -0.37, '%'),
+    ('12', 12.0, None),
+    ('-3.5', -3.5, None),
+])
+def test_amounts(text, value, unit):
+    values, units = parse_amount_column(pd.Series([text]))
+    assert values.iloc[0] == value  # Exactly as float() of the decimal, pence included
+    assert units.iloc[0] == unit
+
+
+@pytest.mark.parametrize('text', ['n/a', '', 'Totals', 'GBP', '1.2.3', '--5', '£', '1234567890123456',
+                                  '5-3', '1£2', '2$', 'p12', '12p%', '5%3', '1.5p0'])
+def test_not_amounts(text):
+    values, units = parse_amount_column(pd.Series([text]))
+    assert np.isnan(values.iloc[0])
+    assert units.iloc[0] is None
+
+
+def test_column_keeps_its_index_and_mixed_units():
+    series = pd.Series(['£1.50', None, '250.00p', '$3', '4.5%'], index=[10, 11, 12, 13, 14])
+    values, units = parse_amount_column(series)
+    assert list(values.index) == list(series.index)
+    np.testing.assert_array_equal(values.to_numpy(), [1.5, np.nan, 2.5, 3.0, 4.5])
+    assert list(units) == ['GBP', None, 'GBP', 'USD', '%']
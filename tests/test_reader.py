@@ -0,0 +1,67 @@
+# test_reader.py
+import os
+import pandas as pd
+import pytest
+from II_Constants import FRAME_CACHE_MAX_PARTS, TRANSACTIONS_COLUMNS
+from II_Normalize import load_transactions_csv
+from II_Reader import FrameCache, TRANSACTIONS_DTYPES, typed_frame, workbook_stat
+
+
+@pytest.fixture(scope='module')
+def download():
+    return typed_frame(load_transactions_csv('Transactions.csv')[TRANSACTIONS_COLUMNS], TRANSACTIONS_DTYPES)
+
+
+def stat(version):
+    """A stand-in workbook stat: the cache only compares them."""
+    return {'path': 'II_20250101.xlsx', 'mtime_ns': version, 'size': 1000 + version}
+
+
+def appended_cache(tmp_path, download, imports):
+    """A cache written once and appended to by imports imports of two rows each."""
+    cache = FrameCache(str(tmp_path / 'II_20250101.xlsx'), 'transactions', TRANSACTIONS_DTYPES)
+    cache.write(download, stat(0))
+    for version in range(1, imports + 1):
+        assert cache.append(download.head(2), stat(version - 1), stat(version))
+    return cache
+
+
+def part_files(cache):
+    return sorted(entry for entry in os.listdir(cache.folder) if entry.startswith('transactions-'))
+
+
+def test_parts_are_merged_past_the_limit(tmp_path, download):
+    imports = FRAME_CACHE_MAX_PARTS
+    cache = appended_cache(tmp_path, download, imports)
+    assert cache._key()['parts'] == imports + 1
+
+    df = cache.load(stat(imports))
+    assert len(df) == len(download) + 2 * imports
+    assert cache._key()['parts'] == 1
+    assert len(part_files(cache)) == 1
+    pd.testing.assert_frame_equal(cache.load(stat(imports)), df)
+
+
+def test_a_few_parts_are_kept(tmp_path, download):
+    cache = appended_cache(tmp_path, download, 3)
+    assert len(cache.load(stat(3))) == len(download) + 6
+    assert cache._key()['parts'] == 4
+
+
+def test_carry_merges_into_one_part(tmp_path, download):
+    cache = appended_cache(tmp_path, download, 3)
+    target_path = tmp_path / 'II_20250102.xlsx'
+    target_path.write_bytes(b'')
+    assert cache.carry_to(stat(3), str(target_path))
+
+    target = FrameCache(str(target_path), 'transactions', TRANSACTIONS_DTYPES)
+    assert target._key()['parts'] == 1
+    df = target.load(workbook_stat(str(target_path)))
+    pd.testing.assert_frame_equal(df, cache.load(stat(3)))
+    assert df['Description'].dtype == 'category'
+
+
+def test_rows_not_matching_the_key_are_not_returned(tmp_path, download):
+    cache = appended_cache(tmp_path, download, 2)
+    cache._write(cache.load(stat(2)), cache._part_path(0))  # Part 0 merged, key not yet rewritten
+    assert cache.load(stat(2)) is None
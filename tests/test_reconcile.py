@@ -0,0 +1,45 @@
+# test_reconcile.py
+import warnings
+import pandas as pd
+from II_Ledger import Ledger
+from II_Reconcile import Reconciliation
+
+
+def holdings(rows):
+    """An Investments frame of (symbol, qty) rows."""
+    return pd.DataFrame(rows, columns=['Symbol', 'Qty'])
+
+
+def download():
+    df = pd.DataFrame({
+        'Date': pd.to_datetime(['2025-01-02', '2025-01-03']), 'Symbol': ['ABC', 'ABC'], 'Sedol': [None, None],
+        'Quantity': [10.0, -4.0], 'Description': ['Bought', 'Sold'], 'Reference': ['R1', 'R2'],
+        'Debit': [-100.0, None], 'Credit': [None, 50.0], 'Running Balance': [900.0, 950.0],
+    })
+    return df.iloc[::-1].reset_index(drop=True)  # Newest first, as downloaded
+
+
+def test_empty_ledger_falls_back_to_the_download(tmp_path):
+    ledger = Ledger(str(tmp_path / 'II_Ledger.sqlite'))
+    try:
+        ledger_quantities = ledger.symbol_quantities('ISA')
+    finally:
+        ledger.close()
+    reconciliation = Reconciliation()
+    reconciliation.add(download())
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        reconciliation.finish(investments=holdings([('ABC', 6.0)]), ledger_quantities=ledger_quantities)
+    assert reconciliation.quantity_source == "download"
+    assert reconciliation.holdings.empty
+    assert reconciliation.ok
+
+
+def test_ledger_history_and_new_rows_against_qty():
+    reconciliation = Reconciliation()
+    reconciliation.add(download(), is_new=[True, False])  # Only the sell is new
+    reconciliation.finish(investments=holdings([('ABC', 6.0), ('XYZ', 3.0)]),
+                          ledger_quantities=pd.Series({'ABC': 10.0}))
+    assert reconciliation.quantity_source == "ledger and new rows"
+    assert reconciliation.holdings.to_dict('records') == [
+        {'Holding': 'XYZ', 'Transactions Qty': 0.0, 'Qty': 3.0, 'Difference': -3.0}]
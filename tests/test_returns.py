@@ -0,0 +1,62 @@
+# test_returns.py
+import numpy as np
+import pandas as pd
+import pytest
+from II_Returns import xirr, _bisect
+
+# Microsoft's XIRR example: Excel returns 0.373362535
+EXCEL_AMOUNTS = [-10000, 2750, 4250, 3250, 2750]
+EXCEL_DATES = ['2008-01-01', '2008-03-01', '2008-10-30', '2009-02-15', '2009-04-01']
+
+
+def years_from_first(dates):
+    days = pd.to_datetime(pd.Series(dates)).to_numpy().astype('datetime64[D]').astype(np.int64)
+    return (days - days.min()) / 365.0
+
+
+def test_excel_reference_case():
+    assert xirr(EXCEL_AMOUNTS, EXCEL_DATES)[0] == pytest.approx(0.373362535, abs=1e-8)  # Excel shows 9 places
+
+
+@pytest.mark.parametrize('amounts, dates, expected', [
+    ([-1000, 1100], ['2023-01-01', '2024-01-01'], 0.1),  # One year of 365 days at 10%
+    ([-1000, 1000], ['2023-01-01', '2023-07-01'], 0.0),
+    ([-1000, 500], ['2023-01-01', '2024-01-01'], -0.5),
+    ([-100, -100, 250], ['2023-01-01', '2024-01-01', '2024-12-31'], (np.sqrt(11) - 1) / 2 - 1),  # 100x² + 100x = 250
+])
+def test_known_rates(amounts, dates, expected):
+    assert xirr(amounts, dates)[0] == pytest.approx(expected, abs=1e-5)
+
+
+def test_series_solved_together_match_solved_alone():
+    series = [
+        (EXCEL_AMOUNTS, EXCEL_DATES),
+        ([-1000, 1100], ['2023-01-01', '2024-01-01']),
+        ([-500, 20, 20, 600], ['2020-03-15', '2021-03-15', '2022-03-15', '2023-03-15']),
+    ]
+    amounts = [amount for flows, _ in series for amount in flows]
+    dates = [date for _, flow_dates in series for date in flow_dates]
+    groups = [number for number, (flows, _) in enumerate(series) for _ in flows]
+    together = xirr(amounts, dates, groups)
+    alone = [xirr(flows, flow_dates)[0] for flows, flow_dates in series]
+    np.testing.assert_allclose(together, alone, rtol=1e-9)
+
+
+def test_flows_of_one_sign_have_no_rate():
+    rates = xirr([-100, -50, -100, 120], ['2023-01-01', '2023-06-01', '2023-01-01', '2024-01-01'], [0, 0, 1, 1])
+    assert np.isnan(rates[0])
+    assert rates[1] == pytest.approx(0.2, abs=1e-9)
+
+
+def test_near_total_loss_falls_back_to_bisection():
+    # Newton from the default guess steps below -100%; the bisection finds the rate
+    rate = xirr([-1000, 1], ['2023-01-01', '2024-01-01'])[0]
+    assert rate == pytest.approx(-0.999, abs=1e-6)
+
+
+def test_bisect_agrees_with_newton():
+    amounts = np.array(EXCEL_AMOUNTS + [-1000, 1100], dtype=float)
+    years = np.concatenate([years_from_first(EXCEL_DATES), years_from_first(['2023-01-01', '2024-01-01'])])
+    groups = np.array([0] * len(EXCEL_AMOUNTS) + [1, 1])
+    rates = _bisect(np.array([True, True]), amounts, years, groups, 2)
+    np.testing.assert_allclose(rates, [0.373362535, 0.1], atol=1e-7)
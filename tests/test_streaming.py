@@ -0,0 +1,64 @@
+# test_streaming.py
+import shutil
+import openpyxl
+import pandas as pd
+import pytest
+from II_Constants import TRANSACTIONS_SHEET
+from II_Normalize import load_transactions_csv
+from II_Streaming import merge_downloads, spill_transaction_runs
+from II_SyntheticData import make_benchmark_set
+from II_TransactionIndex import transaction_keys
+from II_TransactionsImport import import_transactions
+from II_WorkbookSession import frame_rows
+
+
+@pytest.fixture(scope='module')
+def benchmark_set(tmp_path_factory):
+    """A template workbook with 300 Transactions rows and a download of 400 more."""
+    return make_benchmark_set(str(tmp_path_factory.mktemp('set')), 400, history=300, holdings=10)
+
+
+def sheet_values(excel_path):
+    book = openpyxl.load_workbook(excel_path)
+    try:
+        return [row for row in book[TRANSACTIONS_SHEET].iter_rows(values_only=True)]
+    finally:
+        book.close()
+
+
+def test_merge_downloads_matches_a_sorted_concat(benchmark_set):
+    df = load_transactions_csv(benchmark_set[1])
+    frames = [df.iloc[300:].reset_index(drop=True), df.iloc[150:350].reset_index(drop=True),
+              df.iloc[:200].reset_index(drop=True)]  # Overlapping downloads, newest first
+
+    # Keyed per download, as a row's copies in two downloads share its key
+    keys = pd.concat([transaction_keys(frame) for frame in frames], ignore_index=True)
+    combined = pd.concat(frames, ignore_index=True).assign(key=keys)
+    combined = combined.sort_values('Date', kind='stable', na_position='last')
+    expected = combined[~combined['key'].duplicated()].drop(columns='key').reset_index(drop=True)
+    merged = merge_downloads(frames)
+    assert len(merged) == len(df)
+    pd.testing.assert_frame_equal(merged, expected)
+
+
+def test_sorted_runs_merge_as_the_in_memory_sort(benchmark_set):
+    expected = list(frame_rows(load_transactions_csv(benchmark_set[1])))
+    with spill_transaction_runs(benchmark_set[1], chunksize=70) as runs:
+        assert len(runs.paths) == 6
+        assert [row for row, _ in runs.merge()] == expected
+
+
+def test_streamed_import_writes_the_same_workbook(benchmark_set, tmp_path):
+    excel_path, transactions_csv, _ = benchmark_set
+    in_memory, streamed = tmp_path / 'memory', tmp_path / 'streamed'
+    for folder in (in_memory, streamed):
+        folder.mkdir()
+        shutil.copy(excel_path, folder)
+    in_memory, streamed = (str(folder / 'II_20250101.xlsx') for folder in (in_memory, streamed))
+
+    import_transactions(transactions_csv, in_memory)
+    import_transactions(transactions_csv, streamed, chunksize=70)
+
+    values = sheet_values(in_memory)
+    assert len(values) == 1 + 300 + 400
+    assert sheet_values(streamed) == values
@@ -0,0 +1,34 @@
+# test_synthetic_data.py
+import pandas as pd
+from II_Constants import TRANSACTIONS_COLUMNS
+from II_Normalize import normalize_transactions
+from II_SyntheticData import SPAN_YEARS, business_days, transaction_records
+
+
+def normalized(records):
+    # n/a and empty cells become missing values, as read_csv's default na_values make them
+    rows = [[None if value in ('n/a', '') else value for value in record[:-1]] for record in records]
+    return normalize_transactions(pd.DataFrame(rows, columns=TRANSACTIONS_COLUMNS, dtype=str))
+
+
+def test_large_sets_have_several_transactions_a_day_within_the_span():
+    df = normalized(transaction_records(20_000))
+    start = pd.Timestamp('2010-01-04')
+    assert df['Date'].notna().all()
+    assert df['Date'].min() == start
+    assert df['Date'].max() < start + pd.DateOffset(years=SPAN_YEARS)
+    assert (df['Date'].dt.dayofweek < 5).all()
+    assert df['Date'].value_counts().min() >= 4
+
+
+def test_dates_of_very_large_sets_stay_in_range():
+    start = pd.Timestamp('2010-01-04')
+    days = business_days(start)
+    total = 50_000_000
+    last = days[(total - 1) * len(days) // total]
+    assert last == days[-1]
+    assert pd.Timestamp(last) < start + pd.DateOffset(years=SPAN_YEARS)
+
+
+def test_a_prefix_of_a_longer_stream_is_the_same_rows():
+    assert list(transaction_records(300, seed=3, total=1_000)) == list(transaction_records(1_000, seed=3))[:300]